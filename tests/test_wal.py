@@ -0,0 +1,63 @@
+"""
+Тесты журнала упреждающей записи
+"""
+import json
+import shutil
+import threading
+
+import pandas as pd
+import pytest
+
+from work.library import library
+
+DATA_PATH = library.os.path.join(library.os.path.dirname(library.__file__),
+                                 '..', 'data', 'data.csv')
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """
+    Копия базы данных в формате csv с журналом, который часто записывает
+    группы и не переносит их в базу сам.
+    """
+    with open(library.CONFIG_PATH, 'r', encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    config['db'].update(backend='csv', csv='./data/data.csv')
+    config['db']['wal'] = {'enabled': True, 'flush_interval': 0.001,
+                           'flush_size': 4, 'checkpoint_size': 10 ** 9}
+    config_path = tmp_path / 'config.json'
+    with open(config_path, 'w', encoding='utf-8') as config_file:
+        json.dump(config, config_file, ensure_ascii=False)
+    (tmp_path / 'data').mkdir()
+    shutil.copy(DATA_PATH, tmp_path / 'data' / 'data.csv')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(library, 'CONFIG_PATH', str(config_path))
+    monkeypatch.setitem(library._config_cache, 'mtime', None)
+    monkeypatch.setattr(library, '_wal', None)
+    yield tmp_path / 'data' / 'data.csv'
+    library.get_wal().close()
+
+
+def test_checkpoint_keeps_rows_submitted_meanwhile(storage):
+    stored = pd.read_csv(storage, encoding='utf-8')
+    record = stored.iloc[0].to_dict()
+    first_id = int(stored['id'].max()) + 1
+    count = 1000
+    wal = library.get_wal()
+    futures = []
+
+    def submit():
+        for number in range(count):
+            futures.append(wal.submit(dict(record, id=first_id + number)))
+
+    writer = threading.Thread(target=submit)
+    writer.start()
+    while writer.is_alive() or not all(future.done() for future in futures):
+        library.checkpoint()
+    writer.join()
+    library.checkpoint()
+
+    assert wal.read() == []
+    ids = pd.read_csv(storage, encoding='utf-8')['id']
+    assert sorted(ids[ids >= first_id]) == list(range(first_id,
+                                                      first_id + count))
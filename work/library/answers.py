@@ -0,0 +1,198 @@
+"""
+Архив ответов на вопросы теста для приложения "Политические координаты"
+
+Кроме итоговых координат, для каждого респондента сохраняются его ответы
+на вопросы: по одному коду варианта ответа (int8) на вопрос, -1 для
+пропущенного ответа (см. модуль scoring). Это позволяет пересчитать
+координаты, если изменятся оси вопросов или баллы вариантов ответов.
+
+Коды имеют смысл только вместе со списком вопросов и вариантов ответов,
+для которых они записаны (банком вопросов). Поэтому ответы каждого банка
+хранятся в каталоге архива в отдельном двоичном файле <банк>.bin с
+записями фиксированной длины (id и коды ответов), а тексты вопросов и
+вариантов ответов - в файле <банк>.json. Имя банка вычисляется по текстам
+вопросов и вариантов ответов, поэтому изменение осей или баллов не создаёт
+новый банк, а добавление или изменение текста вопроса - создаёт.
+
+bank_id(questions, options): Возвращает имя банка вопросов.
+
+append_answers(path, questions, options, ids, codes): Дописывает ответы
+респондентов в архив.
+
+iter_answers(path, chunksize): Читает архив частями по chunksize
+респондентов.
+
+renumber_answers(path, old_ids, new_ids, chunksize): Заменяет id
+респондентов в архиве.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def bank_id(questions, options):
+    """
+    Возвращает имя банка вопросов.
+
+    Аргументы:
+        questions (list): Вопросы в формате config["questions"].
+        options (dict): Баллы по вариантам ответов в формате
+        config["options"].
+
+    Возвращает:
+        str: Первые 12 символов SHA-1 от текстов вопросов и вариантов
+        ответов.
+    """
+    texts = [[question["question"] for question in questions], list(options)]
+    digest = hashlib.sha1(json.dumps(texts, ensure_ascii=False).encode(
+        'utf-8')).hexdigest()
+    return digest[:12]
+
+
+def _record_dtype(size):
+    """
+    Возвращает тип записи архива для банка из size вопросов.
+    """
+    return np.dtype([('id', '<i4'), ('codes', 'i1', (size,))])
+
+
+def _write_meta(path, meta):
+    """
+    Атомарно записывает описание банка вопросов.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as meta_file:
+        json.dump(meta, meta_file, ensure_ascii=False, indent=4)
+        meta_file.flush()
+        os.fsync(meta_file.fileno())
+    os.replace(tmp_path, path)
+
+
+def append_answers(path, questions, options, ids, codes):
+    """
+    Дописывает ответы респондентов в архив.
+
+    Запись завершается вызовом fsync. Байты недописанной при сбое
+    последней записи перед дозаписью отрезаются.
+
+    Аргументы:
+        path (str): Путь к каталогу архива.
+        questions (list): Вопросы в формате config["questions"], в порядке
+        которых записаны коды.
+        options (dict): Баллы по вариантам ответов в формате
+        config["options"], номера которых используются как коды.
+        ids (list): Id респондентов.
+        codes (np.ndarray): Коды ответов размером (len(ids),
+        количество вопросов).
+    """
+    codes = np.asarray(codes, dtype='int8').reshape(len(ids), len(questions))
+    os.makedirs(path, exist_ok=True)
+    name = bank_id(questions, options)
+    meta_path = os.path.join(path, name + '.json')
+    if not os.path.exists(meta_path):
+        _write_meta(meta_path, {
+            'questions': [question["question"] for question in questions],
+            'options': list(options)
+        })
+
+    records = np.empty(len(ids), dtype=_record_dtype(len(questions)))
+    records['id'] = ids
+    records['codes'] = codes
+    with open(os.path.join(path, name + '.bin'), 'ab') as bin_file:
+        end = bin_file.seek(0, os.SEEK_END)
+        bin_file.truncate(end - end % records.dtype.itemsize)
+        bin_file.write(records.tobytes())
+        bin_file.flush()
+        os.fsync(bin_file.fileno())
+
+
+def iter_answers(path, chunksize):
+    """
+    Читает архив частями по chunksize респондентов.
+
+    Файлы банков отображаются в память, поэтому одновременно в памяти
+    находится только одна часть.
+
+    Аргументы:
+        path (str): Путь к каталогу архива.
+        chunksize (int): Количество респондентов в части.
+
+    Возвращает:
+        generator: Тройки (описание банка (dict) с ключами 'questions' и
+        'options', id респондентов (np.ndarray), коды ответов
+        (np.ndarray)).
+    """
+    if not os.path.isdir(path):
+        return
+    for file_name in sorted(os.listdir(path)):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(path, file_name), 'r',
+                  encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        bin_path = os.path.join(path, file_name[:-len('.json')] + '.bin')
+        if not os.path.exists(bin_path):
+            continue
+        dtype = _record_dtype(len(meta['questions']))
+        # недописанная при сбое последняя запись не читается
+        rows = os.path.getsize(bin_path) // dtype.itemsize
+        if not rows:
+            continue
+        records = np.memmap(bin_path, dtype=dtype, mode='r', shape=(rows,))
+        for start in range(0, rows, chunksize):
+            chunk = np.array(records[start:start + chunksize])
+            yield meta, chunk['id'], chunk['codes']
+
+
+def renumber_answers(path, old_ids, new_ids, chunksize=100000):
+    """
+    Заменяет id респондентов в архиве.
+
+    Файл каждого банка переписывается частями во временный файл, который
+    затем атомарно подменяет прежний. Ответы респондентов, id которых нет
+    в old_ids (например, удалённых), из архива убираются, чтобы их id не
+    совпали с новыми id других респондентов.
+
+    Аргументы:
+        path (str): Путь к каталогу архива.
+        old_ids (np.ndarray): Прежние id респондентов.
+        new_ids (np.ndarray): Новые id в том же порядке.
+        chunksize (int): Количество записей, обрабатываемых за один раз.
+    """
+    if not os.path.isdir(path):
+        return
+    old_ids = np.asarray(old_ids, dtype='int64')
+    order = np.argsort(old_ids)
+    old_sorted = old_ids[order]
+    new_sorted = np.asarray(new_ids, dtype='int64')[order]
+    for file_name in sorted(os.listdir(path)):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(path, file_name), 'r',
+                  encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        bin_path = os.path.join(path, file_name[:-len('.json')] + '.bin')
+        if not os.path.exists(bin_path):
+            continue
+        dtype = _record_dtype(len(meta['questions']))
+        rows = os.path.getsize(bin_path) // dtype.itemsize
+        tmp_path = bin_path + '.tmp'
+        with open(tmp_path, 'wb') as tmp_file:
+            if rows:
+                records = np.memmap(bin_path, dtype=dtype, mode='r',
+                                    shape=(rows,))
+                for start in range(0, rows, chunksize):
+                    chunk = np.array(records[start:start + chunksize])
+                    positions = np.searchsorted(old_sorted, chunk['id'])
+                    found = positions < len(old_sorted)
+                    found[found] = old_sorted[positions[found]] == \
+                        chunk['id'][found]
+                    chunk = chunk[found]
+                    chunk['id'] = new_sorted[positions[found]]
+                    tmp_file.write(chunk.tobytes())
+                del records
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, bin_path)
@@ -0,0 +1,138 @@
+"""
+Связь качественных атрибутов для приложения "Политические координаты"
+
+Для каждой пары качественных столбцов строится таблица сопряжённости и
+вычисляются статистика хи-квадрат и коэффициент V Крамера. Значения
+столбцов заменяются целыми кодами категорий, поэтому таблица
+сопряжённости пары строится одним вызовом np.bincount по кодам
+a * (число категорий b) + b, без группировки строк.
+
+contingency_table(first, second, first_size, second_size): Строит таблицу
+сопряжённости по кодам двух столбцов.
+
+chi_square(table): Вычисляет статистику хи-квадрат, число степеней
+свободы и V Крамера для таблицы сопряжённости.
+
+association_table(df, columns): Вычисляет статистики связи для всех пар
+столбцов.
+
+association_matrix(table, columns, statistic): Собирает статистики связи
+пар в квадратную матрицу.
+"""
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+
+def _codes(values):
+    """
+    Возвращает целые коды значений столбца и количество категорий.
+
+    Аргументы:
+        values (pd.Series): Значения качественного столбца.
+
+    Возвращает:
+        tuple: Коды (np.ndarray, -1 для пропусков) и количество категорий.
+    """
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype('category')
+    return values.cat.codes.to_numpy(dtype='int64'), \
+        len(values.cat.categories)
+
+
+def contingency_table(first, second, first_size, second_size):
+    """
+    Строит таблицу сопряжённости по кодам двух столбцов.
+
+    Аргументы:
+        first (np.ndarray): Коды первого столбца.
+        second (np.ndarray): Коды второго столбца.
+        first_size (int): Количество категорий первого столбца.
+        second_size (int): Количество категорий второго столбца.
+
+    Возвращает:
+        np.ndarray: Количества строк размером (first_size, second_size).
+        Строки с пропуском в одном из столбцов не учитываются.
+    """
+    present = (first >= 0) & (second >= 0)
+    return np.bincount(first[present] * second_size + second[present],
+                       minlength=first_size * second_size) \
+        .reshape(first_size, second_size)
+
+
+def chi_square(table):
+    """
+    Вычисляет статистику хи-квадрат, число степеней свободы и V Крамера
+    для таблицы сопряжённости.
+
+    Категории, которые не встречаются в таблице, не учитываются.
+
+    Аргументы:
+        table (np.ndarray): Таблица сопряжённости.
+
+    Возвращает:
+        tuple: Статистика хи-квадрат, число степеней свободы, V Крамера и
+        количество строк. Для таблицы, в которой у одного из столбцов
+        меньше двух категорий, V Крамера равен NaN.
+    """
+    table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+    total = table.sum()
+    rows, columns = table.shape
+    if total == 0 or min(rows, columns) < 2:
+        return 0.0, 0, np.nan, int(total)
+    expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / total
+    statistic = float(((table - expected) ** 2 / expected).sum())
+    cramers_v = np.sqrt(statistic / (total * (min(rows, columns) - 1)))
+    return statistic, (rows - 1) * (columns - 1), float(cramers_v), \
+        int(total)
+
+
+def association_table(df, columns):
+    """
+    Вычисляет статистики связи для всех пар столбцов.
+
+    Аргументы:
+        df (pd.DataFrame): Содержимое базы данных.
+        columns (list): Имена качественных столбцов.
+
+    Возвращает:
+        pd.DataFrame: По строке на пару столбцов со столбцами 'Атрибут 1',
+        'Атрибут 2', 'Хи-квадрат', 'Степени свободы', 'V Крамера' и
+        'Количество'.
+    """
+    codes = {name: _codes(df[name]) for name in columns}
+    rows = []
+    for first, second in combinations(columns, 2):
+        table = contingency_table(codes[first][0], codes[second][0],
+                                  codes[first][1], codes[second][1])
+        rows.append([first, second, *chi_square(table)])
+    return pd.DataFrame(rows, columns=['Атрибут 1', 'Атрибут 2',
+                                       'Хи-квадрат', 'Степени свободы',
+                                       'V Крамера', 'Количество'])
+
+
+def association_matrix(table, columns, statistic='V Крамера'):
+    """
+    Собирает статистики связи пар в квадратную матрицу.
+
+    Аргументы:
+        table (pd.DataFrame): Результат association_table.
+        columns (list): Имена качественных столбцов.
+        statistic (str): Столбец table, из которого берутся значения.
+
+    Возвращает:
+        pd.DataFrame: Симметричная матрица с индексом и столбцами columns.
+        На диагонали для V Крамера стоит 1, для других статистик - NaN.
+    """
+    matrix = pd.DataFrame(np.nan, index=pd.Index(columns),
+                          columns=pd.Index(columns))
+    for row in table.itertuples(index=False):
+        first, second, value = row[0], row[1], \
+            row[table.columns.get_loc(statistic)]
+        matrix.loc[first, second] = value
+        matrix.loc[second, first] = value
+    if statistic == 'V Крамера':
+        for name in columns:
+            matrix.loc[name, name] = 1.0
+    return matrix
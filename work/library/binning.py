@@ -0,0 +1,162 @@
+"""
+Разбиение точек на интервалы для графиков приложения "Политические
+координаты"
+
+Значения качественного атрибута заменяются целыми кодами, после чего
+точки всех значений обрабатываются вместе, за один проход по массивам:
+разбиение по значениям - одной сортировкой по кодам, а подсчёт точек в
+ячейках сетки - одним вызовом np.bincount по номеру
+(код * число ячеек + номер ячейки). Поэтому время не зависит от
+количества значений атрибута, а только от количества точек.
+
+category_codes(values): Заменяет значения качественного атрибута целыми
+кодами.
+
+split_by_code(points, codes, count): Разбивает точки по кодам значений.
+
+density_grid(points, codes, count, bins): Подсчитывает точки каждого
+значения в ячейках общей сетки.
+
+histogram_counts(values, codes, count, bins): Подсчитывает значения
+каждого кода в общих интервалах гистограммы.
+
+blend_density(grid, colors): Растеризует сетку количеств в изображение,
+смешивая цвета значений.
+"""
+import numpy as np
+import pandas as pd
+
+
+def category_codes(values):
+    """
+    Заменяет значения качественного атрибута целыми кодами.
+
+    Коды присваиваются в порядке первого появления значений, как в
+    pd.Series.unique().
+
+    Аргументы:
+        values (pd.Series): Значения качественного атрибута.
+
+    Возвращает:
+        tuple: Коды (np.ndarray, -1 для пропусков) и список значений.
+    """
+    codes, categories = pd.factorize(values)
+    return codes.astype('int64'), list(categories)
+
+
+def split_by_code(points, codes, count):
+    """
+    Разбивает точки по кодам значений.
+
+    Аргументы:
+        points (np.ndarray): Координаты точек размером (N, 2).
+        codes (np.ndarray): Коды значений точек.
+        count (int): Количество значений.
+
+    Возвращает:
+        list: Для каждого кода - координаты его точек (np.ndarray) в
+        исходном порядке. Точки с кодом -1 не учитываются.
+    """
+    present = codes >= 0
+    points, codes = points[present], codes[present]
+    order = np.argsort(codes, kind='stable')
+    sizes = np.bincount(codes, minlength=count)
+    return np.split(points[order], np.cumsum(sizes)[:-1])
+
+
+def density_grid(points, codes, count, bins):
+    """
+    Подсчитывает точки каждого значения в ячейках общей сетки.
+
+    Сетка из bins x bins ячеек накрывает все точки. Точки с пропусками
+    координат или с кодом -1 не учитываются.
+
+    Аргументы:
+        points (np.ndarray): Координаты точек размером (N, 2).
+        codes (np.ndarray): Коды значений точек.
+        count (int): Количество значений.
+        bins (int): Количество ячеек по каждой оси.
+
+    Возвращает:
+        tuple: Количества (np.ndarray размером (count, bins, bins), строки -
+        ячейки по второй координате, столбцы - по первой) и границы сетки
+        (xmin, xmax, ymin, ymax).
+    """
+    present = (codes >= 0) & ~np.isnan(points).any(axis=1)
+    points, codes = points[present], codes[present]
+    if not len(points):
+        return np.zeros((count, bins, bins), dtype='int64'), (0, 1, 0, 1)
+    low, high = points.min(axis=0), points.max(axis=0)
+    # сетка не должна вырождаться, если все точки на одной прямой
+    high = np.where(high > low, high, low + 1)
+    cells = ((points - low) / (high - low) * bins).astype('int64')
+    np.clip(cells, 0, bins - 1, out=cells)
+    grid = np.bincount((codes * bins + cells[:, 1]) * bins + cells[:, 0],
+                       minlength=count * bins * bins)
+    return grid.reshape(count, bins, bins), \
+        (low[0], high[0], low[1], high[1])
+
+
+def histogram_counts(values, codes, count, bins):
+    """
+    Подсчитывает значения каждого кода в общих интервалах гистограммы.
+
+    Интервалы - bins равных отрезков между минимумом и максимумом всех
+    значений, общие для всех кодов; значение относится к интервалу так
+    же, как в np.histogram (последний интервал включает правую границу).
+    Значения с пропусками или с кодом -1 не учитываются.
+
+    Аргументы:
+        values (np.ndarray): Значения количественного атрибута.
+        codes (np.ndarray): Коды значений качественного атрибута.
+        count (int): Количество значений качественного атрибута.
+        bins (int): Количество интервалов.
+
+    Возвращает:
+        tuple: Количества (np.ndarray размером (count, bins)) и границы
+        интервалов (np.ndarray длины bins + 1).
+    """
+    present = (codes >= 0) & ~np.isnan(values)
+    values, codes = values[present], codes[present]
+    if not len(values):
+        return np.zeros((count, bins), dtype='int64'), \
+            np.linspace(0, 1, bins + 1)
+    low, high = values.min(), values.max()
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    edges = np.linspace(low, high, bins + 1)
+    cells = ((values - low) * (bins / (high - low))).astype('int64')
+    cells[cells == bins] -= 1
+    # поправки на ошибки округления у границ интервалов, как в np.histogram
+    cells[values < edges[cells]] -= 1
+    cells[(values >= edges[cells + 1]) & (cells != bins - 1)] += 1
+    counts = np.bincount(codes * bins + cells, minlength=count * bins)
+    return counts.reshape(count, bins), edges
+
+
+def blend_density(grid, colors):
+    """
+    Растеризует сетку количеств в изображение, смешивая цвета значений.
+
+    Цвет ячейки - среднее цветов значений, взвешенное по количествам их
+    точек в ячейке, а непрозрачность растёт с логарифмом общего количества
+    точек в ячейке, поэтому ячейки с одной точкой видны и на плотных
+    графиках. Пустые ячейки прозрачны.
+
+    Аргументы:
+        grid (np.ndarray): Результат density_grid.
+        colors (np.ndarray): Цвета значений RGBA размером (count, 4).
+
+    Возвращает:
+        np.ndarray: Изображение RGBA размером (bins, bins, 4).
+    """
+    total = grid.sum(axis=0)
+    image = np.zeros(total.shape + (4,))
+    filled = total > 0
+    image[..., :3] = np.tensordot(grid, colors[:, :3], axes=(0, 0))
+    image[filled, :3] /= total[filled, None]
+    if filled.any():
+        image[filled, 3] = 0.2 + 0.8 * np.log1p(total[filled]) / \
+            np.log1p(total.max())
+    # ошибки округления не должны выводить цвет за пределы [0, 1]
+    return np.clip(image, 0, 1, out=image)
@@ -0,0 +1,208 @@
+"""
+Бутстреп-интервалы для сводных таблиц приложения "Политические
+координаты"
+
+Для каждой ячейки сводной таблицы строится доверительный интервал
+процентильным бутстрепом: из базы многократно извлекаются выборки того же
+размера с возвращением, и по каждой вычисляется значение ячейки.
+Интервалом служат квантили полученных значений.
+
+Выборки не строятся явно. В выборке с возвращением из N строк число строк
+ячейки распределено биномиально (N, n / N), где n - число строк ячейки, а
+при заданном их числе количества повторов каждого из различных значений
+ячейки распределены мультиномиально. Поэтому для каждой ячейки сразу для
+всех повторений генерируется матрица количеств (повторения x различные
+значения), и значения функций агрегации вычисляются по ней матричными
+операциями. Результат совпадает с бутстрепом по строкам всей базы, а
+объём вычислений зависит от числа различных значений в ячейке, а не от
+числа строк: координаты респондентов принимают немного различных
+значений.
+
+Ячейки с большим объёмом вычислений распределяются по пулу процессов.
+Процессы запускаются способом "spawn", а не копированием (fork) процесса,
+у которого работают потоки интерфейса.
+
+pivot_bootstrap(df, values, column, index, aggfunc, settings): Создает
+сводную таблицу с границами бутстреп-интервалов для каждой ячейки.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# параметры по умолчанию, см. config["bootstrap"]
+DEFAULT_SETTINGS = {
+    'resamples': 2000,
+    'confidence': 0.95,
+    'seed': 0,
+    'workers': None
+}
+
+# функции агрегации, для которых вычисляются интервалы
+BOOTSTRAP_AGGREGATES = ('count', 'sum', 'mean', 'std', 'median', 'min',
+                        'max')
+
+# наибольшее количество элементов матрицы количеств в одном блоке
+_BLOCK_ELEMENTS = 10 ** 7
+
+# объём вычислений (повторения x различные значения), начиная с которого
+# ячейки вычисляются в пуле процессов
+_PARALLEL_WORK = 5 * 10 ** 7
+
+
+def _settings(settings):
+    """
+    Дополняет параметры значениями по умолчанию.
+    """
+    return {**DEFAULT_SETTINGS, **(settings or {})}
+
+
+def _first_above(cumulative, ranks):
+    """
+    Возвращает для каждой строки номер первого столбца, в котором
+    накопленное количество больше ranks.
+    """
+    return (cumulative > ranks[:, None]).argmax(axis=1)
+
+
+def _statistics(values, counts, sizes, aggfunc):
+    """
+    Вычисляет функцию агрегации по матрице количеств.
+
+    Аргументы:
+        values (np.ndarray): Различные значения ячейки по возрастанию.
+        counts (np.ndarray): Количества повторов значений в выборках
+        размером (повторения, различные значения).
+        sizes (np.ndarray): Размеры выборок.
+        aggfunc (str): Функция агрегации.
+
+    Возвращает:
+        np.ndarray: Значения функции по выборкам (NaN для пустых выборок).
+    """
+    sizes = sizes.astype('float64')
+    empty = sizes == 0
+    if aggfunc == 'count':
+        return sizes
+    total = counts @ values
+    if aggfunc == 'sum':
+        return total
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / sizes
+        if aggfunc == 'mean':
+            result = mean
+        elif aggfunc == 'std':
+            result = np.sqrt(np.maximum(
+                counts @ values ** 2 - sizes * mean ** 2, 0) / (sizes - 1))
+            result[sizes < 2] = np.nan
+        elif aggfunc == 'min':
+            result = values[(counts > 0).argmax(axis=1)]
+        elif aggfunc == 'max':
+            result = values[-1 - (counts[:, ::-1] > 0).argmax(axis=1)]
+        else:
+            # медиана - среднее элементов с номерами (n - 1) // 2 и n // 2
+            cumulative = counts.cumsum(axis=1)
+            lower = _first_above(cumulative, (sizes - 1) // 2)
+            upper = _first_above(cumulative, sizes // 2)
+            result = (values[lower] + values[upper]) / 2
+    result = np.asarray(result, dtype='float64')
+    result[empty] = np.nan
+    return result
+
+
+def _cell_interval(task):
+    """
+    Вычисляет бутстреп-интервал для одной ячейки.
+
+    Аргументы:
+        task (tuple): Различные значения ячейки, количества их повторов,
+        размер базы, функция агрегации, параметры и SeedSequence ячейки.
+
+    Возвращает:
+        tuple: Нижняя и верхняя границы интервала.
+    """
+    values, repeats, total, aggfunc, settings, seed = task
+    rng = np.random.default_rng(seed)
+    size = repeats.sum()
+    probabilities = repeats / size
+    resamples = settings['resamples']
+    block = max(1, _BLOCK_ELEMENTS // len(values))
+    statistics = []
+    for start in range(0, resamples, block):
+        sizes = rng.binomial(total, size / total, min(block,
+                                                      resamples - start))
+        counts = rng.multinomial(sizes, probabilities)
+        statistics.append(_statistics(values, counts, sizes, aggfunc))
+    statistics = np.concatenate(statistics)
+    if np.isnan(statistics).all():
+        return np.nan, np.nan
+    tail = (1 - settings['confidence']) / 2
+    low, high = np.nanquantile(statistics, [tail, 1 - tail])
+    return low, high
+
+
+def pivot_bootstrap(df, values, column, index, aggfunc, settings=None):
+    """
+    Создает сводную таблицу с границами бутстреп-интервалов для каждой
+    ячейки.
+
+    Значения ячеек вычисляются по всей df, а интервалы - по
+    settings['resamples'] бутстреп-выборкам с уровнем
+    settings['confidence']. Каждая ячейка получает свою
+    последовательность случайных чисел из settings['seed'], поэтому
+    результат не зависит от количества процессов.
+
+    Аргументы:
+        df (pd.DataFrame): Содержимое базы данных.
+        values (str): Количественный столбец.
+        column (str): Столбец, значения которого становятся столбцами
+        сводной таблицы.
+        index (str): Столбец, значения которого становятся строками
+        сводной таблицы.
+        aggfunc (str): Функция агрегации (одна из BOOTSTRAP_AGGREGATES).
+        settings (dict): Параметры (см. DEFAULT_SETTINGS).
+
+    Возвращает:
+        tuple: Сводная таблица, нижние и верхние границы интервалов
+        (pd.DataFrame той же формы).
+    """
+    if aggfunc not in BOOTSTRAP_AGGREGATES:
+        raise ValueError(f"Бутстреп не поддерживает функцию агрегации: "
+                         f"{aggfunc}")
+    settings = _settings(settings)
+    measure = df[values].astype('float64')
+    table = measure.groupby([df[index], df[column]], observed=True) \
+        .agg(aggfunc)
+    total = len(df)
+
+    # различные значения ячеек и количества их повторов
+    present = measure.notna()
+    frequencies = measure[present].groupby(
+        [df[index][present], df[column][present], measure[present]],
+        observed=True).size()
+    seeds = np.random.SeedSequence(settings['seed']).spawn(len(table))
+    positions = []
+    tasks = []
+    for cell, part in frequencies.groupby(level=[0, 1], observed=True):
+        position = table.index.get_loc(cell)
+        positions.append(position)
+        tasks.append((part.index.get_level_values(2).to_numpy(
+            dtype='float64'), part.to_numpy(dtype='float64'), total,
+            aggfunc, settings, seeds[position]))
+
+    work = sum(len(task[0]) for task in tasks) * settings['resamples']
+    if work >= _PARALLEL_WORK and settings['workers'] != 1:
+        with ProcessPoolExecutor(
+                max_workers=settings['workers'],
+                mp_context=multiprocessing.get_context('spawn')) as pool:
+            intervals = list(pool.map(_cell_interval, tasks,
+                                      chunksize=max(1, len(tasks) // 64)))
+    else:
+        intervals = [_cell_interval(task) for task in tasks]
+
+    low = pd.Series(np.nan, index=table.index)
+    high = pd.Series(np.nan, index=table.index)
+    if intervals:
+        low.iloc[positions] = [interval[0] for interval in intervals]
+        high.iloc[positions] = [interval[1] for interval in intervals]
+    return table.unstack(column), low.unstack(column), high.unstack(column)
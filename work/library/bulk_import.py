@@ -0,0 +1,298 @@
+"""
+Массовый импорт ответов для приложения "Политические координаты"
+
+Модуль объединяет с базой данных csv-файлы с ответами, собранными на
+автономных терминалах. Файлы должны иметь тот же формат, что и data.csv.
+Файлы разбираются параллельно в пуле процессов, строки проверяются по схеме
+базы, повторы удаляются, записям присваиваются новые id, и результат
+дописывается в базу за один проход.
+
+Строка файла определяется своим источником - именем файла и id, который
+присвоил ей терминал; ответы при этом не сравниваются, так как разные
+респонденты могут ответить одинаково. Хэши источников импортированных
+строк сохраняются в файле рядом с базой (с расширением .imported),
+поэтому строки, уже импортированные ранее, например при повторной
+выгрузке того же файла, не добавляются второй раз.
+
+Перед записью в базу добавляемые строки с хэшами источников сохраняются в
+файле с расширением .imported.pending. Если импорт прервался между
+записью в базу и записью хэшей, при следующем импорте хэши строк, которые
+успели попасть в базу, переносятся из этого файла в список
+импортированных.
+
+Запуск из каталога work:
+    python -m library.bulk_import terminal1.csv terminal2.csv --workers 4
+
+bulk_import(paths, workers, progress): Импортирует csv-файлы в базу данных.
+
+Функция ничего не печатает; ход и итог импорта печатаются только при
+запуске модуля из командной строки.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..'))
+
+from work.library.library import CATEGORICAL_COLUMNS, NUMERIC_DTYPES, \
+    append_new_rows, apply_schema, iter_chunks, read_config, \
+    read_tombstones
+
+COLUMNS = ['id', 'gender', 'field', 'university', 'course', 'x', 'y', 'z']
+
+
+def _parse_file(path, domains):
+    """
+    Читает и проверяет один файл с ответами. Выполняется в дочернем
+    процессе.
+
+    Строка отбрасывается, если в ней нет значения какого-либо столбца,
+    если x, y или z не являются конечными числами или если значение
+    качественного столбца не входит в список допустимых значений.
+
+    Аргументы:
+        path (str): Путь к csv-файлу.
+        domains (dict): Допустимые значения качественных столбцов.
+
+    Возвращает:
+        tuple: Путь к файлу, DataFrame с правильными строками и количество
+        отброшенных строк. В столбце 'source' DataFrame - хэши источников
+        строк (см. _source_hashes).
+    """
+    df = pd.read_csv(path, encoding='utf-8', dtype=str)
+    missing = [column for column in COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"В файле {path} нет столбцов: {', '.join(missing)}")
+    df = df[COLUMNS]
+    valid = df.notna().all(axis=1).to_numpy(copy=True)
+    for column in ['id', 'x', 'y', 'z']:
+        values = pd.to_numeric(df[column], errors='coerce')
+        valid &= np.isfinite(values.to_numpy(dtype='float64'))
+        df[column] = values
+    for column, values in domains.items():
+        valid &= df[column].isin(values).to_numpy()
+    df = df[valid].copy()
+    df['source'] = _source_hashes(path, df['id'])
+    return path, df, int((~valid).sum())
+
+
+def _ledger_path(config):
+    """
+    Возвращает путь к файлу с хэшами импортированных строк.
+    """
+    return config["db"][config["db"].get("backend", "csv")] + '.imported'
+
+
+def _pending_path(config):
+    """
+    Возвращает путь к файлу строк, записываемых в базу.
+    """
+    return _ledger_path(config) + '.pending'
+
+
+def _source_hashes(path, ids):
+    """
+    Вычисляет хэши источников строк - имени файла и id, присвоенного
+    терминалом.
+
+    Учитывается только имя файла без каталога, поэтому повторная выгрузка
+    того же файла в другой каталог распознаётся. Хэши не зависят от того,
+    как id записан в файле (например, 5 и 5.0).
+
+    Аргументы:
+        path (str): Путь к csv-файлу.
+        ids (pd.Series): Id строк, присвоенные терминалом.
+
+    Возвращает:
+        np.ndarray: Хэши источников (uint64).
+    """
+    sources = pd.DataFrame({'file': os.path.basename(path),
+                            'id': ids.astype('float64').to_numpy()})
+    return pd.util.hash_pandas_object(sources, index=False).to_numpy()
+
+
+def _row_hashes(df):
+    """
+    Вычисляет хэши строк базы по значениям всех столбцов, включая id.
+
+    Числа сначала приводятся к типам схемы, поэтому строки, прочитанные из
+    csv-файла, и те же строки из базы дают одинаковые хэши.
+
+    Аргументы:
+        df (pd.DataFrame): Строки со столбцами COLUMNS.
+
+    Возвращает:
+        np.ndarray: Хэши строк (uint64).
+    """
+    normalized = df[COLUMNS].astype(NUMERIC_DTYPES).astype(
+        {column: 'float64' if column in NUMERIC_DTYPES else str
+         for column in COLUMNS})
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+
+def _read_ledger(path):
+    """
+    Читает хэши импортированных ранее строк.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as ledger_file:
+        # недописанная при сбое последняя строка пропускается
+        return {int(line) for line in ledger_file
+                if line.endswith('\n') and line.strip().isdigit()}
+
+
+def _append_ledger(path, hashes):
+    """
+    Дописывает хэши импортированных строк.
+    """
+    with open(path, 'a', encoding='utf-8') as ledger_file:
+        ledger_file.writelines(f"{int(value)}\n" for value in hashes)
+        ledger_file.flush()
+        os.fsync(ledger_file.fileno())
+
+
+def _write_pending(path, rows, sources):
+    """
+    Сохраняет строки, которые сейчас будут записаны в базу, вместе с
+    хэшами их источников.
+
+    Файл записывается во временный файл и атомарно подменяется.
+    """
+    pending = rows[COLUMNS].copy()
+    pending.insert(0, 'source', [str(int(value)) for value in sources])
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as pending_file:
+        pending.to_csv(pending_file, index=False)
+        pending_file.flush()
+        os.fsync(pending_file.fileno())
+    os.replace(tmp_path, path)
+
+
+def _recover_pending(config):
+    """
+    Завершает импорт, прерванный между записью строк в базу и записью
+    хэшей их источников.
+
+    Строка считается записанной, если в базе есть строка с теми же
+    значениями всех столбцов или её id помечен удалённым. Хэши источников
+    записанных строк дописываются в список импортированных, остальные
+    строки будут импортированы заново.
+
+    Аргументы:
+        config (dict): Содержимое конфигурационного файла.
+    """
+    path = _pending_path(config)
+    if not os.path.exists(path):
+        return
+    pending = pd.read_csv(path, encoding='utf-8', dtype={'source': str})
+    hashes = _row_hashes(pending)
+    stored = pending['id'].isin(read_tombstones()).to_numpy(copy=True)
+    for chunk in iter_chunks():
+        stored |= np.isin(hashes, _row_hashes(chunk))
+    _append_ledger(_ledger_path(config),
+                   [int(value) for value in pending['source'][stored]])
+    os.remove(path)
+
+
+def bulk_import(paths, workers=None, progress=None):
+    """
+    Импортирует csv-файлы с ответами в базу данных.
+
+    Файлы разбираются и проверяются параллельно в пуле из workers
+    процессов. Строки с одним источником (файлом с тем же именем и id,
+    присвоенным терминалом) считаются повторами одного ответа, например
+    при повторной выгрузке того же файла, и сохраняются один раз - как
+    внутри импортируемых файлов, так и по сравнению с прежними импортами
+    (см. описание модуля). Записи, добавленные в базу иначе (через тест),
+    с импортируемыми строками не сравниваются. Оставшимся
+    строкам присваиваются id, следующие за наибольшим id в базе и в
+    журнале упреждающей записи, после чего они дописываются в базу одной
+    операцией (см. append_new_rows).
+
+    Аргументы:
+        paths (list): Пути к csv-файлам.
+        workers (int): Количество процессов. По умолчанию - по числу ядер.
+        progress (function): Функция, которая вызывается после разбора
+        каждого файла с аргументами (разобрано файлов, всего файлов,
+        прочитано строк, строк в секунду).
+
+    Возвращает:
+        tuple: Добавленные в базу строки (pd.DataFrame) и статистика
+        импорта (dict с ключами 'rows' - прочитано строк, 'rejected' -
+        отброшено, 'duplicates' - повторов в файлах, 'imported' - строк,
+        импортированных ранее, 'added' - добавлено, 'seconds' - время).
+    """
+    start = time.perf_counter()
+    stats = {'rows': 0, 'rejected': 0, 'duplicates': 0, 'imported': 0,
+             'added': 0, 'seconds': 0.0}
+    if not paths:
+        return pd.DataFrame(columns=COLUMNS), stats
+
+    config = read_config()
+    _recover_pending(config)
+    domains = {column: config[key]
+               for column, key in CATEGORICAL_COLUMNS.items()}
+    parts = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_parse_file, path, domains) for path in paths]
+        for done, future in enumerate(as_completed(futures), 1):
+            path, part, part_rejected = future.result()
+            parts[path] = part
+            stats['rows'] += len(part) + part_rejected
+            stats['rejected'] += part_rejected
+            if progress is not None:
+                progress(done, len(paths), stats['rows'],
+                         stats['rows'] / max(time.perf_counter() - start,
+                                             1e-9))
+
+    # порядок файлов не зависит от того, какой процесс закончил раньше
+    merged = pd.concat([parts[path] for path in paths], ignore_index=True)
+    hashes = merged.pop('source').to_numpy(dtype='uint64')
+    unique = ~pd.Series(hashes).duplicated().to_numpy()
+    stats['duplicates'] = int((~unique).sum())
+    ledger = _ledger_path(config)
+    new = unique & ~np.isin(hashes, np.fromiter(
+        _read_ledger(ledger), dtype='uint64'))
+    stats['imported'] = int((unique & ~new).sum())
+    merged = merged[new].reset_index(drop=True)
+
+    pending = _pending_path(config)
+    merged = append_new_rows(
+        apply_schema(merged.astype(
+            {column: dtype for column, dtype in NUMERIC_DTYPES.items()})),
+        lambda rows: _write_pending(pending, rows, hashes[new]))
+    if len(merged):
+        _append_ledger(ledger, hashes[new])
+        os.remove(pending)
+
+    stats['added'] = len(merged)
+    stats['seconds'] = time.perf_counter() - start
+    return merged, stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Массовый импорт csv-файлов с ответами в базу данных")
+    parser.add_argument('paths', nargs='+', help="csv-файлы с ответами")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="количество процессов")
+    arguments = parser.parse_args()
+
+    def print_progress(done, total, rows, speed):
+        print(f"Разобрано файлов: {done}/{total}, строк: {rows} "
+              f"({speed:.0f} строк/с)")
+
+    _, stats = bulk_import(arguments.paths, arguments.workers,
+                           print_progress)
+    print(f"Импорт завершён: прочитано строк {stats['rows']}, отброшено "
+          f"{stats['rejected']}, повторов {stats['duplicates']}, "
+          f"импортировано ранее {stats['imported']}, добавлено "
+          f"{stats['added']} за {stats['seconds']:.2f} с "
+          f"({stats['rows'] / max(stats['seconds'], 1e-9):.0f} строк/с)")
@@ -0,0 +1,128 @@
+"""
+Кэш результатов для приложения "Политические координаты"
+
+Сводные таблицы и текстовые отчёты по одной и той же версии базы данных
+не пересчитываются, а берутся из кэша. Ключ кэша состоит из номера версии
+базы и аргументов вызова, поэтому после любого изменения базы старые
+результаты больше не находятся и постепенно вытесняются.
+
+ResultCache - Класс кэша результатов с вытеснением давно не
+использованных записей (LRU) и ограничением занимаемой памяти.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def _size_of(value):
+    """
+    Оценивает объём памяти, занимаемый результатом, в байтах.
+
+    Аргументы:
+        value: Результат вычисления (обычно pd.DataFrame или pd.Series).
+
+    Возвращает:
+        int: Объём памяти в байтах.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    Класс кэша результатов.
+
+    Записи хранятся в порядке последнего обращения. Когда количество
+    записей превышает max_entries или их общий объём превышает max_bytes,
+    вытесняются записи, к которым дольше всего не обращались. Результат,
+    который сам по себе больше max_bytes, не кэшируется.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024):
+        """
+        Аргументы:
+            max_entries (int): Наибольшее количество записей.
+            max_bytes (int): Наибольший общий объём записей в байтах.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Возвращает результат по ключу.
+
+        Аргументы:
+            key (tuple): Ключ записи.
+
+        Возвращает:
+            tuple: (True, результат), если запись есть в кэше, иначе
+            (False, None).
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, self._entries[key][0]
+
+    def put(self, key, value):
+        """
+        Сохраняет результат в кэше.
+
+        Аргументы:
+            key (tuple): Ключ записи.
+            value: Результат вычисления.
+        """
+        size = _size_of(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or \
+                    self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Удаляет все записи из кэша. Статистика обращений сохраняется.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Возвращает статистику работы кэша.
+
+        Возвращает:
+            dict: Количество попаданий ('hits'), промахов ('misses') и
+            вытеснений ('evictions'), доля попаданий ('hit_rate'),
+            количество записей ('entries') и их объём в байтах ('bytes').
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes
+            }
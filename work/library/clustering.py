@@ -0,0 +1,314 @@
+"""
+Кластеризация политических координат для приложения "Политические
+координаты"
+
+Респонденты разбиваются на k групп по координатам (x, y, z) методом
+k-средних на мини-выборках: центры кластеров выбираются методом
+k-means++ и затем уточняются по небольшим случайным выборкам точек, а не
+по всей базе на каждом шаге. Расстояния от точек до центров вычисляются
+матричными операциями сразу для всей выборки.
+
+Координаты записываются по частям в двоичный файл (write_points), который
+затем отображается в память. Мини-выборки читаются из отображённого файла,
+а итоговое отнесение точек к кластерам выполняется по частям из chunksize
+точек, поэтому ни массив всех точек, ни матрица расстояний до центров для
+всей базы в памяти не строятся. Номера кластеров всех точек тоже не
+хранятся: cluster_points возвращает центры и размеры кластеров, а номера
+кластеров вызывающий получает по частям функцией assign.
+
+Метод зависит от начальных центров, поэтому выполняется несколько
+независимых запусков (в пуле процессов), и выбирается запуск с наименьшей
+суммой квадратов расстояний до центров (инерцией). Процессам пула
+передаётся только путь к файлу точек, и каждый из них отображает файл в
+память сам, поэтому точки не копируются в каждый процесс. Процессы
+запускаются способом "spawn", а не копированием (fork) процесса, у
+которого работают потоки интерфейса.
+
+write_points(chunks, path): Записывает точки по частям в файл.
+
+open_points(path): Отображает файл точек в память.
+
+kmeans_plus_plus(points, k, rng): Выбирает начальные центры методом
+k-means++.
+
+minibatch_kmeans(points, k, settings, rng): Находит центры кластеров
+методом k-средних на мини-выборках.
+
+assign(points, centroids, chunksize): Относит точки к ближайшим центрам.
+
+cluster_points(path, settings): Кластеризует точки из файла с несколькими
+запусками и возвращает лучший результат.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# параметры по умолчанию, см. config["clustering"]
+DEFAULT_SETTINGS = {
+    'k': 5,
+    'batch_size': 2048,
+    'iterations': 300,
+    'tolerance': 1e-4,
+    'restarts': 4,
+    'workers': None,
+    'chunksize': 100000,
+    'seed': 0
+}
+
+
+def _settings(settings):
+    """
+    Дополняет параметры значениями по умолчанию.
+    """
+    return {**DEFAULT_SETTINGS, **(settings or {})}
+
+
+def write_points(chunks, path):
+    """
+    Записывает точки по частям в файл.
+
+    Точки с пропусками координат не записываются.
+
+    Аргументы:
+        chunks (iterable): Части точек (np.ndarray размером (n, 3)).
+        path (str): Путь к файлу.
+
+    Возвращает:
+        int: Количество записанных точек.
+    """
+    count = 0
+    with open(path, 'wb') as points_file:
+        for chunk in chunks:
+            chunk = np.asarray(chunk, dtype='float64')
+            chunk = chunk[~np.isnan(chunk).any(axis=1)]
+            points_file.write(np.ascontiguousarray(chunk).tobytes())
+            count += len(chunk)
+    return count
+
+
+def open_points(path):
+    """
+    Отображает файл точек, записанный write_points, в память.
+
+    Возвращает:
+        np.ndarray: Точки размером (N, 3) только для чтения.
+    """
+    if not os.path.getsize(path):
+        return np.empty((0, 3))
+    return np.memmap(path, dtype='float64', mode='r').reshape(-1, 3)
+
+
+def _squared_distances(points, centroids):
+    """
+    Возвращает квадраты расстояний от точек до центров.
+
+    Аргументы:
+        points (np.ndarray): Точки размером (N, 3).
+        centroids (np.ndarray): Центры размером (k, 3).
+
+    Возвращает:
+        np.ndarray: Матрица размером (N, k).
+    """
+    distances = (points ** 2).sum(axis=1)[:, None] - \
+        2 * points @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+    # ошибки округления не должны давать отрицательных квадратов
+    return np.maximum(distances, 0)
+
+
+def kmeans_plus_plus(points, k, rng):
+    """
+    Выбирает начальные центры методом k-means++.
+
+    Первый центр выбирается случайно, каждый следующий - с вероятностью,
+    пропорциональной квадрату расстояния до ближайшего уже выбранного
+    центра.
+
+    Аргументы:
+        points (np.ndarray): Точки размером (N, 3).
+        k (int): Количество центров.
+        rng (np.random.Generator): Генератор случайных чисел.
+
+    Возвращает:
+        np.ndarray: Центры размером (k, 3).
+    """
+    centroids = np.empty((k, points.shape[1]))
+    centroids[0] = points[rng.integers(len(points))]
+    closest = _squared_distances(points, centroids[:1])[:, 0]
+    for number in range(1, k):
+        total = closest.sum()
+        if total > 0:
+            chosen = rng.choice(len(points), p=closest / total)
+        else:
+            # все точки совпадают с уже выбранными центрами
+            chosen = rng.integers(len(points))
+        centroids[number] = points[chosen]
+        closest = np.minimum(
+            closest,
+            _squared_distances(points, centroids[number:number + 1])[:, 0])
+    return centroids
+
+
+def minibatch_kmeans(points, k, settings=None, rng=None):
+    """
+    Находит центры кластеров методом k-средних на мини-выборках.
+
+    На каждом шаге берётся случайная выборка из settings['batch_size']
+    точек, точки выборки относятся к ближайшим центрам, и каждый центр
+    сдвигается к среднему своих точек с шагом 1 / (количество точек,
+    отнесённых к нему за все шаги). Уточнение прекращается после
+    settings['iterations'] шагов или когда за шаг ни один центр не
+    сдвинулся больше чем на settings['tolerance'].
+
+    Аргументы:
+        points (np.ndarray): Точки размером (N, 3), в том числе
+        отображённые в память (см. open_points).
+        k (int): Количество кластеров.
+        settings (dict): Параметры (см. DEFAULT_SETTINGS).
+        rng (np.random.Generator): Генератор случайных чисел.
+
+    Возвращает:
+        np.ndarray: Центры размером (k, 3).
+    """
+    settings = _settings(settings)
+    rng = rng if rng is not None else np.random.default_rng(settings['seed'])
+    batch_size = min(settings['batch_size'], len(points))
+    # начальные центры выбираются по выборке, а не по всей базе; номера
+    # точек упорядочиваются, чтобы файл читался последовательно
+    sample = points[np.sort(rng.choice(len(points),
+                                       min(len(points),
+                                           max(batch_size, 10 * k)),
+                                       replace=False))]
+    centroids = kmeans_plus_plus(sample, k, rng)
+    counts = np.zeros(k)
+    for _ in range(settings['iterations']):
+        batch = points[np.sort(rng.integers(len(points), size=batch_size))]
+        labels = _squared_distances(batch, centroids).argmin(axis=1)
+        sizes = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=batch[:, axis],
+                                     minlength=k)
+                         for axis in range(points.shape[1])], axis=1)
+        counts += sizes
+        updated = sizes > 0
+        shift = (sums[updated] - sizes[updated, None] *
+                 centroids[updated]) / counts[updated, None]
+        centroids[updated] += shift
+        if not len(shift) or np.abs(shift).max() <= settings['tolerance']:
+            break
+    return centroids
+
+
+def assign(points, centroids, chunksize=100000):
+    """
+    Относит точки к ближайшим центрам.
+
+    Аргументы:
+        points (np.ndarray): Точки размером (N, 3), в том числе
+        отображённые в память (см. open_points).
+        centroids (np.ndarray): Центры размером (k, 3).
+        chunksize (int): Количество точек, обрабатываемых за один раз.
+
+    Возвращает:
+        tuple: Номера кластеров точек (np.ndarray) и инерция - сумма
+        квадратов расстояний от точек до их центров (float).
+    """
+    labels = np.empty(len(points), dtype='int64')
+    inertia = 0.0
+    for start in range(0, len(points), chunksize):
+        distances = _squared_distances(
+            np.asarray(points[start:start + chunksize]), centroids)
+        part = distances.argmin(axis=1)
+        labels[start:start + chunksize] = part
+        inertia += float(distances[np.arange(len(part)), part].sum())
+    return labels, inertia
+
+
+def _sizes(points, centroids, chunksize):
+    """
+    Подсчитывает размеры кластеров и инерцию по частям, не сохраняя номера
+    кластеров точек.
+
+    Возвращает:
+        tuple: Размеры кластеров (np.ndarray) и инерция (float).
+    """
+    sizes = np.zeros(len(centroids), dtype='int64')
+    inertia = 0.0
+    for start in range(0, len(points), chunksize):
+        labels, part = assign(np.asarray(points[start:start + chunksize]),
+                              centroids, chunksize)
+        sizes += np.bincount(labels, minlength=len(centroids))
+        inertia += part
+    return sizes, inertia
+
+
+# точки и параметры процесса пула, задаются при его создании
+_worker = {}
+
+
+def _init_worker(path, settings):
+    """
+    Отображает файл точек в память процесса пула и сохраняет параметры,
+    чтобы не передавать их с каждым запуском.
+    """
+    _worker['points'] = open_points(path)
+    _worker['settings'] = settings
+
+
+def _restart(seed):
+    """
+    Выполняет один запуск кластеризации в процессе пула.
+
+    Возвращает:
+        tuple: Центры и инерция.
+    """
+    points, settings = _worker['points'], _worker['settings']
+    centroids = minibatch_kmeans(points, settings['k'], settings,
+                                 np.random.default_rng(seed))
+    _, inertia = _sizes(points, centroids, settings['chunksize'])
+    return centroids, inertia
+
+
+def cluster_points(path, settings=None):
+    """
+    Кластеризует точки из файла с несколькими запусками и возвращает
+    лучший результат.
+
+    Запуски различаются начальными значениями генератора случайных чисел
+    (из settings['seed']) и выполняются в пуле из settings['workers']
+    процессов, каждый из которых отображает файл точек в память.
+    Кластеры упорядочиваются по убыванию размера. Номера кластеров точек
+    не возвращаются; их можно получить по частям функцией assign.
+
+    Аргументы:
+        path (str): Путь к файлу точек (см. write_points).
+        settings (dict): Параметры (см. DEFAULT_SETTINGS).
+
+    Возвращает:
+        tuple: Центры (np.ndarray размером (k, 3)), размеры кластеров
+        (np.ndarray) и инерция (float).
+    """
+    settings = _settings(settings)
+    points = open_points(path)
+    if len(points) < settings['k']:
+        raise ValueError(f"Точек меньше, чем кластеров: {len(points)} < "
+                         f"{settings['k']}")
+    seeds = np.random.SeedSequence(settings['seed']).spawn(
+        max(settings['restarts'], 1))
+    if len(seeds) == 1 or settings['workers'] == 1:
+        _init_worker(path, settings)
+        results = [_restart(seed) for seed in seeds]
+        _worker.clear()
+    else:
+        with ProcessPoolExecutor(
+                max_workers=settings['workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker, initargs=(path, settings)) as pool:
+            results = list(pool.map(_restart, seeds))
+    centroids, _ = min(results, key=lambda result: result[1])
+
+    sizes, inertia = _sizes(points, centroids, settings['chunksize'])
+    # файл должен быть закрыт до удаления вызывающим
+    del points
+    order = np.argsort(-sizes, kind='stable')
+    return centroids[order], sizes[order], inertia
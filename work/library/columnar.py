@@ -0,0 +1,383 @@
+"""
+Колоночное бинарное хранилище для приложения "Политические координаты"
+
+Каждый столбец базы данных хранится в отдельном файле формата .npy внутри
+каталога хранилища. Текстовые (категориальные) столбцы хранятся в виде
+словаря значений и массива целочисленных кодов, числовые - как есть.
+Словари значений и порядок столбцов записываются в файл meta.json.
+
+save_columnar записывает файлы столбцов нового поколения (с номером
+поколения в имени) рядом со старыми, а затем атомарно заменяет meta.json,
+в котором указано текущее поколение. Поэтому при сбое хранилище остаётся
+целым: до замены meta.json в нём старые данные, после - новые.
+
+При чтении файлы отображаются в память (memory-map), поэтому открытие даже
+очень больших баз не требует разбора текста. open_columns и iter_columnar
+не загружают хранилище в оперативную память целиком, а read_columnar
+копирует все столбцы в обычный DataFrame: это одно копирование памяти
+без разбора, но вся база оказывается в памяти.
+
+save_columnar(df, path): Сохраняет DataFrame в колоночное хранилище.
+
+recover_columnar(path): Восстанавливает хранилище после сбоя во время
+сохранения прежней версией программы.
+
+open_columns(path): Отображает столбцы хранилища в память и возвращает их
+в виде словаря массивов без копирования.
+
+read_columnar(path): Читает колоночное хранилище и возвращает его
+содержимое в виде DataFrame.
+
+iter_columnar(path, chunksize): Читает колоночное хранилище частями по
+chunksize строк.
+
+append_columnar(path, rows): Дописывает строки в конец колоночного
+хранилища.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+META_FILE = 'meta.json'
+
+
+def _codes_dtype(size):
+    """
+    Подбирает наименьший целочисленный тип для кодов словаря.
+
+    Аргументы:
+        size (int): Количество значений в словаре.
+
+    Возвращает:
+        np.dtype: Тип, в который помещаются все коды и код -1.
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _column_file(path, meta, column):
+    """
+    Возвращает путь к файлу столбца текущего поколения хранилища.
+
+    У хранилищ, сохранённых прежними версиями, поколения нет, и файлы
+    столбцов называются по именам столбцов.
+    """
+    generation = meta.get('generation', 0)
+    if not generation:
+        return os.path.join(path, column + '.npy')
+    return os.path.join(path, f"{column}.{generation}.npy")
+
+
+def _has_meta(path):
+    """
+    Проверяет, что каталог содержит сохранённое до конца хранилище.
+    """
+    return os.path.exists(os.path.join(path, META_FILE))
+
+
+def _read_meta(path):
+    """
+    Читает описание хранилища из meta.json.
+    """
+    with open(os.path.join(path, META_FILE), 'r',
+              encoding='utf-8') as meta_file:
+        return json.load(meta_file)
+
+
+def _write_meta(path, meta):
+    """
+    Атомарно записывает описание хранилища в meta.json.
+    """
+    meta_path = os.path.join(path, META_FILE)
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as meta_file:
+        json.dump(meta, meta_file, ensure_ascii=False, indent=4)
+        meta_file.flush()
+        os.fsync(meta_file.fileno())
+    os.replace(tmp_path, meta_path)
+
+
+def _is_categorical(series):
+    """
+    Проверяет, нужно ли хранить столбец в виде словаря и кодов.
+    """
+    return not pd.api.types.is_numeric_dtype(series) or \
+        isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def save_columnar(df, path):
+    """
+    Сохраняет DataFrame в колоночное хранилище.
+
+    Файлы столбцов записываются как новое поколение рядом со старыми, а
+    хранилище переключается на них одной атомарной заменой meta.json (см.
+    описание модуля), поэтому сбой во время записи не портит данные.
+    После переключения файлы других поколений удаляются.
+
+    Аргументы:
+        df (pd.DataFrame): DataFrame, который нужно сохранить.
+        path (str): Путь к каталогу хранилища.
+    """
+    os.makedirs(path, exist_ok=True)
+    generation = _read_meta(path).get('generation', 0) + 1 \
+        if _has_meta(path) else 1
+
+    meta = {'columns': list(df.columns), 'categories': {},
+            'generation': generation}
+    for column in df.columns:
+        if _is_categorical(df[column]):
+            categorical = pd.Categorical(df[column])
+            categories = categorical.categories.tolist()
+            meta['categories'][column] = categories
+            values = categorical.codes.astype(_codes_dtype(len(categories)))
+        else:
+            values = df[column].to_numpy()
+        with open(_column_file(path, meta, column), 'wb') as npy_file:
+            np.save(npy_file, values)
+            npy_file.flush()
+            os.fsync(npy_file.fileno())
+    _write_meta(path, meta)
+    _remove_stale(path, meta)
+
+
+def _remove_stale(path, meta):
+    """
+    Удаляет файлы столбцов, не относящиеся к текущему поколению, - старые
+    и оставшиеся от прерванного сохранения.
+    """
+    current = {os.path.basename(_column_file(path, meta, column))
+               for column in meta['columns']}
+    for name in os.listdir(path):
+        if name.endswith('.npy') and name not in current:
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                # файл ещё отображён в память; удалится при следующем
+                # сохранении
+                pass
+
+
+def recover_columnar(path):
+    """
+    Восстанавливает хранилище после сбоя во время сохранения прежней
+    версией программы.
+
+    Прежние версии подменяли хранилище переименованием каталогов: path в
+    path.old, затем path.tmp в path. Если сбой произошёл между
+    переименованиями, каталога path нет, и хранилище восстанавливается из
+    полного каталога path.tmp (в нём сохранявшиеся данные) или path.old.
+    Оставшиеся каталоги path.tmp и path.old удаляются.
+
+    Аргументы:
+        path (str): Путь к каталогу хранилища.
+
+    Возвращает:
+        bool: True, если хранилище существует.
+    """
+    if not _has_meta(path):
+        for candidate in (path + '.tmp', path + '.old'):
+            if _has_meta(candidate):
+                shutil.rmtree(path, ignore_errors=True)
+                os.rename(candidate, path)
+                break
+    if not _has_meta(path):
+        return False
+    for candidate in (path + '.tmp', path + '.old'):
+        shutil.rmtree(candidate, ignore_errors=True)
+    return True
+
+
+def open_columns(path):
+    """
+    Отображает столбцы хранилища в память и возвращает их в виде словаря
+    массивов без копирования.
+
+    Все массивы обрезаются до длины самого короткого столбца, поэтому
+    строка, дописанная не во все столбцы (например, при сбое), не видна.
+
+    Аргументы:
+        path (str): Путь к каталогу хранилища.
+
+    Возвращает:
+        tuple: Словарь {имя столбца: np.memmap} и описание хранилища (dict).
+    """
+    meta = _read_meta(path)
+    columns = {column: np.load(_column_file(path, meta, column),
+                               mmap_mode='r')
+               for column in meta['columns']}
+    rows = min((len(values) for values in columns.values()), default=0)
+    return {column: values[:rows] for column, values in columns.items()}, \
+        meta
+
+
+def read_columnar(path):
+    """
+    Читает колоночное хранилище и возвращает его содержимое в виде
+    DataFrame.
+
+    Данные копируются из отображённых в память файлов в обычные массивы,
+    чтобы после чтения файлы хранилища можно было перезаписать, а
+    DataFrame - изменять. Поэтому всё хранилище загружается в память;
+    чтобы обработать базу, не загружая её целиком, используйте
+    iter_columnar или open_columns.
+
+    Аргументы:
+        path (str): Путь к каталогу хранилища.
+
+    Возвращает:
+        pd.DataFrame: Содержимое хранилища.
+    """
+    columns, meta = open_columns(path)
+    return _to_frame(columns, meta, 0, len(next(iter(columns.values()), [])))
+
+
+def _to_frame(columns, meta, start, stop):
+    """
+    Собирает DataFrame из строк [start, stop) отображённых столбцов.
+
+    Аргументы:
+        columns (dict): Столбцы, полученные из open_columns.
+        meta (dict): Описание хранилища.
+        start (int): Номер первой строки.
+        stop (int): Номер строки, следующей за последней.
+
+    Возвращает:
+        pd.DataFrame: Строки хранилища.
+    """
+    df = pd.DataFrame(index=pd.RangeIndex(start, stop))
+    for column in meta['columns']:
+        values = np.array(columns[column][start:stop])
+        if column in meta['categories']:
+            df[column] = pd.Categorical.from_codes(
+                values, meta['categories'][column])
+        else:
+            df[column] = values
+    return df
+
+
+def iter_columnar(path, chunksize):
+    """
+    Читает колоночное хранилище частями по chunksize строк.
+
+    В памяти одновременно находится только одна часть, остальные данные
+    остаются в отображённых в память файлах.
+
+    Аргументы:
+        path (str): Путь к каталогу хранилища.
+        chunksize (int): Количество строк в части.
+
+    Возвращает:
+        generator: Части хранилища (pd.DataFrame).
+    """
+    columns, meta = open_columns(path)
+    rows = len(next(iter(columns.values()), []))
+    for start in range(0, rows, chunksize):
+        yield _to_frame(columns, meta, start, min(start + chunksize, rows))
+
+
+def _append_npy(file_path, values, rows):
+    """
+    Дописывает значения в конец одномерного .npy-файла на месте.
+
+    Сначала дописываются данные, затем в заголовке обновляется длина
+    массива. numpy оставляет в заголовке запас пробелов как раз для такого
+    увеличения длины.
+
+    Аргументы:
+        file_path (str): Путь к .npy-файлу.
+        values (np.ndarray): Дописываемые значения.
+        rows (int): Количество строк, после которых дописываются значения.
+        Значения файла за ними (например, оставшиеся от дозаписи, которая
+        при сбое дошла не до всех столбцов) отбрасываются, поэтому все
+        столбцы остаются одной длины.
+
+    Возвращает:
+        bool: False, если новая длина не помещается в заголовок и файл
+        нужно перезаписать целиком.
+    """
+    with open(file_path, 'r+b') as npy_file:
+        version = np.lib.format.read_magic(npy_file)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(npy_file)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(npy_file)
+        data_offset = npy_file.tell()
+        # магическая строка, версия и длина заголовка
+        header_offset = 10 if version == (1, 0) else 12
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+            np.lib.format.dtype_to_descr(dtype), rows + len(values))
+        header_size = data_offset - header_offset
+        if len(header) + 1 > header_size:
+            return False
+
+        # отрезаем байты и строки, оставшиеся от недописанной дозаписи
+        npy_file.seek(data_offset + min(rows, shape[0]) * dtype.itemsize)
+        npy_file.truncate()
+        npy_file.write(np.asarray(values, dtype=dtype).tobytes())
+        npy_file.flush()
+        os.fsync(npy_file.fileno())
+
+        npy_file.seek(header_offset)
+        npy_file.write(header.ljust(header_size - 1).encode('latin1') + b'\n')
+        npy_file.flush()
+        os.fsync(npy_file.fileno())
+    return True
+
+
+def append_columnar(path, rows):
+    """
+    Дописывает строки в конец колоночного хранилища.
+
+    Новые значения категориальных столбцов добавляются в словарь. Если
+    хранилище ещё не создано или заголовок какого-либо файла не вмещает
+    новую длину, хранилище перезаписывается целиком.
+
+    Аргументы:
+        path (str): Путь к каталогу хранилища.
+        rows (pd.DataFrame): Строки, которые нужно дописать.
+    """
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        save_columnar(rows, path)
+        return
+
+    meta = _read_meta(path)
+    encoded = {}
+    meta_changed = False
+    for column in meta['columns']:
+        if column in meta['categories']:
+            categories = meta['categories'][column]
+            for value in rows[column]:
+                if value not in categories:
+                    categories.append(value)
+                    meta_changed = True
+            lookup = {value: code for code, value in enumerate(categories)}
+            encoded[column] = np.array(
+                [lookup[value] for value in rows[column]],
+                dtype=_codes_dtype(len(categories)))
+        else:
+            encoded[column] = rows[column].to_numpy()
+
+    # словарь расширяется до записи кодов, чтобы каждый код имел значение
+    if meta_changed:
+        _write_meta(path, meta)
+
+    # open_columns обрезает столбцы до самого короткого, и дозапись
+    # каждого столбца начинается с этой строки
+    columns, _ = open_columns(path)
+    rows_before = len(next(iter(columns.values()), []))
+    del columns
+    for column in meta['columns']:
+        file_path = _column_file(path, meta, column)
+        needs_rewrite = np.load(file_path, mmap_mode='r').dtype != \
+            encoded[column].dtype and column in meta['categories']
+        if needs_rewrite or not _append_npy(file_path, encoded[column],
+                                            rows_before):
+            full = read_columnar(path).iloc[:rows_before]
+            save_columnar(pd.concat([full, rows[meta['columns']]],
+                                    ignore_index=True), path)
+            return
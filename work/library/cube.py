@@ -0,0 +1,349 @@
+"""
+Куб агрегатов для приложения "Политические координаты"
+
+Для каждой ячейки - сочетания значений gender, field, university и
+course - куб хранит количество записей, а также количество, среднее,
+сумму квадратов отклонений от среднего (M2), минимум и максимум каждого
+количественного атрибута (x, y, z). Ячейки объединяются по формуле Чана,
+как в streaming.Moments, поэтому дисперсия не теряет точность при больших
+суммах, как при вычислении через сумму квадратов.
+Ячеек не больше, чем сочетаний значений из config, поэтому сводные
+таблицы и отчёты строятся свёрткой нескольких сотен ячеек, а не
+просмотром всей базы.
+
+Куб обновляется по мере добавления и удаления записей, без пересчёта
+по всей базе.
+
+AggregateCube - Класс куба агрегатов.
+"""
+import numpy as np
+import pandas as pd
+
+DIMENSIONS = ['gender', 'field', 'university', 'course']
+MEASURES = ['x', 'y', 'z']
+STATISTICS = ['count', 'mean', 'm2', 'min', 'max']
+
+# функции агрегации, которые можно вычислить по кубу
+CUBE_AGGREGATES = ['count', 'sum', 'mean', 'std', 'min', 'max']
+
+
+def _aggregate(rows):
+    """
+    Вычисляет статистики каждой ячейки для набора строк.
+
+    Аргументы:
+        rows (pd.DataFrame): Строки с качественными и количественными
+        столбцами.
+
+    Возвращает:
+        dict: {ячейка: (количество строк, np.ndarray формы (5, 3))}, где
+        строки массива - статистики из STATISTICS, столбцы - атрибуты из
+        MEASURES. Среднее ячейки без значений атрибута равно 0. Пропуски
+        в качественных столбцах заменяются на None.
+    """
+    values = rows[MEASURES].astype('float64')
+    keys = [rows[column] for column in DIMENSIONS]
+    # M2 считается по отклонениям от среднего ячейки (в два прохода), а
+    # не через сумму квадратов
+    means = values.groupby(keys, observed=True, dropna=False,
+                           sort=False).transform('mean')
+    deviations = ((values - means) ** 2).add_suffix('_m2')
+    # все статистики берутся из одной группировки, чтобы порядок ячеек
+    # совпадал
+    grouped = pd.concat([values, deviations], axis=1).groupby(
+        keys, observed=True, dropna=False, sort=False)
+    sizes = grouped.size()
+    table = np.stack([grouped[MEASURES].count().to_numpy(),
+                      grouped[MEASURES].mean().fillna(0).to_numpy(),
+                      grouped[list(deviations.columns)].sum().to_numpy(),
+                      grouped[MEASURES].min().to_numpy(),
+                      grouped[MEASURES].max().to_numpy()], axis=1)
+    return {
+        tuple(None if pd.isna(value) else value for value in key):
+            (int(size), cell)
+        for key, size, cell in zip(sizes.index, sizes.to_numpy(), table)
+    }
+
+
+def _merge(old, cell):
+    """
+    Добавляет к статистикам ячейки статистики других строк той же ячейки
+    по формуле Чана (как streaming.Moments.merge).
+
+    Аргументы:
+        old (np.ndarray): Статистики ячейки, изменяются на месте.
+        cell (np.ndarray): Статистики добавляемых строк.
+    """
+    count = old[0] + cell[0]
+    share = np.divide(cell[0], count, out=np.zeros_like(count),
+                      where=count > 0)
+    delta = cell[1] - old[1]
+    old[2] += cell[2] + delta ** 2 * old[0] * share
+    old[1] += delta * share
+    old[0] = count
+    old[3] = np.fmin(old[3], cell[3])
+    old[4] = np.fmax(old[4], cell[4])
+
+
+def _subtract(old, cell):
+    """
+    Вычитает из статистик ячейки статистики удалённых строк той же ячейки
+    (формула Чана, решённая относительно оставшейся части). Минимум и
+    максимум не изменяются.
+
+    Аргументы:
+        old (np.ndarray): Статистики ячейки, изменяются на месте.
+        cell (np.ndarray): Статистики удалённых строк.
+    """
+    count = old[0] - cell[0]
+    present = count > 0
+    mean = np.divide(old[0] * old[1] - cell[0] * cell[1], count,
+                     out=np.zeros_like(count), where=present)
+    delta = cell[1] - mean
+    m2 = old[2] - cell[2] - np.divide(delta ** 2 * count * cell[0], old[0],
+                                      out=np.zeros_like(count),
+                                      where=present)
+    old[0] = count
+    old[1] = mean
+    # ошибки округления не должны делать M2 отрицательной
+    old[2] = np.where(present, np.maximum(m2, 0), 0)
+
+
+def _combine(cells, level=None):
+    """
+    Объединяет статистики ячеек по формуле Чана.
+
+    Аргументы:
+        cells (pd.DataFrame): Статистики ячеек (столбцы из STATISTICS).
+        level (list): Уровни индекса, по которым группируются ячейки. Если
+        равен None, объединяются все ячейки.
+
+    Возвращает:
+        pd.DataFrame или pd.Series: Объединённые статистики.
+    """
+    weighted = cells['count'] * cells['mean']
+    if level is None:
+        count = cells['count'].sum()
+        mean = weighted.sum() / count
+        spread = cells['m2'] + cells['count'] * (cells['mean'] - mean) ** 2
+        return pd.Series({'count': count, 'mean': mean, 'm2': spread.sum(),
+                          'min': cells['min'].min(),
+                          'max': cells['max'].max()})
+    groups = cells.groupby(level=level)
+    group_mean = weighted.groupby(level=level).transform('sum') / \
+        groups['count'].transform('sum')
+    spread = cells['m2'] + cells['count'] * (cells['mean'] - group_mean) ** 2
+    count = groups['count'].sum()
+    return pd.DataFrame({'count': count,
+                         'mean': weighted.groupby(level=level).sum() / count,
+                         'm2': spread.groupby(level=level).sum(),
+                         'min': groups['min'].min(),
+                         'max': groups['max'].max()})
+
+
+class AggregateCube:
+    """
+    Класс куба агрегатов.
+
+    При удалении записей количество, среднее и M2 пересчитываются по
+    формуле Чана. Минимум и максимум так обновить нельзя, поэтому, если
+    удалённое значение было минимумом или максимумом своей ячейки, они
+    пересчитываются просмотром всех оставшихся записей базы, то есть за
+    время, пропорциональное размеру базы.
+    """
+
+    def __init__(self, df):
+        """
+        Строит куб по содержимому базы данных.
+
+        Аргументы:
+            df (pd.DataFrame): Содержимое базы данных.
+        """
+        self.cells = {}
+        self.sizes = {}
+        # ячейки в виде DataFrame, собираются заново после изменений
+        self._frame = None
+        self.add(df)
+
+    def add(self, rows):
+        """
+        Учитывает добавленные записи.
+
+        Аргументы:
+            rows (pd.DataFrame): Добавленные записи.
+        """
+        self._frame = None
+        for key, (size, cell) in _aggregate(rows).items():
+            if key not in self.cells:
+                self.sizes[key] = size
+                self.cells[key] = cell
+                continue
+            self.sizes[key] += size
+            _merge(self.cells[key], cell)
+
+    def remove(self, rows, remaining):
+        """
+        Учитывает удалённые записи.
+
+        Если удалённое значение было минимумом или максимумом ячейки,
+        remaining просматривается целиком (см. описание класса).
+
+        Аргументы:
+            rows (pd.DataFrame): Удалённые записи.
+            remaining (pd.DataFrame): Содержимое базы данных после
+            удаления. Нужно для пересчёта минимума и максимума.
+        """
+        self._frame = None
+        for key, (size, cell) in _aggregate(rows).items():
+            if key not in self.cells:
+                continue
+            old = self.cells[key]
+            self.sizes[key] -= size
+            if self.sizes[key] <= 0:
+                del self.cells[key]
+                del self.sizes[key]
+                continue
+            _subtract(old, cell)
+            if np.any((cell[3] <= old[3]) | (cell[4] >= old[4])):
+                mask = np.ones(len(remaining), dtype=bool)
+                for column, value in zip(DIMENSIONS, key):
+                    mask &= remaining[column].isna().to_numpy() \
+                        if value is None \
+                        else (remaining[column] == value).to_numpy()
+                values = remaining.loc[mask, MEASURES].astype('float64')
+                old[3] = values.min().to_numpy()
+                old[4] = values.max().to_numpy()
+
+    def frame(self):
+        """
+        Возвращает ячейки куба в виде DataFrame.
+
+        Возвращает:
+            pd.DataFrame: Строки - ячейки, столбцы - 'size' и пары
+            (статистика, атрибут), например ('sum', 'x').
+        """
+        if self._frame is not None:
+            return self._frame
+        keys = list(self.cells)
+        index = pd.MultiIndex.from_tuples(keys, names=DIMENSIONS) \
+            if keys else pd.MultiIndex.from_arrays([[]] * len(DIMENSIONS),
+                                                   names=DIMENSIONS)
+        columns = pd.MultiIndex.from_product([STATISTICS, MEASURES])
+        table = np.array([self.cells[key] for key in keys]).reshape(
+            len(keys), len(STATISTICS) * len(MEASURES))
+        df = pd.DataFrame(table, index=index, columns=columns)
+        df['size'] = [self.sizes[key] for key in keys]
+        self._frame = df
+        return df
+
+    def rollup(self, dimensions, measure):
+        """
+        Сворачивает куб по заданным качественным столбцам.
+
+        Аргументы:
+            dimensions (list): Качественные столбцы, по которым
+            группируются ячейки.
+            measure (str): Количественный атрибут.
+
+        Возвращает:
+            pd.DataFrame: Столбцы - статистики из STATISTICS, строки -
+            сочетания значений dimensions.
+        """
+        df = self.frame()
+        cells = pd.DataFrame({statistic: df[(statistic, measure)]
+                              for statistic in STATISTICS})
+        cells = cells[cells['count'] > 0]
+        return _combine(cells, dimensions)
+
+    def counts(self, dimension):
+        """
+        Возвращает количество записей для каждого значения качественного
+        столбца.
+
+        Аргументы:
+            dimension (str): Качественный столбец.
+
+        Возвращает:
+            pd.Series: Количество записей по значениям столбца.
+        """
+        return self.frame()['size'].groupby(level=dimension).sum()
+
+    def pivot(self, values, columns, index, aggfuncs):
+        """
+        Строит сводную таблицу по кубу.
+
+        Аргументы:
+            values (list): Количественные атрибуты.
+            columns (list): Столбцы, значения которых становятся
+            столбцами сводной таблицы.
+            index (list): Столбцы, значения которых становятся строками
+            сводной таблицы.
+            aggfuncs (list): Функции агрегации из CUBE_AGGREGATES.
+
+        Возвращает:
+            pd.DataFrame: Сводная таблица со столбцами (атрибут, функция
+            агрегации, значения columns...) или None, если её нельзя
+            построить по кубу (например, для 'median').
+        """
+        dimensions = list(index) + list(columns)
+        if not index or any(aggfunc not in CUBE_AGGREGATES
+                            for aggfunc in aggfuncs) or \
+                any(measure not in MEASURES for measure in values) or \
+                any(name not in DIMENSIONS for name in dimensions) or \
+                len(set(dimensions)) != len(dimensions):
+            return None
+        table = {}
+        for measure in values:
+            statistics = self.rollup(dimensions, measure)
+            for aggfunc in aggfuncs:
+                table[(measure, aggfunc)] = _finish(statistics, aggfunc)
+        table = pd.DataFrame(table)
+        return table.unstack(list(columns)) if columns else table
+
+    def describe(self, measure):
+        """
+        Вычисляет количество, среднее, стандартное отклонение, минимум и
+        максимум атрибута по всей базе.
+
+        Аргументы:
+            measure (str): Количественный атрибут.
+
+        Возвращает:
+            dict: Статистики по именам, как в describe().
+        """
+        df = self.frame()
+        cells = pd.DataFrame({statistic: df[(statistic, measure)]
+                              for statistic in STATISTICS})
+        cells = cells[cells['count'] > 0]
+        if not len(cells):
+            return {'count': 0, 'mean': np.nan, 'std': np.nan,
+                    'min': np.nan, 'max': np.nan}
+        total = _combine(cells)
+        std = np.nan
+        if total['count'] > 1:
+            std = np.sqrt(total['m2'] / (total['count'] - 1))
+        return {'count': total['count'],
+                'mean': total['mean'],
+                'std': std,
+                'min': total['min'],
+                'max': total['max']}
+
+
+def _finish(statistics, aggfunc):
+    """
+    Вычисляет значение функции агрегации по свёрнутым статистикам.
+
+    Аргументы:
+        statistics (pd.DataFrame): Статистики из STATISTICS.
+        aggfunc (str): Функция агрегации из CUBE_AGGREGATES.
+
+    Возвращает:
+        pd.Series: Значения функции агрегации.
+    """
+    count = statistics['count']
+    if aggfunc in ('count', 'mean', 'min', 'max'):
+        return statistics[aggfunc]
+    if aggfunc == 'sum':
+        return statistics['mean'] * count
+    # выборочная дисперсия (ddof=1), как в pandas
+    return np.sqrt(statistics['m2'] / (count - 1)).where(count > 1)
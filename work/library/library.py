@@ -10,90 +10,1277 @@
 для функционирования scripts.py
 
 read_config(): Читает конфигурационный файл и возвращает его
-содержимое в виде словаря.
+содержимое в виде словаря. Файл перечитывается, только если он изменился.
 
-read_csv(): Читает csv-файл и возвращает его содержимое в виде DataFrame.
+save_config(config): Атомарно сохраняет настройки в конфигурационный файл.
 
-delete_row(df, row_index): Удаляет строку из DataFrame по индексу,
-перенумеровывает индексы и сохраняет изменения в csv-файл.
+read_csv(): Читает базу данных и возвращает её содержимое в виде
+DataFrame. Формат хранения выбирается параметром config["db"]["backend"]:
+"csv" - текстовый csv-файл, "columnar" - колоночное бинарное хранилище
+(см. модуль columnar), "sqlite" - файл SQLite (см. модуль sqlite_db).
 
-save_to_file(df): Сохраняет DataFrame в csv-файл.
+apply_schema(df): Приводит столбцы DataFrame к типам схемы базы данных.
+
+submit_row(df, record): Добавляет запись в DataFrame и ставит её в журнал
+упреждающей записи (см. модуль wal).
+
+checkpoint(): Переносит записи из журнала упреждающей записи в базу данных.
+
+replay_wal(df): Восстанавливает записи, оставшиеся в журнале после сбоя.
+
+iter_chunks(chunksize): Читает базу данных частями по chunksize строк.
+
+load_data_async(): Запускает чтение базы данных в фоновом потоке и
+возвращает Future с результатом.
+
+get_data(): Возвращает содержимое базы данных, дожидаясь окончания
+фоновой загрузки.
+
+delete_row(df, row_id): Удаляет запись с заданным id из DataFrame и
+помечает её удалённой в базе данных.
+
+read_tombstones(): Возвращает множество id записей, помеченных удалёнными.
+
+next_id(df): Возвращает id для новой записи.
+
+save_answers(row_id, codes): Сохраняет ответы респондента на вопросы теста
+в архив ответов (см. модуль answers).
+
+rescore(questions, options, chunksize): Пересчитывает координаты всех
+респондентов по архиву ответов с новыми осями вопросов и баллами.
+
+renumber_ids(): Уплотняет базу и заново нумерует id записей подряд.
+
+save_to_file(df): Полностью перезаписывает csv-файл содержимым DataFrame.
+
+append_to_file(rows): Дописывает строки в конец csv-файла без перезаписи
+остального файла.
+
+append_row(df, record): Добавляет одну запись в DataFrame и дописывает её
+в csv-файл.
+
+append_new_rows(rows, before_write): Присваивает строкам новые id и
+дописывает их в базу (используется массовым импортом, см. модуль
+bulk_import).
+
+compact_file(): Уплотняет базу данных, перезаписывая её целиком без
+удалённых записей.
+
+import_csv(csv_path): Загружает csv-файл в базу данных текущего формата.
+
+export_csv(csv_path): Выгружает базу данных в csv-файл.
 
 pivot(data, values, column, index, aggfunc): Создает и выводит сводную
-таблицу из DataFrame на основе указанных аргументов.
+таблицу из DataFrame на основе указанных аргументов. Аргументы могут
+быть списками - тогда все сочетания вычисляются за один проход. Для всей
+базы таблица строится по кубу агрегатов (см. модуль cube).
 
 qual_var_text_report(df, qualitative_var): Создает текстовый отчет для
-качественной переменной из переданного DataFrame.
+качественной переменной из переданного DataFrame или, если df равен None,
+из всей базы данных, читая её по частям.
 
 quantitive_text_report(df, quantitative_vars): Создает текстовый отчет
-для количественных переменных из переданного DataFrame.
+для количественных переменных из переданного DataFrame или, если df равен
+None, из всей базы данных, читая её по частям.
+
+cache_stats(): Возвращает статистику кэша сводных таблиц и отчетов.
+
+association_report(df, matrix): Вычисляет статистику хи-квадрат и V
+Крамера для всех пар качественных атрибутов (см. модуль association).
+
+histogram_table(df, qual_attr, quant_attr, bins): Подсчитывает частоты
+гистограммы количественного атрибута для всех значений качественного
+атрибута с общими интервалами (см. модуль binning).
+
+bootstrap_pivot(data, values, column, index, aggfunc): Создает сводную
+таблицу с бутстреп-интервалами для каждой ячейки (см. модуль bootstrap).
+
+similar_respondents(point, exclude): Находит респондентов с ближайшими
+координатами и распределение их по университетам и направлениям.
+
+cluster_respondents(df, k): Разбивает респондентов на кластеры по
+координатам (см. модуль clustering) и строит таблицу сопряжённости
+кластеров с качественными атрибутами.
+
+progressive_qual_var_text_report(df, qualitative_var),
+progressive_quantitive_text_report(df, quantitative_vars),
+progressive_pivot(data, values, column, index, aggfunc): Приближённые
+версии отчетов, которые строятся по растущей случайной выборке и
+уточняются до достижения заданной точности (см. модуль progressive).
 """
 import pandas as pd
+import atexit
+import functools
+import inspect
 import json
 import os
+import tempfile
+import threading
+from concurrent.futures import Future
+
+from work.library.answers import append_answers, iter_answers, \
+    renumber_answers
+from work.library.association import association_matrix, \
+    association_table
+from work.library.binning import category_codes, histogram_counts
+from work.library.bootstrap import pivot_bootstrap
+from work.library.cache import ResultCache
+from work.library.clustering import assign, cluster_points, write_points
+from work.library.cube import AggregateCube
+from work.library.columnar import append_columnar, iter_columnar, \
+    read_columnar, recover_columnar, save_columnar
+from work.library.spatial import GridIndex
+from work.library.sqlite_db import append_sqlite, delete_sqlite, \
+    iter_sqlite, last_id_sqlite, pivot_sql, qual_var_report_sql, \
+    quantitive_report_sql, read_sqlite, save_sqlite
+from work.library.streaming import qual_var_stream_report, \
+    quantitive_stream_report
+from work.library.progressive import pivot_progressive, \
+    qual_var_progressive_report, quantitive_progressive_report
+from work.library.scoring import bank_engine
+from work.library.wal import WriteAheadLog
+
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', 'scripts',
+                           'config.json')
+
+# разобранный конфигурационный файл и время его изменения
+_config_cache = {'mtime': None, 'config': None}
+_config_lock = threading.Lock()
 
 
 def read_config():
     """
     Читает конфигурационный файл и возвращает его содержимое в виде словаря.
 
+    Разобранный файл хранится в памяти процесса и перечитывается, только
+    если изменилось время изменения файла, поэтому повторные вызовы не
+    открывают и не разбирают файл. Все вызовы возвращают один и тот же
+    словарь, пока файл не изменится.
+
     Возвращает:
         dict: Содержимое конфигурационного файла.
     """
-    config_path = os.path.join(os.path.dirname(__file__), '..', 'scripts',
-                               'config.json')
-    with open(config_path, 'r', encoding="utf-8") as config_file:
-        config = json.load(config_file)
-    return config
+    mtime = os.stat(CONFIG_PATH).st_mtime_ns
+    with _config_lock:
+        if _config_cache['mtime'] != mtime:
+            with open(CONFIG_PATH, 'r', encoding="utf-8") as config_file:
+                _config_cache['config'] = json.load(config_file)
+            _config_cache['mtime'] = mtime
+        return _config_cache['config']
 
 
-def read_csv():
+def save_config(config):
+    """
+    Атомарно сохраняет настройки в конфигурационный файл.
+
+    Настройки записываются во временный файл, который затем подменяет
+    основной, поэтому сбой во время записи не портит конфигурацию.
+
+    Аргументы:
+        config (dict): Содержимое конфигурационного файла.
+    """
+    tmp_path = CONFIG_PATH + '.tmp'
+    with _config_lock:
+        with open(tmp_path, 'w', encoding="utf-8") as config_file:
+            json.dump(config, config_file, ensure_ascii=False, indent=4)
+            config_file.flush()
+            os.fsync(config_file.fileno())
+        os.replace(tmp_path, CONFIG_PATH)
+        _config_cache['config'] = config
+        _config_cache['mtime'] = os.stat(CONFIG_PATH).st_mtime_ns
+
+
+# Схема базы данных: качественные столбцы хранятся как pandas.Categorical
+# с набором значений из указанного ключа config, количественные - в
+# компактных числовых типах
+CATEGORICAL_COLUMNS = {
+    'gender': 'sexes',
+    'field': 'directions',
+    'university': 'universities',
+    'course': 'courses'
+}
+NUMERIC_DTYPES = {
+    'id': 'int32',
+    'x': 'float32',
+    'y': 'float32',
+    'z': 'float32'
+}
+
+
+def apply_schema(df):
     """
-    Читает csv-файл и возвращает его содержимое в виде DataFrame.
+    Приводит столбцы DataFrame к типам схемы базы данных.
+
+    Качественные столбцы становятся pandas.Categorical со списком значений
+    из config (например, config["universities"] для university). Значения,
+    которых нет в config, не теряются, а добавляются в конец списка.
+    Количественные столбцы приводятся к типам из NUMERIC_DTYPES.
+
+    Аргументы:
+        df (pd.DataFrame): Исходный DataFrame.
+
+    Возвращает:
+        pd.DataFrame: DataFrame со столбцами в типах схемы.
+    """
+    config = read_config()
+    df = df.copy()
+    for column, key in CATEGORICAL_COLUMNS.items():
+        if column not in df.columns:
+            continue
+        categories = list(config.get(key, []))
+        known = set(categories)
+        values = df[column].cat.categories \
+            if isinstance(df[column].dtype, pd.CategoricalDtype) \
+            else df[column].dropna().unique()
+        categories += [value for value in values if value not in known]
+        df[column] = pd.Categorical(df[column], categories=categories)
+    for column, dtype in NUMERIC_DTYPES.items():
+        if column in df.columns:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def _schema_order(column, values):
+    """
+    Упорядочивает значения столбца так же, как категории в схеме.
+
+    Аргументы:
+        column (str): Имя столбца.
+        values (iterable): Значения столбца.
+
+    Возвращает:
+        pd.Index: Значения в порядке списка из config, за которыми следуют
+        значения, которых в config нет.
+    """
+    values = list(values)
+    if column not in CATEGORICAL_COLUMNS:
+        return pd.Index(values, name=column)
+    order = read_config().get(CATEGORICAL_COLUMNS[column], [])
+    present = set(values)
+    return pd.Index([value for value in order if value in present] +
+                    [value for value in values if value not in set(order)],
+                    name=column)
+
+
+def _read_csv_file(path):
+    """
+    Читает csv-файл в формате базы данных сразу в типах схемы.
+
+    Аргументы:
+        path (str): Путь к csv-файлу.
 
     Возвращает:
         pd.DataFrame: Содержимое csv-файла.
     """
+    dtypes = dict(NUMERIC_DTYPES)
+    dtypes.update({column: 'category' for column in CATEGORICAL_COLUMNS})
+    return apply_schema(pd.read_csv(path, encoding='utf-8', dtype=dtypes))
+
+
+def read_csv():
+    """
+    Читает базу данных и возвращает её содержимое в виде DataFrame.
+
+    Если config["db"]["backend"] равен "columnar", данные читаются из
+    колоночного хранилища config["db"]["columnar"] без разбора текста,
+    если "sqlite" - из файла SQLite config["db"]["sqlite"], иначе - из
+    csv-файла config["db"]["csv"]. Колоночное хранилище, прерванное при
+    сохранении, сначала восстанавливается (см. recover_columnar). Если
+    колоночное хранилище или файл SQLite ещё не созданы, они создаются из
+    csv-файла. Столбцы приводятся к типам схемы (см. apply_schema).
+
+    Возвращает:
+        pd.DataFrame: Содержимое базы данных.
+    """
     config = read_config()
-    data = pd.read_csv(config["db"]["csv"], encoding='utf-8')
+    if _backend(config) == "columnar":
+        exists = recover_columnar(config["db"]["columnar"])
+    else:
+        exists = os.path.exists(_storage_path(config))
+    if _backend(config) != "csv" and not exists:
+        return import_csv()
+    if _backend(config) == "columnar":
+        data = apply_schema(read_columnar(config["db"]["columnar"]))
+    elif _backend(config) == "sqlite":
+        data = apply_schema(read_sqlite(config["db"]["sqlite"]))
+    else:
+        data = _read_csv_file(config["db"]["csv"])
+    tombstones = read_tombstones()
+    if tombstones:
+        data = data[~data['id'].isin(tombstones)].reset_index(drop=True)
     return data
 
 
-data = read_csv()
+def _backend(config):
+    """
+    Возвращает формат хранения базы данных: "csv", "columnar" или
+    "sqlite".
+
+    Аргументы:
+        config (dict): Содержимое конфигурационного файла.
+    """
+    return config["db"].get("backend", "csv")
 
 
-def delete_row(df, row_index):
+def _storage_path(config):
     """
-    Удаляет строку из DataFrame по индексу, перенумеровывает индексы и
-    сохраняет изменения в csv-файл.
+    Возвращает путь к базе данных текущего формата.
+
+    Аргументы:
+        config (dict): Содержимое конфигурационного файла.
+
+    Возвращает:
+        str: Путь к csv-файлу, к каталогу колоночного хранилища или к
+        файлу SQLite.
+    """
+    return config["db"][_backend(config)]
+
+
+def _tombstone_path(config):
+    """
+    Возвращает путь к файлу со списком удалённых записей.
+
+    Аргументы:
+        config (dict): Содержимое конфигурационного файла.
+
+    Возвращает:
+        str: Путь к файлу рядом с базой данных текущего формата.
+    """
+    return _storage_path(config) + '.deleted'
+
+
+# блокировка, которая не даёт записывать в базу одновременно из главного
+# потока и из потока журнала упреждающей записи
+_storage_lock = threading.RLock()
+
+
+def _with_storage_lock(function):
+    """
+    Декоратор, выполняющий функцию под блокировкой базы данных.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with _storage_lock:
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def read_tombstones():
+    """
+    Возвращает множество id записей, помеченных удалёнными.
+
+    Удалённые записи остаются в базе до ближайшего уплотнения
+    (см. compact_file), а их id хранятся в отдельном файле, по одному
+    в строке.
+
+    Возвращает:
+        set: Множество id удалённых записей.
+    """
+    path = _tombstone_path(read_config())
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as tombstone_file:
+        # недописанная при сбое последняя строка пропускается
+        return {int(line) for line in tombstone_file
+                if line.endswith('\n') and line.strip().isdigit()}
+
+
+@_with_storage_lock
+def delete_row(df, row_id):
+    """
+    Удаляет запись с заданным id из DataFrame и помечает её удалённой в
+    базе данных.
+
+    Сама база не перезаписывается: id записи дописывается в файл удалённых
+    записей, а место освобождается при уплотнении (см. compact_file).
+    В формате "sqlite" запись удаляется одним запросом по первичному
+    ключу. Перед этим записи журнала упреждающей записи переносятся в
+    базу (см. checkpoint), иначе запись, которая ещё ждала в журнале,
+    вернулась бы при следующем переносе.
+
+    Id остальных записей не меняются; чтобы пронумеровать записи заново,
+    используйте renumber_ids. Кэш сводных таблиц и отчетов очищается.
 
     Аргументы:
         df (pd.DataFrame): Исходный DataFrame, из которого нужно удалить
         строку.
-        row_index (int): Индекс строки, которую нужно удалить.
+        row_id (int): Id записи, которую нужно удалить.
 
     Возвращает:
         pd.DataFrame: DataFrame с обновленным содержимым.
     """
-    df = df.drop(row_index)
-    df = df.reset_index(drop=True)
-    df['id'] = range(1, len(df) + 1)
+    mask = df['id'] == row_id
+    if not mask.any():
+        return df
+    config = read_config()
+    if _backend(config) == "sqlite":
+        checkpoint()
+        delete_sqlite(config["db"]["sqlite"], row_id)
+    else:
+        with open(_tombstone_path(config), 'a',
+                  encoding='utf-8') as tombstone_file:
+            tombstone_file.write(f"{row_id}\n")
+            tombstone_file.flush()
+            os.fsync(tombstone_file.fileno())
+        _count_writes(config, 1)
+    _new_version()
+    return _replace_current(df, df[~mask].reset_index(drop=True),
+                            removed=df[mask])
+
+
+def next_id(df):
+    """
+    Возвращает id для новой записи.
+
+    Id удалённых, но ещё не вычищенных уплотнением записей не используются
+    повторно, иначе новая запись оказалась бы скрыта как удалённая. В
+    формате "sqlite" не используются повторно id всех удалённых записей
+    (см. last_id_sqlite).
+
+    Аргументы:
+        df (pd.DataFrame): Текущее содержимое базы данных.
+
+    Возвращает:
+        int: Id, больший id всех существующих и удалённых записей.
+    """
+    used = _deleted_high_water(read_config())
+    if len(df):
+        used = max(used, int(df['id'].max()))
+    return used + 1
+
+
+def _deleted_high_water(config):
+    """
+    Возвращает наибольший id удалённых записей, который нельзя
+    использовать повторно.
+
+    Аргументы:
+        config (dict): Содержимое конфигурационного файла.
+    """
+    used = max(read_tombstones(), default=0)
+    if _backend(config) == "sqlite":
+        used = max(used, last_id_sqlite(config["db"]["sqlite"]))
+    return used
+
+
+def save_answers(row_id, codes):
+    """
+    Сохраняет ответы респондента на вопросы теста в архив ответов
+    config["db"]["answers"].
+
+    Аргументы:
+        row_id (int): Id записи респондента в базе данных.
+        codes (np.ndarray): Коды ответов (см. модуль scoring) в порядке
+        вопросов config["questions"].
+    """
+    config = read_config()
+    append_answers(config["db"]["answers"], config["questions"],
+                   config["options"], [row_id], [codes])
+
+
+@_with_storage_lock
+def rescore(questions=None, options=None, chunksize=None):
+    """
+    Пересчитывает координаты всех респондентов по архиву ответов.
+
+    Архив читается частями по chunksize респондентов, и координаты каждой
+    части вычисляются одним матричным умножением (см. модуль scoring).
+    Вопросы сопоставляются по тексту, поэтому ответы, записанные для
+    прежних версий банка вопросов, тоже пересчитываются. Координаты
+    записей, для которых в архиве нет ответов, не меняются. База
+    перезаписывается целиком.
+
+    Аргументы:
+        questions (list): Вопросы в формате config["questions"]. По
+        умолчанию config["questions"].
+        options (dict): Баллы по вариантам ответов в формате
+        config["options"]. По умолчанию config["options"].
+        chunksize (int): Количество респондентов в части. По умолчанию
+        config["db"]["chunksize"].
+
+    Возвращает:
+        pd.DataFrame: Содержимое базы с пересчитанными координатами.
+    """
+    config = read_config()
+    questions = questions or config["questions"]
+    options = options or config["options"]
+    chunksize = chunksize or config["db"].get("chunksize", 100000)
+
+    parts = []
+    for bank, ids, codes in iter_answers(config["db"]["answers"], chunksize):
+        scores = bank_engine(bank, questions, options).score(codes)
+        parts.append(pd.DataFrame(scores, columns=['x', 'y', 'z'],
+                                  index=pd.Index(ids, name='id')))
+    # записи журнала переносятся в базу, чтобы перезапись их не потеряла
+    checkpoint()
+    df = read_csv()
+    if parts:
+        scores = pd.concat(parts)
+        # при повторной записи ответов одного респондента верна последняя
+        scores = scores[~scores.index.duplicated(keep='last')]
+        scores = scores.reindex(df['id'])
+        found = scores['x'].notna().to_numpy()
+        for axis in ['x', 'y', 'z']:
+            df.loc[found, axis] = scores[axis].to_numpy()[found].astype(
+                df[axis].dtype)
     save_to_file(df)
-    data = read_csv()
-    return data
+    if _current['data'] is not None:
+        _set_current(df)
+    return df
+
 
+@_with_storage_lock
+def renumber_ids():
+    """
+    Уплотняет базу и заново нумерует id записей подряд, начиная с 1.
+
+    Операция перезаписывает всю базу, поэтому выполняется явно, а не при
+    каждом удалении. Сначала в базу переносятся записи из журнала
+    упреждающей записи (см. checkpoint). Id в архиве ответов заменяются
+    теми же новыми id (см. renumber_answers), чтобы rescore пересчитывал
+    координаты тех же респондентов. Если база загружена, её содержимое,
+    куб агрегатов и пространственный индекс строятся заново.
 
+    Возвращает:
+        pd.DataFrame: Содержимое базы с новыми id.
+    """
+    config = read_config()
+    checkpoint()
+    df = read_csv()
+    old_ids = df['id'].to_numpy()
+    df['id'] = pd.RangeIndex(1, len(df) + 1).to_numpy().astype(
+        df['id'].dtype)
+    save_to_file(df)
+    renumber_answers(config["db"]["answers"], old_ids, df['id'].to_numpy(),
+                     config["db"].get("chunksize", 100000))
+    if _current['data'] is not None:
+        _set_current(df)
+    return df
+
+
+@_with_storage_lock
 def save_to_file(df):
     """
-    Сохраняет DataFrame в csv-файл.
+    Полностью перезаписывает csv-файл содержимым DataFrame.
+
+    Файл сначала записывается во временный файл рядом с основным, а затем
+    атомарно подменяет его, поэтому сбой во время записи не портит базу.
+    Для добавления новых записей используйте append_row. Если выбран
+    формат "columnar", перезаписывается колоночное хранилище.
+
+    DataFrame считается полным содержимым базы, поэтому из списка
+    удалённых записей после сохранения убираются все id, кроме тех, что
+    больше наибольшего id в df: они могут относиться к записям, которые
+    ещё ждут в журнале упреждающей записи (см. checkpoint). Кэш сводных
+    таблиц и отчетов также очищается (см. get_result_cache).
 
     Аргументы:
         df (pd.DataFrame): DataFrame, который нужно сохранить в csv-файл.
     """
+    global _writes_since_compaction
+    config = read_config()
+    if _backend(config) == "columnar":
+        save_columnar(df, config["db"]["columnar"])
+    elif _backend(config) == "sqlite":
+        save_sqlite(df, config["db"]["sqlite"])
+    else:
+        path = config["db"]["csv"]
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as csv_file:
+            df.to_csv(csv_file, index=False)
+            csv_file.flush()
+            os.fsync(csv_file.fileno())
+        os.replace(tmp_path, path)
+    _keep_tombstones(config, int(df['id'].max()) if len(df) else 0)
+    _writes_since_compaction = 0
+    _new_version()
+
+
+def _keep_tombstones(config, last_id):
+    """
+    Оставляет в списке удалённых записей только id больше last_id.
+
+    Аргументы:
+        config (dict): Содержимое конфигурационного файла.
+        last_id (int): Наибольший id записей в базе.
+    """
+    path = _tombstone_path(config)
+    if not os.path.exists(path):
+        return
+    kept = sorted(row_id for row_id in read_tombstones() if row_id > last_id)
+    if not kept:
+        os.remove(path)
+        return
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as tombstone_file:
+        tombstone_file.writelines(f"{row_id}\n" for row_id in kept)
+        tombstone_file.flush()
+        os.fsync(tombstone_file.fileno())
+    os.replace(tmp_path, path)
+
+
+# количество дописанных и удалённых строк с момента последнего уплотнения
+_writes_since_compaction = 0
+
+
+def _count_writes(config, count):
+    """
+    Учитывает дописанные или удалённые строки и уплотняет базу, когда их
+    накопилось config["db"]["compact_every"].
+
+    Аргументы:
+        config (dict): Содержимое конфигурационного файла.
+        count (int): Количество дописанных или удалённых строк.
+    """
+    global _writes_since_compaction
+    _writes_since_compaction += count
+    if _writes_since_compaction >= config["db"].get("compact_every", 1000):
+        compact_file()
+
+
+def _repair_tail(path):
+    """
+    Отрезает недописанную последнюю строку csv-файла.
+
+    Если приложение аварийно завершилось во время дозаписи, файл может
+    заканчиваться неполной строкой без перевода строки. Такая строка
+    удаляется, чтобы следующая запись не склеилась с ней.
+
+    Аргументы:
+        path (str): Путь к csv-файлу.
+    """
+    with open(path, 'rb+') as csv_file:
+        end = csv_file.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        csv_file.seek(end - 1)
+        if csv_file.read(1) == b'\n':
+            return
+        # ищем последний перевод строки, читая файл блоками с конца
+        position = end
+        while position > 0:
+            start = max(0, position - 4096)
+            csv_file.seek(start)
+            block = csv_file.read(position - start)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                csv_file.truncate(start + newline + 1)
+                return
+            position = start
+        csv_file.truncate(0)
+
+
+@_with_storage_lock
+def append_to_file(rows):
+    """
+    Дописывает строки в конец csv-файла без перезаписи остального файла.
+
+    Запись завершается вызовом fsync, поэтому после возврата из функции
+    строки гарантированно сохранены на диске. Стоимость записи зависит
+    только от числа добавляемых строк, а не от размера базы. Каждые
+    config["db"]["compact_every"] дописанных строк файл уплотняется
+    (см. compact_file). Если выбран формат "columnar", строки дописываются
+    в файлы столбцов колоночного хранилища, если "sqlite" - добавляются в
+    таблицу одной транзакцией.
+
+    Аргументы:
+        rows (pd.DataFrame): Строки, которые нужно дописать в файл. Порядок
+        столбцов должен совпадать с порядком столбцов в файле.
+    """
+    config = read_config()
+    _write_rows(config, rows)
+    # SQLite не нуждается в уплотнении
+    if _backend(config) != "sqlite":
+        _count_writes(config, len(rows))
+    _new_version()
+
+
+def _write_rows(config, rows):
+    """
+    Дописывает строки в базу текущего формата, не уплотняя её.
+
+    Аргументы:
+        config (dict): Содержимое конфигурационного файла.
+        rows (pd.DataFrame): Строки, которые нужно дописать.
+    """
+    if _backend(config) == "columnar":
+        append_columnar(config["db"]["columnar"], rows)
+    elif _backend(config) == "sqlite":
+        append_sqlite(config["db"]["sqlite"], rows)
+    else:
+        path = config["db"]["csv"]
+        write_header = not os.path.exists(path) or \
+            os.path.getsize(path) == 0
+        if not write_header:
+            _repair_tail(path)
+        with open(path, 'a', encoding='utf-8', newline='') as csv_file:
+            rows.to_csv(csv_file, header=write_header, index=False)
+            csv_file.flush()
+            os.fsync(csv_file.fileno())
+
+
+def append_row(df, record):
+    """
+    Добавляет одну запись в DataFrame и дописывает её в csv-файл.
+
+    Аргументы:
+        df (pd.DataFrame): Текущее содержимое базы данных.
+        record (dict): Значения новой записи по именам столбцов.
+
+    Возвращает:
+        pd.DataFrame: DataFrame с добавленной записью.
+    """
+    row = pd.DataFrame([record], columns=df.columns)
+    matched, row = _match_dtypes(df, row)
+    append_to_file(row)
+    return _replace_current(df, pd.concat([matched, row],
+                                          ignore_index=True), added=row)
+
+
+def _match_dtypes(df, rows):
+    """
+    Приводит новые строки к типам столбцов DataFrame.
+
+    Если в строках встречаются значения качественного столбца, которых
+    ещё нет в его списке значений, они добавляются в список. Это позволяет
+    объединять строки с DataFrame, не теряя тип Categorical.
+
+    Аргументы:
+        df (pd.DataFrame): DataFrame, к которому добавляются строки.
+        rows (pd.DataFrame): Добавляемые строки.
+
+    Возвращает:
+        tuple: DataFrame и строки с согласованными типами столбцов.
+    """
+    df = df.copy(deep=False)
+    rows = rows.copy()
+    for column in df.columns:
+        dtype = df[column].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            new_values = [value for value in rows[column].dropna().unique()
+                          if value not in dtype.categories]
+            if new_values:
+                df[column] = df[column].cat.add_categories(new_values)
+            rows[column] = pd.Categorical(
+                rows[column], categories=df[column].cat.categories)
+        else:
+            rows[column] = rows[column].astype(dtype)
+    return df, rows
+
+
+@_with_storage_lock
+def compact_file():
+    """
+    Уплотняет базу данных, перезаписывая её целиком без удалённых записей.
+
+    Перечитывает базу и атомарно записывает её заново через save_to_file,
+    приводя к единому виду строки, дописанные через append_to_file, и
+    окончательно убирая записи, удалённые через delete_row. Id записей
+    при этом не меняются. Сначала в базу переносятся записи из журнала
+    упреждающей записи (см. checkpoint), иначе удалённая запись, которая
+    ещё ждала в журнале, вернулась бы в базу при следующем переносе.
+    """
+    checkpoint()
+    save_to_file(read_csv())
+
+
+# журнал упреждающей записи, создаётся при первом обращении
+_wal = None
+
+
+def get_wal():
+    """
+    Возвращает журнал упреждающей записи для базы данных текущего формата.
+
+    Журнал хранится рядом с базой в файле с расширением .wal. Параметры
+    группировки записей берутся из config["db"]["wal"]. При завершении
+    программы записи, ещё не попавшие на диск, записываются в журнал.
+
+    Возвращает:
+        WriteAheadLog: Журнал упреждающей записи.
+    """
+    global _wal
+    with _storage_lock:
+        if _wal is None:
+            config = read_config()
+            settings = config["db"].get("wal", {})
+            _wal = WriteAheadLog(_storage_path(config) + '.wal',
+                                 settings.get("flush_interval", 0.2),
+                                 settings.get("flush_size", 64),
+                                 on_commit=_after_wal_commit)
+            atexit.register(_wal.close)
+        return _wal
+
+
+def _after_wal_commit(size):
+    """
+    Переносит записи из журнала в базу, когда их накопилось
+    config["db"]["wal"]["checkpoint_size"].
+
+    Аргументы:
+        size (int): Количество записей в журнале.
+    """
+    settings = read_config()["db"].get("wal", {})
+    if size >= settings.get("checkpoint_size", 1000):
+        checkpoint()
+
+
+def submit_row(df, record):
+    """
+    Добавляет запись в DataFrame и ставит её в журнал упреждающей записи.
+
+    Функция не ждёт записи на диск: записи, поступившие почти одновременно,
+    записываются в журнал одной группой (см. модуль wal), а затем
+    периодически переносятся в базу функцией checkpoint. Если журнал
+    отключён в config["db"]["wal"]["enabled"], запись сразу дописывается в
+    базу через append_row.
+
+    Аргументы:
+        df (pd.DataFrame): Текущее содержимое базы данных.
+        record (dict): Значения новой записи по именам столбцов.
+
+    Возвращает:
+        pd.DataFrame: DataFrame с добавленной записью.
+    """
+    if not read_config()["db"].get("wal", {}).get("enabled", False):
+        return append_row(df, record)
+    row = pd.DataFrame([record], columns=df.columns)
+    matched, row = _match_dtypes(df, row)
+    get_wal().submit({column: record[column] for column in df.columns})
+    return _replace_current(df, pd.concat([matched, row],
+                                          ignore_index=True), added=row)
+
+
+@_with_storage_lock
+def checkpoint():
+    """
+    Переносит записи из журнала упреждающей записи в базу данных.
+
+    Все записи журнала, кроме уже удалённых через delete_row, дописываются
+    в базу одной операцией, после чего журнал очищается. Всё это
+    выполняется под блокировкой журнала (см. WriteAheadLog), поэтому
+    группа, которую фоновый поток записывает в это время, не удаляется
+    очисткой, не попав в базу. Уплотнение (см. _count_writes) выполняется
+    только после очистки журнала, чтобы оно не перенесло те же записи
+    второй раз.
+    """
+    wal = get_wal()
+    config = read_config()
+    with wal.lock:
+        wal.flush()
+        rows = _unstored_rows(wal.read(), read_tombstones())
+        if len(rows):
+            _write_rows(config, rows)
+        wal.truncate()
+    if len(rows):
+        if _backend(config) != "sqlite":
+            _count_writes(config, len(rows))
+        _new_version()
+
+
+def _unstored_rows(records, tombstones):
+    """
+    Возвращает записи журнала, которые нужно перенести в базу.
+
+    Аргументы:
+        records (list): Записи журнала (словари значений по столбцам).
+        tombstones (set): Id удалённых записей.
+
+    Возвращает:
+        pd.DataFrame: Записи, приведённые к схеме, без удалённых.
+    """
+    if not records:
+        return pd.DataFrame()
+    rows = apply_schema(pd.DataFrame(records))
+    return rows[~rows['id'].isin(tombstones)].reset_index(drop=True)
+
+
+@_with_storage_lock
+def append_new_rows(rows, before_write=None):
+    """
+    Присваивает строкам новые id и дописывает их в базу.
+
+    Сначала в базу переносятся записи из журнала упреждающей записи (см.
+    checkpoint), поэтому новые id следуют и за id записей, которые ещё
+    ждали в журнале. Всё выполняется под блокировкой базы.
+
+    Аргументы:
+        rows (pd.DataFrame): Строки в порядке столбцов базы; значения
+        столбца id заменяются.
+        before_write (function): Функция, которая вызывается со строками с
+        новыми id перед записью в базу (под той же блокировкой).
+
+    Возвращает:
+        pd.DataFrame: Дописанные строки с новыми id.
+    """
+    checkpoint()
+    last_id = max([int(chunk['id'].max()) for chunk in iter_chunks()
+                   if len(chunk)] + [_deleted_high_water(read_config())])
+    rows = rows.copy()
+    rows['id'] = pd.RangeIndex(last_id + 1, last_id + 1 + len(rows)) \
+        .to_numpy().astype(rows['id'].dtype)
+    if len(rows):
+        if before_write is not None:
+            before_write(rows)
+        append_to_file(rows)
+    return rows
+
+
+@_with_storage_lock
+def replay_wal(df):
+    """
+    Восстанавливает записи, оставшиеся в журнале после сбоя.
+
+    Запись считается уже перенесённой в базу, только если в базе есть
+    строка с тем же id и теми же значениями всех столбцов; такие записи
+    пропускаются. Остальные записи, кроме удалённых, дописываются в базу.
+    Если id записи тем временем занят другой строкой базы, записи
+    присваивается новый id. После этого журнал очищается. Как и checkpoint,
+    функция работает под блокировкой журнала.
+
+    Аргументы:
+        df (pd.DataFrame): Содержимое базы данных.
+
+    Возвращает:
+        pd.DataFrame: DataFrame с восстановленными записями.
+    """
+    wal = get_wal()
+    with wal.lock:
+        return _replay_records(df, wal)
+
+
+def _replay_records(df, wal):
+    """
+    Переносит записи журнала в базу для replay_wal; вызывается под
+    блокировкой журнала.
+    """
+    records = wal.read()
+    if not records:
+        return df
+    rows = _unstored_rows(records, read_tombstones())
+    if len(rows):
+        df, rows = _match_dtypes(df, rows[df.columns])
+        # строки базы с теми же id - кандидаты на совпадение с записями
+        candidates = df[df['id'].isin(rows['id'])].drop_duplicates()
+        stored = rows.merge(candidates, how='left', on=list(df.columns),
+                            indicator=True)['_merge'] == 'both'
+        rows = rows[~stored.to_numpy()].reset_index(drop=True)
+        taken = rows['id'].isin(df['id']).to_numpy()
+        if taken.any():
+            start = max(next_id(df), int(rows['id'].max()) + 1)
+            rows.loc[taken, 'id'] = range(start, start + int(taken.sum()))
+    if len(rows):
+        append_to_file(rows)
+        df = pd.concat([df, rows], ignore_index=True)
+    wal.truncate()
+    return df
+
+
+def import_csv(csv_path=None):
+    """
+    Загружает csv-файл в базу данных текущего формата.
+
+    Позволяет перевести базу в колоночный формат или в SQLite: после
+    смены config["db"]["backend"] достаточно один раз вызвать эту функцию.
+
+    Аргументы:
+        csv_path (str): Путь к csv-файлу. По умолчанию config["db"]["csv"].
+
+    Возвращает:
+        pd.DataFrame: Загруженные данные.
+    """
+    config = read_config()
+    df = _read_csv_file(csv_path or config["db"]["csv"])
+    save_to_file(df)
+    return df
+
+
+def export_csv(csv_path=None):
+    """
+    Выгружает базу данных в csv-файл.
+
+    Аргументы:
+        csv_path (str): Путь к csv-файлу. По умолчанию config["db"]["csv"].
+    """
     config = read_config()
-    df.to_csv(config["db"]["csv"], index=False)
+    read_csv().to_csv(csv_path or config["db"]["csv"], index=False)
 
 
+def iter_chunks(chunksize=None):
+    """
+    Читает базу данных частями по chunksize строк.
+
+    Части приводятся к типам схемы, удалённые записи пропускаются.
+    Последней частью возвращаются записи из журнала упреждающей записи,
+    которые ещё не перенесены в базу.
+
+    Аргументы:
+        chunksize (int): Количество строк в части. По умолчанию
+        config["db"]["chunksize"].
+
+    Возвращает:
+        generator: Части базы данных (pd.DataFrame).
+    """
+    config = read_config()
+    chunksize = chunksize or config["db"].get("chunksize", 100000)
+    tombstones = read_tombstones()
+    if _backend(config) == "columnar":
+        chunks = iter_columnar(config["db"]["columnar"], chunksize)
+    elif _backend(config) == "sqlite":
+        chunks = iter_sqlite(config["db"]["sqlite"], chunksize)
+    else:
+        dtypes = dict(NUMERIC_DTYPES)
+        dtypes.update({column: 'category' for column in CATEGORICAL_COLUMNS})
+        chunks = pd.read_csv(config["db"]["csv"], encoding='utf-8',
+                             dtype=dtypes, chunksize=chunksize)
+    for chunk in chunks:
+        if tombstones:
+            chunk = chunk[~chunk['id'].isin(tombstones)]
+        yield apply_schema(chunk)
+    wal = get_wal()
+    wal.flush()
+    records = wal.read()
+    if records:
+        yield apply_schema(pd.DataFrame(records))
+
+
+# Future фоновой загрузки базы данных, создаётся при первом обращении
+_data_future = None
+_data_lock = threading.Lock()
+
+# DataFrame с текущим содержимым базы, куб агрегатов и пространственный
+# индекс по нему. Функции, изменяющие базу, заменяют DataFrame своим
+# результатом и обновляют куб и индекс, если им передан именно текущий
+# DataFrame. Номер версии увеличивается при каждом изменении базы
+_current = {'data': None, 'cube': None, 'spatial': None, 'version': 0}
+
+
+def _is_current(df):
+    """
+    Проверяет, является ли DataFrame текущим содержимым базы данных.
+    """
+    return df is not None and df is _current['data']
+
+
+def _replace_current(old, new, added=None, removed=None):
+    """
+    Делает new текущим содержимым базы, если old было текущим, и
+    учитывает изменения в кубе агрегатов и пространственном индексе.
+
+    Аргументы:
+        old (pd.DataFrame): DataFrame до изменения.
+        new (pd.DataFrame): DataFrame после изменения.
+        added (pd.DataFrame): Добавленные строки.
+        removed (pd.DataFrame): Удалённые строки.
+
+    Возвращает:
+        pd.DataFrame: new.
+    """
+    # куб и индекс читаются и фоновыми потоками интерфейса
+    with _storage_lock:
+        if _is_current(old):
+            _current['data'] = new
+            _new_version()
+            cube = _current['cube']
+            spatial = _current['spatial']
+            if cube is not None and added is not None:
+                cube.add(added)
+                spatial.add(added)
+            if cube is not None and removed is not None:
+                cube.remove(removed, new)
+                spatial.remove(removed)
+    return new
+
+
+def _set_current(df):
+    """
+    Делает df текущим содержимым базы и строит по нему куб агрегатов и
+    пространственный индекс.
+
+    Аргументы:
+        df (pd.DataFrame): Содержимое базы данных.
+    """
+    settings = read_config().get("neighbours", {})
+    cube = AggregateCube(df)
+    spatial = GridIndex(df, settings.get("cell_size", 1.0))
+    with _storage_lock:
+        _current['data'] = df
+        _current['cube'] = cube
+        _current['spatial'] = spatial
+
+
+def _new_version():
+    """
+    Увеличивает номер версии базы данных и очищает кэш результатов.
+    """
+    with _storage_lock:
+        _current['version'] += 1
+    get_result_cache().clear()
+
+
+# кэш сводных таблиц и отчетов, создаётся при первом обращении
+_result_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """
+    Возвращает кэш сводных таблиц и отчетов.
+
+    Размер кэша задаётся параметрами config["db"]["cache"]["max_entries"]
+    (количество результатов) и config["db"]["cache"]["max_bytes"] (объём
+    памяти в байтах).
+
+    Возвращает:
+        ResultCache: Кэш результатов.
+    """
+    global _result_cache
+    with _cache_lock:
+        if _result_cache is None:
+            settings = read_config()["db"].get("cache", {})
+            _result_cache = ResultCache(
+                settings.get("max_entries", 128),
+                settings.get("max_bytes", 64 * 1024 * 1024))
+        return _result_cache
+
+
+def cache_stats():
+    """
+    Возвращает статистику кэша сводных таблиц и отчетов.
+
+    Возвращает:
+        dict: Количество попаданий, промахов и вытеснений, доля попаданий,
+        количество записей и их объём (см. ResultCache.stats).
+    """
+    return get_result_cache().stats()
+
+
+def _cached(function):
+    """
+    Декоратор, который кэширует результат отчета по всей базе данных.
+
+    Результат кэшируется, только если первый аргумент равен None или
+    текущему содержимому базы. Ключ кэша - имя функции, номер версии базы
+    и остальные аргументы, поэтому после изменения базы отчет вычисляется
+    заново. Аргументы можно передавать и по именам: они сопоставляются с
+    параметрами функции, поэтому вызовы с позиционными и именованными
+    аргументами дают один ключ. Вызывающему возвращается копия
+    результата, чтобы её изменение не испортило кэш.
+    """
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        df, *arguments = bound.arguments.values()
+        if df is not None and not _is_current(df):
+            return function(*args, **kwargs)
+        key = (function.__name__, _current['version'], df is None) + \
+            tuple(tuple(arg) if isinstance(arg, list) else arg
+                  for arg in arguments)
+        cache = get_result_cache()
+        found, result = cache.get(key)
+        if not found:
+            result = function(*args, **kwargs)
+            cache.put(key, result)
+        return result.copy() if result is not None else None
+    return wrapper
+
+
+def _current_cube(df):
+    """
+    Возвращает куб агрегатов, если df - текущее содержимое базы или None
+    (вся база), а база уже загружена. Иначе возвращает None.
+    """
+    if df is None or _is_current(df):
+        return _current['cube']
+    return None
+
+
+def _load_data(future):
+    """
+    Читает базу данных и передаёт результат или ошибку в future.
+
+    Аргументы:
+        future (Future): Future, в который нужно записать результат.
+    """
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        _set_current(replay_wal(read_csv()))
+        future.set_result(_current['data'])
+    except BaseException as error:
+        future.set_exception(error)
+
+
+def load_data_async():
+    """
+    Запускает чтение базы данных в фоновом потоке и возвращает Future с
+    результатом.
+
+    База читается один раз: повторные вызовы возвращают тот же Future.
+    Записи, оставшиеся в журнале упреждающей записи после сбоя,
+    восстанавливаются (см. replay_wal).
+    Поток загрузки не мешает завершению программы.
+
+    Возвращает:
+        Future: Future, результатом которого будет pd.DataFrame.
+    """
+    global _data_future
+    with _data_lock:
+        if _data_future is None:
+            _data_future = Future()
+            threading.Thread(target=_load_data, args=(_data_future,),
+                             name='data-loader', daemon=True).start()
+        return _data_future
+
+
+def get_data():
+    """
+    Возвращает текущее содержимое базы данных, дожидаясь окончания
+    фоновой загрузки.
+
+    Возвращает:
+        pd.DataFrame: Содержимое базы данных с учётом изменений,
+        сделанных после загрузки.
+    """
+    load_data_async().result()
+    return _current['data']
+
+
+def _describe_from_cube(cube, df, quantitative_vars):
+    """
+    Создает отчет в формате describe() по кубу агрегатов.
+
+    Аргументы:
+        cube (AggregateCube): Куб агрегатов по df.
+        df (pd.DataFrame): Содержимое базы данных, по которому
+        вычисляются процентили.
+        quantitative_vars (list или str): Имена количественных столбцов.
+
+    Возвращает:
+        pd.DataFrame: Статистики в формате describe(). Если передано имя
+        одного столбца, возвращается pd.Series.
+    """
+    names = [quantitative_vars] if isinstance(quantitative_vars, str) \
+        else list(quantitative_vars)
+    table = {}
+    for name in names:
+        statistics = cube.describe(name)
+        quartiles = df[name].astype('float64').quantile([0.25, 0.5, 0.75])
+        table[name] = [statistics['count'], statistics['mean'],
+                       statistics['std'], statistics['min']] + \
+            list(quartiles) + [statistics['max']]
+    table = pd.DataFrame(table, index=['count', 'mean', 'std', 'min', '25%',
+                                       '50%', '75%', 'max'], dtype='float64')
+    if isinstance(quantitative_vars, str):
+        return table[quantitative_vars]
+    return table
+
+
+@_cached
 def pivot(data, values, column, index, aggfunc):
     """
     Создает и выводит сводную таблицу из DataFrame на основе указанных
@@ -102,37 +1289,134 @@ def pivot(data, values, column, index, aggfunc):
     Если указанный столбец не найден в DataFrame, выводит соответствующее
     сообщение.
 
+    Для всей базы (data равен None или текущему содержимому базы) функции
+    'count', 'sum', 'mean', 'std', 'min' и 'max' вычисляются свёрткой
+    куба агрегатов (см. модуль cube) без просмотра строк. Если куб ещё не
+    построен, в формате "sqlite" группировка выполняется запросом
+    GROUP BY в SQLite. Если data равен None в других форматах,
+    используется get_data().
+
+    Каждый из аргументов values, column, index и aggfunc может быть
+    списком. Тогда все сочетания вычисляются одной группировкой по
+    index и column, а столбцы сводной таблицы становятся иерархическими:
+    (атрибут, функция агрегации, значения column...). Уровни атрибута и
+    функции агрегации есть, только если они переданы списком, поэтому
+    при обычных аргументах таблица такая же, как у pd.pivot_table.
+
     Аргументы:
         data (pd.DataFrame): Исходный DataFrame, из которого будет создана
         сводная таблица.
-        values (str): Имя столбца, который используется для вычисления
-        агрегированных значений.
-        column (str): Имя столбца, который будет использоваться для создания
-        столбцов в сводной таблице.
-        index (str): Имя столбца, который будет использоваться для создания
-        индекса в сводной таблице.
-        aggfunc (function): Функция, которую нужно применить к значениям в
-        сводной таблице.
+        values (str или list): Имя столбца (или столбцов), который
+        используется для вычисления агрегированных значений.
+        column (str или list): Имя столбца (или столбцов), который будет
+        использоваться для создания столбцов в сводной таблице.
+        index (str или list): Имя столбца (или столбцов), который будет
+        использоваться для создания индекса в сводной таблице.
+        aggfunc (function или list): Функция (или функции), которую нужно
+        применить к значениям в сводной таблице.
 
     Возвращает:
         pd.DataFrame: Сводная таблица, созданная из исходного DataFrame.
                       Если указанный столбец не найден, возвращает None.
     """
-    if column in data.columns:
-        # создание сводной таблицы
-        pivot_table = pd.pivot_table(data, values=values, index=index,
-                                     columns=column, aggfunc=aggfunc)
+    measures, columns, indexes, aggfuncs = (
+        _as_list(argument) for argument in (values, column, index, aggfunc))
+    config = read_config()
+    pivot_table = None
+    with _storage_lock:
+        cube = _current_cube(data)
+        if cube is not None:
+            pivot_table = cube.pivot(measures, columns, indexes, aggfuncs)
+    if pivot_table is None and _backend(config) == "sqlite" and (
+            data is None or _is_current(data)) and \
+            not any(isinstance(argument, (list, tuple))
+                    for argument in (values, column, index, aggfunc)):
+        # запросы к SQLite должны видеть и записи из журнала
+        checkpoint()
+        pivot_table = pivot_sql(config["db"]["sqlite"], values, column,
+                                index, aggfunc)
+        if pivot_table is not None:
+            return pivot_table.reindex(
+                index=_schema_order(index, pivot_table.index),
+                columns=_schema_order(column, pivot_table.columns))
+    if pivot_table is None:
+        if data is None:
+            data = get_data()
+        if any(name not in data.columns for name in indexes + columns):
+            print("Столбец не найден в DataFrame")
+            return None
+        # создание сводной таблицы одной группировкой
+        pivot_table = data.groupby(indexes + columns, observed=True)[
+            measures].agg(aggfuncs)
+        if columns:
+            pivot_table = pivot_table.unstack(columns)
+    return _arrange_pivot(pivot_table, values, aggfunc, measures, aggfuncs)
 
-        # вывод заголовка отчета и сводной таблицы
-        return pivot_table
-    print("Столбец не найден в DataFrame")
 
+def _as_list(argument):
+    """
+    Возвращает аргумент в виде списка.
+    """
+    return list(argument) if isinstance(argument, (list, tuple)) \
+        else [argument]
+
+
+def _arrange_pivot(pivot_table, values, aggfunc, measures, aggfuncs):
+    """
+    Упорядочивает строки и столбцы сводной таблицы и убирает уровни
+    столбцов, которые не были заданы списком.
 
+    Значения качественных столбцов упорядочиваются как в схеме (см.
+    _schema_order), атрибуты и функции агрегации - в порядке, в котором
+    они переданы.
+
+    Аргументы:
+        pivot_table (pd.DataFrame): Сводная таблица со столбцами
+        (атрибут, функция агрегации, значения column...).
+        values (str или list): Аргумент values функции pivot.
+        aggfunc (function или list): Аргумент aggfunc функции pivot.
+        measures (list): Атрибуты.
+        aggfuncs (list): Функции агрегации.
+
+    Возвращает:
+        pd.DataFrame: Сводная таблица.
+    """
+    orders = {
+        'values': measures,
+        'aggfunc': [getattr(function, '__name__', function)
+                    for function in aggfuncs]
+    }
+
+    def key(level):
+        order = orders.get(level.name) or _schema_order(level.name,
+                                                         level.unique())
+        return pd.Index(order).get_indexer(level)
+
+    pivot_table = pivot_table.rename_axis(
+        ['values', 'aggfunc'] + pivot_table.columns.names[2:], axis=1)
+    pivot_table = pivot_table.sort_index(key=key).sort_index(axis=1,
+                                                             key=key)
+    if not isinstance(aggfunc, (list, tuple)) and \
+            pivot_table.columns.nlevels > 1:
+        pivot_table = pivot_table.droplevel('aggfunc', axis=1)
+    if not isinstance(values, (list, tuple)) and \
+            pivot_table.columns.nlevels > 1:
+        pivot_table = pivot_table.droplevel('values', axis=1)
+    return pivot_table
+
+
+@_cached
 def qual_var_text_report(df, qualitative_var):
     """
     Создает текстовый отчет для качественной переменной из переданного
     DataFrame.
 
+    Если df равен None, отчет строится по всей базе данных, которая
+    читается частями (см. iter_chunks и модуль streaming), поэтому
+    база может не помещаться в память. В формате "sqlite" частоты
+    считаются запросом GROUP BY в SQLite. Если база уже загружена, частоты
+    для всей базы берутся из куба агрегатов (см. модуль cube).
+
     Параметры:
     df (pandas.DataFrame): DataFrame, который содержит качественную переменную.
     qualitative_var (str): Имя столбца в df, который представляет качественную
@@ -146,20 +1430,39 @@ def qual_var_text_report(df, qualitative_var):
     Процент показывает процентное соотношение, которое каждое уникальное
     значение составляет от общего числа.
     """
-    if qualitative_var in df.columns:
+    config = read_config()
+    counts = None
+    with _storage_lock:
+        cube = _current_cube(df)
+        if cube is not None and qualitative_var in CATEGORICAL_COLUMNS:
+            counts = cube.counts(qualitative_var)
+    if counts is not None:
+        counts = counts.reindex(_schema_order(qualitative_var, counts.index))
+        counts = counts[counts > 0].sort_values(ascending=False,
+                                                kind='stable')
+    elif _backend(config) == "sqlite" and (df is None or _is_current(df)):
+        checkpoint()
+        return qual_var_report_sql(config["db"]["sqlite"], qualitative_var)
+    elif df is None:
+        return qual_var_stream_report(iter_chunks(), qualitative_var)
+    elif qualitative_var in df.columns:
         counts = df[qualitative_var].value_counts()
-        percentages = df[qualitative_var].value_counts(normalize=True) * 100
-        table = pd.DataFrame({
-            'Значение': counts.index,
-            'Частоты': counts.values,
-            'Процент': percentages.values
-        })
-        return table
+        # у категориальных столбцов value_counts учитывает и значения из
+        # схемы, которые не встречаются в данных
+        counts = counts[counts > 0]
     else:
         return pd.DataFrame()
     # Возвращает пустой DataFrame, если заданной колонки не существует
+    percentages = counts / counts.sum() * 100
+    table = pd.DataFrame({
+        'Значение': counts.index,
+        'Частоты': counts.values,
+        'Процент': percentages.values
+    })
+    return table
 
 
+@_cached
 def quantitive_text_report(df, quantitative_vars):
     """
     Создает текстовый отчет для количественных переменных из переданного
@@ -176,7 +1479,316 @@ def quantitive_text_report(df, quantitative_vars):
     (минимум, максимум, среднее,
     стандартное отклонение и т.д.) для каждой из количественных переменных.
 
-    Использует метод describe() для создания отчета.
+    Использует метод describe() для создания отчета. Столбцы хранятся в
+    float32, но статистики считаются в float64.
+
+    Если df равен None, отчет строится по всей базе данных, которая
+    читается частями (см. iter_chunks и модуль streaming). В этом режиме
+    процентили вычисляются приближённо. В формате "sqlite" статистики
+    считаются агрегатными запросами SQLite.
+
+    Если база уже загружена, количество, среднее, отклонение, минимум и
+    максимум для всей базы берутся из куба агрегатов (см. модуль cube),
+    и по строкам вычисляются только процентили.
+    """
+    config = read_config()
+    with _storage_lock:
+        cube = _current_cube(df)
+        if cube is not None:
+            return _describe_from_cube(cube, _current['data'],
+                                       quantitative_vars)
+    if _backend(config) == "sqlite" and (df is None or _is_current(df)):
+        checkpoint()
+        return quantitive_report_sql(config["db"]["sqlite"],
+                                     quantitative_vars)
+    if df is None:
+        return quantitive_stream_report(iter_chunks(), quantitative_vars)
+    table = df[quantitative_vars].astype('float64').describe()
+    return table
+
+
+def progressive_qual_var_text_report(df, qualitative_var):
+    """
+    Создает уточняющийся приближённый отчет для качественной переменной.
+
+    Отчет строится по растущей случайной выборке из df (или из всей базы,
+    если df равен None) с параметрами config["progressive"] (см. модуль
+    progressive).
+
+    Параметры:
+    df (pandas.DataFrame): DataFrame, который содержит качественную
+    переменную.
+    qualitative_var (str): Имя качественного столбца.
+
+    Возвращает:
+    generator: Четвёрки (таблица как у qual_var_text_report, погрешности
+    процентов, размер выборки, размер базы).
+    """
+    if df is None:
+        df = get_data()
+    return qual_var_progressive_report(df, qualitative_var,
+                                       read_config().get("progressive"))
+
+
+def progressive_quantitive_text_report(df, quantitative_vars):
+    """
+    Создает уточняющийся приближённый отчет для количественных
+    переменных.
+
+    Отчет строится по растущей случайной выборке из df (или из всей базы,
+    если df равен None) с параметрами config["progressive"] (см. модуль
+    progressive).
+
+    Параметры:
+    df (pandas.DataFrame): DataFrame, который содержит количественные
+    переменные.
+    quantitative_vars (list или str): Имена количественных столбцов.
+
+    Возвращает:
+    generator: Четвёрки (статистики как у quantitive_text_report,
+    погрешности, размер выборки, размер базы).
+    """
+    if df is None:
+        df = get_data()
+    return quantitive_progressive_report(df, quantitative_vars,
+                                         read_config().get("progressive"))
+
+
+def progressive_pivot(data, values, column, index, aggfunc):
+    """
+    Создает уточняющуюся приближённую сводную таблицу.
+
+    Таблица строится по растущей случайной выборке из data (или из всей
+    базы, если data равен None) с параметрами config["progressive"] (см.
+    модуль progressive). Строки и столбцы упорядочиваются как в схеме.
+
+    Аргументы:
+        data (pd.DataFrame): Исходный DataFrame.
+        values (str): Количественный столбец.
+        column (str): Столбец, значения которого становятся столбцами
+        сводной таблицы.
+        index (str): Столбец, значения которого становятся строками
+        сводной таблицы.
+        aggfunc (str): Функция агрегации.
+
+    Возвращает:
+        generator: Четвёрки (сводная таблица, погрешности, размер выборки,
+        размер базы).
+    """
+    if data is None:
+        data = get_data()
+    for table, errors, sample, total in pivot_progressive(
+            data, values, column, index, aggfunc,
+            read_config().get("progressive")):
+        rows = _schema_order(index, table.index)
+        columns = _schema_order(column, table.columns)
+        yield table.reindex(index=rows, columns=columns), \
+            errors.reindex(index=rows, columns=columns), sample, total
+
+
+@_cached
+def association_report(df, matrix=True):
     """
-    table = df[quantitative_vars].describe()
+    Вычисляет связь всех пар качественных атрибутов.
+
+    Для каждой пары атрибутов строится таблица сопряжённости и
+    вычисляются статистика хи-квадрат и V Крамера (см. модуль
+    association). Результат для всей базы кэшируется до её изменения.
+
+    Параметры:
+    df (pandas.DataFrame): DataFrame с качественными атрибутами. Если
+    равен None, используется вся база данных.
+    matrix (bool): Вернуть матрицу V Крамера (True) или таблицу
+    статистик по парам (False).
+
+    Возвращает:
+    pandas.DataFrame: Матрица V Крамера с первым столбцом 'Атрибут' или
+    таблица статистик по парам атрибутов.
+    """
+    if df is None:
+        df = get_data()
+    columns = list(CATEGORICAL_COLUMNS)
+    table = association_table(df, columns)
+    if not matrix:
+        return table
+    return association_matrix(table, columns).rename_axis(
+        'Атрибут').reset_index()
+
+
+@_cached
+def histogram_table(df, qual_attr, quant_attr, bins=10):
+    """
+    Подсчитывает частоты гистограммы количественного атрибута для всех
+    значений качественного атрибута.
+
+    Интервалы общие для всех значений, а частоты вычисляются за один
+    проход по базе (см. модуль binning). Результат для всей базы
+    кэшируется до её изменения.
+
+    Параметры:
+    df (pandas.DataFrame): Исходный DataFrame. Если равен None,
+    используется вся база данных.
+    qual_attr (str): Качественный атрибут.
+    quant_attr (str): Количественный атрибут.
+    bins (int): Количество интервалов.
+
+    Возвращает:
+    pandas.DataFrame: По строке на интервал со столбцами 'Начало' и
+    'Конец' и частотами значений качественного атрибута (в порядке схемы).
+    """
+    if df is None:
+        df = get_data()
+    codes, categories = category_codes(df[qual_attr])
+    counts, edges = histogram_counts(
+        df[quant_attr].to_numpy(dtype='float64'), codes, len(categories),
+        bins)
+    table = pd.DataFrame(counts.T, columns=pd.Index(categories))
+    table = table[list(_schema_order(qual_attr, categories))]
+    table.columns = list(table.columns)
+    table.insert(0, 'Конец', edges[1:])
+    table.insert(0, 'Начало', edges[:-1])
     return table
+
+
+def bootstrap_pivot(data, values, column, index, aggfunc):
+    """
+    Создает сводную таблицу с доверительными интервалами для каждой
+    ячейки.
+
+    Интервалы строятся бутстрепом по data (или по всей базе, если data
+    равен None) с параметрами config["bootstrap"] (см. модуль bootstrap).
+    Строки и столбцы упорядочиваются как в схеме.
+
+    Аргументы:
+        data (pd.DataFrame): Исходный DataFrame.
+        values (str): Количественный столбец.
+        column (str): Столбец, значения которого становятся столбцами
+        сводной таблицы.
+        index (str): Столбец, значения которого становятся строками
+        сводной таблицы.
+        aggfunc (str): Функция агрегации.
+
+    Возвращает:
+        tuple: Сводная таблица, нижние и верхние границы интервалов.
+    """
+    if data is None:
+        data = get_data()
+    tables = pivot_bootstrap(data, values, column, index, aggfunc,
+                             read_config().get("bootstrap"))
+    rows = _schema_order(index, tables[0].index)
+    columns = _schema_order(column, tables[0].columns)
+    return tuple(table.reindex(index=rows, columns=columns)
+                 for table in tables)
+
+
+def similar_respondents(point, exclude=()):
+    """
+    Находит респондентов с ближайшими координатами и распределение их по
+    университетам и направлениям.
+
+    Поиск выполняется по пространственному индексу текущего содержимого
+    базы (см. модуль spatial), без просмотра всех записей. Количество
+    соседей задаётся параметром config["neighbours"]["k"].
+
+    Аргументы:
+        point (tuple): Координаты (x, y, z).
+        exclude (iterable): Id записей, которые не нужно учитывать
+        (например, самого респондента).
+
+    Возвращает:
+        tuple: Соседи (pd.DataFrame со столбцами id, x, y, z, university,
+        field и distance) и распределение соседей (pd.DataFrame со
+        столбцами 'Атрибут', 'Значение', 'Частоты' и 'Процент').
+    """
+    get_data()
+    k = read_config().get("neighbours", {}).get("k", 50)
+    with _storage_lock:
+        neighbours = _current['spatial'].nearest(point, k, exclude)
+    tables = []
+    for name in ['university', 'field']:
+        counts = neighbours[name].value_counts()
+        tables.append(pd.DataFrame({
+            'Атрибут': name,
+            'Значение': counts.index,
+            'Частоты': counts.values,
+            'Процент': counts.values / max(len(neighbours), 1) * 100
+        }))
+    return neighbours, pd.concat(tables, ignore_index=True)
+
+
+def cluster_respondents(df, k=None):
+    """
+    Разбивает респондентов на кластеры по координатам x, y, z.
+
+    Кластеризация выполняется методом k-средних на мини-выборках с
+    несколькими параллельными запусками (см. модуль clustering) с
+    параметрами config["clustering"]. Координаты записываются по частям во
+    временный файл, который процессы кластеризации отображают в память,
+    поэтому отдельный массив всех координат не создаётся. Затем данные
+    просматриваются второй раз: записи каждой части относятся к
+    ближайшим центрам, и таблица сопряжённости накапливается по частям.
+    Поэтому ни координаты, ни номера кластеров, ни атрибуты всех записей
+    одновременно в памяти не хранятся. Записи с пропущенными координатами
+    не учитываются.
+
+    Аргументы:
+        df (pd.DataFrame): Исходный DataFrame. Если равен None, база данных
+        читается частями (см. iter_chunks) и целиком в память не
+        загружается.
+        k (int): Количество кластеров. По умолчанию
+        config["clustering"]["k"].
+
+    Возвращает:
+        tuple: Кластеры (pd.DataFrame со столбцами 'Кластер', 'x', 'y',
+        'z', 'Размер' и 'Процент') и таблица сопряжённости (pd.DataFrame со
+        столбцами 'Атрибут', 'Значение' и количеством респондентов каждого
+        кластера).
+    """
+    settings = dict(read_config().get("clustering", {}))
+    if k is not None:
+        settings['k'] = k
+    axes = ['x', 'y', 'z']
+    chunksize = settings.get('chunksize', 100000)
+
+    def chunks():
+        if df is None:
+            return iter_chunks(chunksize)
+        return (df.iloc[start:start + chunksize]
+                for start in range(0, len(df), chunksize))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'points.bin')
+        count = write_points((chunk[axes].to_numpy(dtype='float64')
+                              for chunk in chunks()), path)
+        centroids, sizes, _ = cluster_points(path, settings)
+
+    names = [f"Кластер {number + 1}" for number in range(len(centroids))]
+    clusters = pd.DataFrame(centroids, columns=axes)
+    clusters.insert(0, 'Кластер', names)
+    clusters['Размер'] = sizes
+    clusters['Процент'] = sizes / max(count, 1) * 100
+
+    # количества записей по значениям атрибутов и кластерам, по частям
+    counts = {name: [] for name in CATEGORICAL_COLUMNS}
+    for chunk in chunks():
+        chunk = chunk[chunk[axes].notna().all(axis=1)]
+        if not len(chunk):
+            continue
+        labels, _ = assign(chunk[axes].to_numpy(dtype='float64'), centroids,
+                           chunksize)
+        labels = pd.Categorical.from_codes(labels, names)
+        for name in CATEGORICAL_COLUMNS:
+            counts[name].append(pd.crosstab(chunk[name].to_numpy(), labels,
+                                            dropna=False))
+
+    tables = []
+    for name in CATEGORICAL_COLUMNS:
+        table = pd.concat(counts[name]).groupby(level=0).sum() \
+            if counts[name] else pd.DataFrame(columns=names)
+        table = table.reindex(index=_schema_order(name, table.index),
+                              columns=names, fill_value=0)
+        table = table.rename_axis(index=None, columns=None)
+        table.insert(0, 'Значение', table.index)
+        table.insert(0, 'Атрибут', name)
+        tables.append(table.reset_index(drop=True))
+    return clusters, pd.concat(tables, ignore_index=True)
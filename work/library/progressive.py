@@ -0,0 +1,251 @@
+"""
+Прогрессивные приближённые отчеты для приложения "Политические
+координаты"
+
+Отчет сначала строится по небольшой случайной выборке из базы, а затем
+уточняется по выборкам, каждая из которых вдвое больше предыдущей и
+включает её. Вместе с каждым приближением возвращаются половины ширины
+доверительных интервалов (погрешности) для средних, сумм, количеств и
+процентов. Для выборки без возвращения учитывается поправка на конечность
+совокупности, поэтому на всей базе погрешности равны нулю, а результат
+совпадает с точным отчетом.
+
+Уточнение прекращается, когда погрешности становятся не больше заданных
+или когда выборка охватывает всю базу.
+
+quantitive_progressive_report(df, quantitative_vars, settings):
+Уточняющийся отчет для количественных переменных.
+
+qual_var_progressive_report(df, qualitative_var, settings): Уточняющийся
+отчет для качественной переменной.
+
+pivot_progressive(df, values, column, index, aggfunc, settings):
+Уточняющаяся сводная таблица.
+"""
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# параметры по умолчанию, см. config["progressive"]
+DEFAULT_SETTINGS = {
+    'initial_sample': 1000,
+    'confidence': 0.95,
+    'mean_precision': 0.05,
+    'percent_precision': 0.5,
+    'relative_precision': 0.05,
+    'seed': 0
+}
+
+
+def _settings(settings):
+    """
+    Дополняет параметры значениями по умолчанию.
+    """
+    return {**DEFAULT_SETTINGS, **(settings or {})}
+
+
+def _z(confidence):
+    """
+    Возвращает квантиль нормального распределения для двустороннего
+    доверительного интервала с уровнем confidence.
+    """
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def _fpc(sample, total):
+    """
+    Поправка на конечность совокупности для выборки без возвращения.
+
+    Аргументы:
+        sample: Размер выборки (число или массив).
+        total: Размер совокупности (число или массив).
+    """
+    sample = np.asarray(sample, dtype='float64')
+    total = np.maximum(np.asarray(total, dtype='float64'), sample)
+    return np.sqrt(np.clip((total - sample) / np.maximum(total - 1, 1),
+                           0, 1))
+
+
+def _progressive(df, compute, settings):
+    """
+    Строит результаты по растущим случайным выборкам из df.
+
+    Аргументы:
+        df (pd.DataFrame): Содержимое базы данных.
+        compute (function): Функция (выборка, размер базы) ->
+        (результат, погрешности, достигнута ли точность).
+        settings (dict): Параметры (см. DEFAULT_SETTINGS).
+
+    Возвращает:
+        generator: Четвёрки (результат, погрешности, размер выборки,
+        размер базы).
+    """
+    total = len(df)
+    order = np.random.default_rng(settings['seed']).permutation(total)
+    size = min(settings['initial_sample'], total)
+    while True:
+        sample = df.iloc[np.sort(order[:size])]
+        result, errors, converged = compute(sample, total)
+        yield result, errors, size, total
+        if converged or size >= total:
+            return
+        size = min(size * 2, total)
+
+
+def quantitive_progressive_report(df, quantitative_vars, settings=None):
+    """
+    Уточняющийся отчет для количественных переменных.
+
+    Статистики вычисляются по выборке в формате describe(); количество
+    пересчитывается на всю базу. Погрешность указывается для среднего.
+    Уточнение прекращается, когда погрешности средних не больше
+    settings['mean_precision'].
+
+    Аргументы:
+        df (pd.DataFrame): Содержимое базы данных.
+        quantitative_vars (list или str): Имена количественных столбцов.
+        settings (dict): Параметры (см. DEFAULT_SETTINGS).
+
+    Возвращает:
+        generator: Четвёрки (статистики, погрешности, размер выборки,
+        размер базы). Статистики и погрешности - pd.DataFrame в формате
+        describe() или pd.Series, если передано имя одного столбца.
+    """
+    settings = _settings(settings)
+    z = _z(settings['confidence'])
+    names = [quantitative_vars] if isinstance(quantitative_vars, str) \
+        else list(quantitative_vars)
+
+    def compute(sample, total):
+        table = sample[names].astype('float64').describe()
+        count = table.loc['count']
+        # число непустых значений во всей базе оценивается по выборке
+        total_count = count * total / max(len(sample), 1)
+        mean_errors = z * table.loc['std'] / np.sqrt(count) * \
+            _fpc(count, total_count)
+        # по одному значению отклонение не оценить
+        mean_errors = mean_errors.where(
+            count > 1, 0 if len(sample) >= total else np.inf)
+        errors = pd.DataFrame(np.nan, index=table.index, columns=names)
+        errors.loc['mean'] = mean_errors
+        table.loc['count'] = total_count.round()
+        converged = bool((errors.loc['mean'] <=
+                          settings['mean_precision']).all())
+        if isinstance(quantitative_vars, str):
+            return table[quantitative_vars], errors[quantitative_vars], \
+                converged
+        return table, errors, converged
+
+    return _progressive(df, compute, settings)
+
+
+def qual_var_progressive_report(df, qualitative_var, settings=None):
+    """
+    Уточняющийся отчет для качественной переменной.
+
+    Проценты вычисляются по выборке, частоты пересчитываются на всю базу.
+    Погрешности указываются в процентных пунктах. Уточнение прекращается,
+    когда все погрешности не больше settings['percent_precision'].
+
+    Аргументы:
+        df (pd.DataFrame): Содержимое базы данных.
+        qualitative_var (str): Имя качественного столбца.
+        settings (dict): Параметры (см. DEFAULT_SETTINGS).
+
+    Возвращает:
+        generator: Четвёрки (таблица со столбцами 'Значение', 'Частоты' и
+        'Процент', погрешности процентов (pd.Series), размер выборки,
+        размер базы).
+    """
+    settings = _settings(settings)
+    z = _z(settings['confidence'])
+
+    def compute(sample, total):
+        values = sample[qualitative_var]
+        counts = values.value_counts()
+        counts = counts[counts > 0]
+        size = int(counts.sum())
+        share = counts / max(size, 1)
+        total_size = size * total / max(len(sample), 1)
+        errors = z * np.sqrt(share * (1 - share) / max(size, 1)) * \
+            _fpc(size, total_size) * 100
+        table = pd.DataFrame({
+            'Значение': counts.index,
+            'Частоты': (share * total_size).round().astype('int64').values,
+            'Процент': (share * 100).values
+        })
+        errors = pd.Series(errors.values, name='Погрешность')
+        converged = bool((errors <= settings['percent_precision']).all())
+        return table, errors, converged
+
+    return _progressive(df, compute, settings)
+
+
+def pivot_progressive(df, values, column, index, aggfunc, settings=None):
+    """
+    Уточняющаяся сводная таблица.
+
+    Для 'mean' погрешность среднего вычисляется по значениям ячейки, для
+    'sum' и 'count' сумма и количество пересчитываются на всю базу, а их
+    погрешности вычисляются как для среднего по всей выборке величины,
+    равной значению (или 1) в строках ячейки и 0 в остальных строках.
+    Для других функций агрегации погрешности не вычисляются, и таблица
+    уточняется до всей базы.
+
+    Уточнение прекращается, когда погрешности средних не больше
+    settings['mean_precision'], а отношения погрешностей сумм и
+    количеств к их значениям не больше settings['relative_precision'].
+
+    Аргументы:
+        df (pd.DataFrame): Содержимое базы данных.
+        values (str): Количественный столбец.
+        column (str): Столбец, значения которого становятся столбцами
+        сводной таблицы.
+        index (str): Столбец, значения которого становятся строками
+        сводной таблицы.
+        aggfunc (str): Функция агрегации.
+        settings (dict): Параметры (см. DEFAULT_SETTINGS).
+
+    Возвращает:
+        generator: Четвёрки (сводная таблица, погрешности (pd.DataFrame той
+        же формы), размер выборки, размер базы).
+    """
+    settings = _settings(settings)
+    z = _z(settings['confidence'])
+
+    def compute(sample, total):
+        measure = sample[values].astype('float64')
+        grouped = measure.groupby([sample[index], sample[column]],
+                                  observed=True)
+        size = len(sample)
+        full = size >= total
+        if aggfunc == 'mean':
+            count = grouped.count()
+            result = grouped.mean()
+            errors = z * grouped.std() / np.sqrt(count) * \
+                _fpc(count, count * total / size)
+            # по одному значению отклонение не оценить
+            errors = errors.where(count > 1, 0 if full else np.inf)
+            converged = bool((errors <= settings['mean_precision']).all())
+        elif aggfunc in ('sum', 'count'):
+            cell = measure.notna().astype('float64') \
+                if aggfunc == 'count' else measure
+            sums = cell.groupby([sample[index], sample[column]],
+                                observed=True).sum()
+            squares = (cell ** 2).groupby([sample[index], sample[column]],
+                                          observed=True).sum()
+            mean = sums / size
+            variance = (squares / size - mean ** 2) * size / max(size - 1, 1)
+            result = mean * total
+            errors = z * total * np.sqrt(variance.clip(lower=0) / size) * \
+                _fpc(size, total)
+            converged = bool((errors <= settings['relative_precision'] *
+                              result.abs()).all())
+        else:
+            result = grouped.agg(aggfunc)
+            errors = pd.Series(np.nan, index=result.index)
+            converged = False
+        return result.unstack(column), errors.unstack(column), converged
+
+    return _progressive(df, compute, settings)
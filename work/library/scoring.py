@@ -0,0 +1,144 @@
+"""
+Подсчёт результатов теста для приложения "Политические координаты"
+
+Банк вопросов из config["questions"] преобразуется в матрицу весов
+размером (вопросы x 3): вес вопроса равен +1 или -1 в столбце его оси
+(x, y или z) и 0 в остальных столбцах. Варианты ответов из
+config["options"] преобразуются в таблицу баллов, а ответы кодируются
+номерами вариантов. Тогда координаты N респондентов вычисляются одним
+матричным умножением: баллы[ответы] @ веса.
+
+NO_ANSWER - Код пропущенного ответа. Пропущенный ответ даёт 0 баллов.
+ScoringEngine - Класс для подсчёта координат по ответам на вопросы.
+bank_engine(bank, questions, options): Создает ScoringEngine для ответов,
+записанных для другого банка вопросов (см. модуль answers).
+"""
+import numpy as np
+
+AXES = ['x', 'y', 'z']
+
+# код пропущенного ответа; указывает на последний элемент таблицы баллов,
+# который всегда равен 0
+NO_ANSWER = -1
+
+
+def compile_questions(questions):
+    """
+    Преобразует банк вопросов в матрицу весов.
+
+    Аргументы:
+        questions (list): Вопросы в формате config["questions"]: словари с
+        ключами 'question' и 'axis', где 'axis' - одно из "x+", "x-",
+        "y+", "y-", "z+", "z-". Вопрос, у которого 'axis' равен None, не
+        влияет на результат.
+
+    Возвращает:
+        np.ndarray: Матрица весов размером (количество вопросов, 3).
+    """
+    weights = np.zeros((len(questions), len(AXES)))
+    for number, question in enumerate(questions):
+        axis = question["axis"]
+        if axis is None:
+            continue
+        if len(axis) != 2 or axis[0] not in AXES or axis[1] not in '+-':
+            raise ValueError(f"Неизвестная ось вопроса: {axis}")
+        weights[number, AXES.index(axis[0])] = 1 if axis[1] == '+' else -1
+    return weights
+
+
+def compile_options(options):
+    """
+    Преобразует варианты ответов в таблицу баллов.
+
+    Аргументы:
+        options (dict): Баллы по вариантам ответов в формате
+        config["options"].
+
+    Возвращает:
+        tuple: Список вариантов ответов (номер варианта - его код) и
+        таблица баллов (np.ndarray), в конце которой стоит 0 для кода
+        NO_ANSWER.
+    """
+    names = list(options)
+    points = np.array([options[name] for name in names] + [0],
+                      dtype='float64')
+    return names, points
+
+
+class ScoringEngine:
+    """
+    Класс для подсчёта координат по ответам на вопросы.
+
+    Ответы передаются кодами вариантов (см. encode): одна строка кодов на
+    респондента, один столбец на вопрос в порядке банка вопросов.
+    """
+
+    def __init__(self, questions, options):
+        """
+        Аргументы:
+            questions (list): Вопросы в формате config["questions"].
+            options (dict): Баллы по вариантам ответов в формате
+            config["options"].
+        """
+        self.weights = compile_questions(questions)
+        self.names, self.points = compile_options(options)
+        self._codes = {name: code for code, name in enumerate(self.names)}
+
+    def encode(self, answers):
+        """
+        Кодирует ответы номерами вариантов.
+
+        Аргументы:
+            answers (list): Тексты выбранных вариантов по вопросам. Пустые
+            и неизвестные ответы кодируются как NO_ANSWER.
+
+        Возвращает:
+            np.ndarray: Коды ответов (int8).
+        """
+        return np.array([self._codes.get(answer, NO_ANSWER)
+                         for answer in answers], dtype='int8')
+
+    def score(self, codes):
+        """
+        Вычисляет координаты по кодам ответов.
+
+        Аргументы:
+            codes (np.ndarray): Коды ответов размером (количество
+            вопросов,) для одного респондента или (N, количество вопросов)
+            для N респондентов.
+
+        Возвращает:
+            np.ndarray: Координаты x, y, z размером (3,) или (N, 3).
+        """
+        codes = np.asarray(codes)
+        if codes.shape[-1] != len(self.weights):
+            raise ValueError(f"Ожидалось ответов: {len(self.weights)}, "
+                             f"получено: {codes.shape[-1]}")
+        return self.points[codes] @ self.weights
+
+
+def bank_engine(bank, questions, options):
+    """
+    Создает ScoringEngine для ответов, записанных для другого банка
+    вопросов, с осями и баллами из текущих настроек.
+
+    Столбцы кодов остаются в порядке вопросов банка, а коды - в порядке
+    его вариантов ответов. Вопросы сопоставляются по тексту: вопросы
+    банка, которых больше нет в questions, не влияют на результат, как и
+    варианты ответов, которых нет в options.
+
+    Аргументы:
+        bank (dict): Описание банка вопросов с ключами 'questions' (тексты
+        вопросов) и 'options' (тексты вариантов ответов).
+        questions (list): Вопросы в формате config["questions"].
+        options (dict): Баллы по вариантам ответов в формате
+        config["options"].
+
+    Возвращает:
+        ScoringEngine: Движок подсчёта для кодов банка.
+    """
+    axes = {question["question"]: question["axis"] for question in questions}
+    return ScoringEngine(
+        [{'question': text, 'axis': axes.get(text)}
+         for text in bank['questions']],
+        {name: options.get(name, 0) for name in bank['options']})
@@ -0,0 +1,224 @@
+"""
+Пространственный индекс для приложения "Политические координаты"
+
+Точки (x, y, z) респондентов раскладываются по ячейкам равномерной
+кубической сетки. Точки упорядочены по номерам ячеек, поэтому точки одной
+ячейки лежат подряд, и для каждой ячейки известны начало и конец её
+отрезка. Поиск ближайших соседей просматривает ячейки слоями вокруг ячейки
+запроса и останавливается, как только следующий слой не может содержать
+точку ближе уже найденных, поэтому не требует просмотра всей базы.
+
+Добавленные записи попадают в небольшой список, который просматривается
+целиком, а удалённые - в множество исключённых id. Когда их становится
+много, индекс перестраивается.
+
+GridIndex - Класс пространственного индекса на равномерной сетке.
+"""
+import numpy as np
+import pandas as pd
+
+AXES = ['x', 'y', 'z']
+
+# смещение и основание для упаковки номеров ячеек по трём осям в одно
+# число int64
+_OFFSET = 2 ** 20
+_BASE = 2 ** 21
+
+
+class GridIndex:
+    """
+    Класс пространственного индекса на равномерной сетке.
+    """
+
+    def __init__(self, df, cell_size=1.0, attributes=('university', 'field'),
+                 rebuild_ratio=0.05):
+        """
+        Строит индекс по содержимому базы данных.
+
+        Аргументы:
+            df (pd.DataFrame): Содержимое базы данных.
+            cell_size (float): Длина ребра ячейки сетки.
+            attributes (tuple): Столбцы, значения которых хранятся в
+            индексе вместе с точками и возвращаются вместе с соседями.
+            rebuild_ratio (float): Доля добавленных и удалённых записей
+            от размера индекса, после которой индекс перестраивается.
+        """
+        self.cell_size = cell_size
+        self.attributes = list(attributes)
+        self.rebuild_ratio = rebuild_ratio
+        self._build(df['id'].to_numpy(dtype='int64'),
+                    df[AXES].to_numpy(dtype='float64'),
+                    {name: df[name].to_numpy(dtype=object)
+                     for name in self.attributes})
+
+    def _cells(self, points):
+        """
+        Возвращает номера ячеек точек по каждой оси.
+        """
+        return np.floor(points / self.cell_size).astype('int64')
+
+    @staticmethod
+    def _keys(cells):
+        """
+        Упаковывает номера ячеек по трём осям в одно число.
+        """
+        cells = cells + _OFFSET
+        return (cells[..., 0] * _BASE + cells[..., 1]) * _BASE + cells[..., 2]
+
+    def _build(self, ids, points, attributes):
+        """
+        Раскладывает точки по ячейкам сетки.
+
+        Аргументы:
+            ids (np.ndarray): Id записей.
+            points (np.ndarray): Координаты размером (N, 3).
+            attributes (dict): Значения хранимых столбцов по именам.
+        """
+        valid = ~np.isnan(points).any(axis=1)
+        keys = self._keys(self._cells(points[valid]))
+        order = np.argsort(keys, kind='stable')
+        self._ids = ids[valid][order]
+        self._points = points[valid][order]
+        self._attributes = {name: values[valid][order]
+                            for name, values in attributes.items()}
+        self._cell_keys, self._starts = np.unique(keys[order],
+                                                  return_index=True)
+        self._ends = np.append(self._starts[1:], len(self._ids))
+        cells = self._cells(self._points)
+        self._low = cells.min(axis=0) if len(cells) else np.zeros(3, 'int64')
+        self._high = cells.max(axis=0) if len(cells) else np.zeros(3,
+                                                                   'int64')
+        self._pending = []
+        self._deleted = set()
+
+    def __len__(self):
+        return len(self._ids) + len(self._pending) - len(self._deleted)
+
+    def add(self, rows):
+        """
+        Добавляет записи в индекс.
+
+        Аргументы:
+            rows (pd.DataFrame): Добавленные записи.
+        """
+        for row in rows[['id'] + AXES + self.attributes].itertuples(
+                index=False):
+            self._pending.append((int(row[0]),
+                                  np.array(row[1:4], dtype='float64'),
+                                  tuple(row[4:])))
+        self._maybe_rebuild()
+
+    def remove(self, rows):
+        """
+        Удаляет записи из индекса.
+
+        Аргументы:
+            rows (pd.DataFrame): Удалённые записи.
+        """
+        removed = set(rows['id'].astype('int64').tolist())
+        pending = {item[0] for item in self._pending}
+        self._pending = [item for item in self._pending
+                         if item[0] not in removed]
+        self._deleted |= removed - pending
+        self._maybe_rebuild()
+
+    def _maybe_rebuild(self):
+        """
+        Перестраивает индекс, если добавленных и удалённых записей стало
+        больше rebuild_ratio от его размера.
+        """
+        changes = len(self._pending) + len(self._deleted)
+        if changes <= max(1000, self.rebuild_ratio * len(self._ids)):
+            return
+        keep = ~np.isin(self._ids, list(self._deleted))
+        ids = [self._ids[keep]]
+        points = [self._points[keep]]
+        attributes = {name: [values[keep]]
+                      for name, values in self._attributes.items()}
+        if self._pending:
+            ids.append(np.array([item[0] for item in self._pending]))
+            points.append(np.array([item[1] for item in self._pending]))
+            for number, name in enumerate(self.attributes):
+                column = np.empty(len(self._pending), dtype=object)
+                column[:] = [item[2][number] for item in self._pending]
+                attributes[name].append(column)
+        self._build(np.concatenate(ids), np.concatenate(points),
+                    {name: np.concatenate(values)
+                     for name, values in attributes.items()})
+
+    def _shell(self, center, radius):
+        """
+        Возвращает ячейки, удалённые от center ровно на radius ячеек по
+        максимальной из осей, в пределах занятой точками области.
+        """
+        offsets = np.arange(-radius, radius + 1)
+        grid = np.stack(np.meshgrid(offsets, offsets, offsets,
+                                    indexing='ij'), axis=-1).reshape(-1, 3)
+        grid = grid[np.abs(grid).max(axis=1) == radius]
+        cells = center + grid
+        inside = ((cells >= self._low) & (cells <= self._high)).all(axis=1)
+        return cells[inside]
+
+    def nearest(self, point, k, exclude=()):
+        """
+        Находит k ближайших к точке записей.
+
+        Аргументы:
+            point (tuple): Координаты (x, y, z).
+            k (int): Количество соседей.
+            exclude (iterable): Id записей, которые не нужно возвращать
+            (например, самого респондента).
+
+        Возвращает:
+            pd.DataFrame: Соседи, упорядоченные по расстоянию, со
+            столбцами id, x, y, z, хранимыми столбцами и 'distance'.
+        """
+        point = np.asarray(point, dtype='float64')
+        excluded = set(exclude)
+        # удалённые id относятся только к точкам, собранным при построении:
+        # добавленная позже запись может получить id удалённой
+        skipped = self._deleted | excluded
+        center = self._cells(point)
+        found = []
+
+        # добавленные после построения записи просматриваются целиком
+        for row_id, coordinates, values in self._pending:
+            if row_id not in excluded:
+                found.append((np.linalg.norm(coordinates - point), row_id,
+                              coordinates, values))
+
+        radius = 0
+        max_radius = int(max(np.abs(center - self._low).max(),
+                             np.abs(center - self._high).max())) \
+            if len(self._ids) else -1
+        while radius <= max_radius:
+            keys = self._keys(self._shell(center, radius))
+            positions = np.searchsorted(self._cell_keys, keys)
+            inside = positions < len(self._cell_keys)
+            positions, keys = positions[inside], keys[inside]
+            # ячейки без точек отсутствуют в self._cell_keys
+            positions = positions[self._cell_keys[positions] == keys]
+            for start, end in zip(self._starts[positions],
+                                  self._ends[positions]):
+                distances = np.linalg.norm(self._points[start:end] - point,
+                                           axis=1)
+                for offset in np.argsort(distances)[:k + len(skipped)]:
+                    row = start + offset
+                    if self._ids[row] in skipped:
+                        continue
+                    found.append((distances[offset], self._ids[row],
+                                  self._points[row],
+                                  tuple(self._attributes[name][row]
+                                        for name in self.attributes)))
+            found.sort(key=lambda item: item[0])
+            del found[k:]
+            # точки за пределами слоя radius не ближе radius * cell_size
+            if len(found) == k and found[-1][0] <= radius * self.cell_size:
+                break
+            radius += 1
+
+        table = pd.DataFrame(
+            [[row_id, *coordinates, *values, distance]
+             for distance, row_id, coordinates, values in found],
+            columns=['id'] + AXES + self.attributes + ['distance'])
+        return table.astype({'id': 'int64'})
@@ -0,0 +1,325 @@
+"""
+Хранилище SQLite для приложения "Политические координаты"
+
+База данных хранится в файле SQLite (модуль sqlite3 стандартной
+библиотеки, сервер не нужен) в таблице responses. По столбцам gender,
+field, university и course построены индексы, поэтому группировки и
+отборы по ним выполняются самой SQLite без загрузки таблицы в pandas.
+
+В таблице meta хранится наибольший id, когда-либо записанный в responses,
+чтобы id удалённых записей не использовались повторно.
+
+save_sqlite(df, path): Полностью перезаписывает таблицу содержимым
+DataFrame.
+
+read_sqlite(path): Читает таблицу и возвращает её содержимое в виде
+DataFrame.
+
+iter_sqlite(path, chunksize): Читает таблицу частями по chunksize строк.
+
+append_sqlite(path, rows): Добавляет строки в таблицу.
+
+delete_sqlite(path, row_id): Удаляет строку с заданным id.
+
+last_id_sqlite(path): Возвращает наибольший id, когда-либо записанный в
+таблицу.
+
+pivot_sql(path, values, column, index, aggfunc): Строит сводную таблицу
+группировкой GROUP BY на стороне SQLite.
+
+qual_var_report_sql(path, qualitative_var): Создает отчет для качественной
+переменной группировкой GROUP BY на стороне SQLite.
+
+quantitive_report_sql(path, quantitative_vars): Создает отчет для
+количественных переменных агрегатными запросами SQLite.
+"""
+import contextlib
+import math
+import sqlite3
+
+import pandas as pd
+
+COLUMNS = ['id', 'gender', 'field', 'university', 'course', 'x', 'y', 'z']
+INDEXED_COLUMNS = ['gender', 'field', 'university', 'course']
+QUANTITATIVE_COLUMNS = ['x', 'y', 'z']
+
+# функции агрегации pandas и соответствующие им функции SQL
+SQL_AGGREGATES = {
+    'sum': 'SUM',
+    'mean': 'AVG',
+    'min': 'MIN',
+    'max': 'MAX',
+    'count': 'COUNT'
+}
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS responses ("
+    "id INTEGER PRIMARY KEY, gender TEXT, field TEXT, university TEXT, "
+    "course TEXT, x REAL, y REAL, z REAL)"
+] + [
+    f"CREATE INDEX IF NOT EXISTS responses_{column} "
+    f"ON responses ({column})" for column in INDEXED_COLUMNS
+] + [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)"
+]
+
+
+def _connect(path):
+    """
+    Открывает соединение с базой и создаёт таблицу и индексы, если их нет.
+
+    Аргументы:
+        path (str): Путь к файлу SQLite.
+
+    Возвращает:
+        sqlite3.Connection: Соединение с базой.
+    """
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    for statement in SCHEMA:
+        connection.execute(statement)
+    return connection
+
+
+def _remember_max_id(connection):
+    """
+    Запоминает в таблице meta наибольший id из responses, если он больше
+    запомненного ранее.
+    """
+    connection.execute(
+        "INSERT INTO meta (key, value) "
+        "SELECT 'max_id', COALESCE(MAX(id), 0) FROM responses WHERE true "
+        "ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)")
+
+
+def _records(rows):
+    """
+    Преобразует DataFrame в кортежи обычных значений Python для sqlite3.
+    """
+    columns = [rows[column].astype(object).where(rows[column].notna(),
+                                                 None).tolist()
+               for column in COLUMNS]
+    return list(zip(*columns))
+
+
+def save_sqlite(df, path):
+    """
+    Полностью перезаписывает таблицу содержимым DataFrame.
+
+    Перезапись выполняется одной транзакцией, поэтому сбой во время
+    записи не портит базу.
+
+    Аргументы:
+        df (pd.DataFrame): DataFrame, который нужно сохранить.
+        path (str): Путь к файлу SQLite.
+    """
+    with contextlib.closing(_connect(path)) as connection:
+        with connection:
+            _remember_max_id(connection)
+            connection.execute("DELETE FROM responses")
+            connection.executemany(
+                f"INSERT INTO responses ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(COLUMNS))})", _records(df))
+            _remember_max_id(connection)
+
+
+def read_sqlite(path):
+    """
+    Читает таблицу и возвращает её содержимое в виде DataFrame.
+
+    Аргументы:
+        path (str): Путь к файлу SQLite.
+
+    Возвращает:
+        pd.DataFrame: Содержимое таблицы, упорядоченное по id.
+    """
+    with contextlib.closing(_connect(path)) as connection:
+        return pd.read_sql_query(
+            f"SELECT {', '.join(COLUMNS)} FROM responses ORDER BY id",
+            connection)
+
+
+def iter_sqlite(path, chunksize):
+    """
+    Читает таблицу частями по chunksize строк.
+
+    Аргументы:
+        path (str): Путь к файлу SQLite.
+        chunksize (int): Количество строк в части.
+
+    Возвращает:
+        generator: Части таблицы (pd.DataFrame).
+    """
+    with contextlib.closing(_connect(path)) as connection:
+        yield from pd.read_sql_query(
+            f"SELECT {', '.join(COLUMNS)} FROM responses ORDER BY id",
+            connection, chunksize=chunksize)
+
+
+def append_sqlite(path, rows):
+    """
+    Добавляет строки в таблицу одной транзакцией.
+
+    Аргументы:
+        path (str): Путь к файлу SQLite.
+        rows (pd.DataFrame): Добавляемые строки.
+    """
+    with contextlib.closing(_connect(path)) as connection:
+        with connection:
+            connection.executemany(
+                f"INSERT OR REPLACE INTO responses ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(COLUMNS))})", _records(rows))
+            _remember_max_id(connection)
+
+
+def delete_sqlite(path, row_id):
+    """
+    Удаляет строку с заданным id одним запросом по первичному ключу.
+
+    Аргументы:
+        path (str): Путь к файлу SQLite.
+        row_id (int): Id удаляемой строки.
+    """
+    with contextlib.closing(_connect(path)) as connection:
+        with connection:
+            _remember_max_id(connection)
+            connection.execute("DELETE FROM responses WHERE id = ?",
+                               (int(row_id),))
+
+
+def last_id_sqlite(path):
+    """
+    Возвращает наибольший id, когда-либо записанный в таблицу, в том числе
+    id уже удалённых строк.
+
+    Аргументы:
+        path (str): Путь к файлу SQLite.
+
+    Возвращает:
+        int: Наибольший id или 0, если в таблицу ничего не записывалось.
+    """
+    with contextlib.closing(_connect(path)) as connection:
+        row = connection.execute(
+            "SELECT MAX(COALESCE((SELECT value FROM meta "
+            "WHERE key = 'max_id'), 0), "
+            "COALESCE((SELECT MAX(id) FROM responses), 0))").fetchone()
+    return int(row[0])
+
+
+def pivot_sql(path, values, column, index, aggfunc):
+    """
+    Строит сводную таблицу группировкой GROUP BY на стороне SQLite.
+
+    В pandas передаются только сгруппированные значения, а не вся таблица.
+
+    Аргументы:
+        path (str): Путь к файлу SQLite.
+        values (str): Количественный столбец для агрегации.
+        column (str): Столбец, значения которого становятся столбцами
+        сводной таблицы.
+        index (str): Столбец, значения которого становятся строками
+        сводной таблицы.
+        aggfunc (str): Функция агрегации: 'sum', 'mean', 'min', 'max'
+        или 'count'.
+
+    Возвращает:
+        pd.DataFrame: Сводная таблица или None, если функцию агрегации
+        нельзя выполнить в SQLite (например, 'median').
+    """
+    if aggfunc not in SQL_AGGREGATES or values not in QUANTITATIVE_COLUMNS \
+            or column not in COLUMNS or index not in COLUMNS:
+        return None
+    with contextlib.closing(_connect(path)) as connection:
+        grouped = pd.read_sql_query(
+            f"SELECT {index}, {column}, "
+            f"{SQL_AGGREGATES[aggfunc]}({values}) AS {values} "
+            f"FROM responses WHERE {values} IS NOT NULL "
+            f"GROUP BY {index}, {column}", connection)
+    return grouped.pivot(index=index, columns=column, values=values)
+
+
+def qual_var_report_sql(path, qualitative_var):
+    """
+    Создает отчет для качественной переменной группировкой GROUP BY на
+    стороне SQLite.
+
+    Аргументы:
+        path (str): Путь к файлу SQLite.
+        qualitative_var (str): Имя качественного столбца.
+
+    Возвращает:
+        pd.DataFrame: DataFrame со столбцами 'Значение', 'Частоты' и
+        'Процент' или пустой DataFrame, если столбца нет.
+    """
+    if qualitative_var not in COLUMNS:
+        return pd.DataFrame()
+    with contextlib.closing(_connect(path)) as connection:
+        counts = pd.read_sql_query(
+            f"SELECT {qualitative_var} AS value, COUNT(*) AS count "
+            f"FROM responses WHERE {qualitative_var} IS NOT NULL "
+            f"GROUP BY {qualitative_var} ORDER BY count DESC", connection)
+    return pd.DataFrame({
+        'Значение': counts['value'],
+        'Частоты': counts['count'],
+        'Процент': counts['count'] / counts['count'].sum() * 100
+    })
+
+
+def _percentile(connection, column, count, q):
+    """
+    Вычисляет процентиль с линейной интерполяцией, как в pandas, выбирая
+    из упорядоченного столбца только два соседних значения.
+    """
+    position = q * (count - 1)
+    lower = math.floor(position)
+    values = [row[0] for row in connection.execute(
+        f"SELECT {column} FROM responses WHERE {column} IS NOT NULL "
+        f"ORDER BY {column} LIMIT 2 OFFSET ?", (lower,))]
+    if len(values) == 1:
+        return values[0]
+    return values[0] + (values[1] - values[0]) * (position - lower)
+
+
+def quantitive_report_sql(path, quantitative_vars):
+    """
+    Создает отчет для количественных переменных агрегатными запросами
+    SQLite.
+
+    Дисперсия вычисляется вторым запросом по отклонениям от среднего, а не
+    через сумму квадратов, чтобы не терять точность при больших значениях.
+
+    Аргументы:
+        path (str): Путь к файлу SQLite.
+        quantitative_vars (list или str): Имена количественных столбцов.
+
+    Возвращает:
+        pd.DataFrame: Статистики в формате describe(). Если передано имя
+        одного столбца, возвращается pd.Series.
+    """
+    names = [quantitative_vars] if isinstance(quantitative_vars, str) \
+        else list(quantitative_vars)
+    table = {}
+    with contextlib.closing(_connect(path)) as connection:
+        for name in names:
+            if name not in QUANTITATIVE_COLUMNS:
+                raise KeyError(name)
+            count, mean, minimum, maximum = connection.execute(
+                f"SELECT COUNT({name}), AVG({name}), MIN({name}), "
+                f"MAX({name}) FROM responses").fetchone()
+            if not count:
+                table[name] = [0] + [math.nan] * 7
+                continue
+            std = math.nan
+            if count > 1:
+                deviations, = connection.execute(
+                    f"SELECT SUM(({name} - ?) * ({name} - ?)) "
+                    f"FROM responses", (mean, mean)).fetchone()
+                std = math.sqrt(deviations / (count - 1))
+            table[name] = [count, mean, std, minimum] + [
+                _percentile(connection, name, count, q)
+                for q in (0.25, 0.5, 0.75)] + [maximum]
+    table = pd.DataFrame(table, index=['count', 'mean', 'std', 'min', '25%',
+                                       '50%', '75%', 'max'], dtype='float64')
+    if isinstance(quantitative_vars, str):
+        return table[quantitative_vars]
+    return table
@@ -0,0 +1,272 @@
+"""
+Потоковые статистики для приложения "Политические координаты"
+
+Модуль позволяет строить статистические отчёты по базе данных, которая не
+помещается в память целиком. База читается частями фиксированного размера,
+а по каждой части обновляются накопители, которые можно объединять между
+собой. Объём занимаемой памяти не зависит от размера базы.
+
+Классы
+FrequencyCounter - Накопитель частот значений качественного атрибута.
+Moments - Накопитель количества, среднего, дисперсии, минимума и максимума
+(алгоритм Уэлфорда).
+QuantileSketch - Объединяемый приближённый эскиз квантилей.
+
+Функции
+qual_var_stream_report(chunks, qualitative_var): Создает отчет для
+качественной переменной по частям базы данных.
+quantitive_stream_report(chunks, quantitative_vars): Создает отчет для
+количественных переменных по частям базы данных.
+"""
+import numpy as np
+import pandas as pd
+
+
+class FrequencyCounter:
+    """
+    Накопитель частот значений качественного атрибута.
+    """
+
+    def __init__(self):
+        self.counts = pd.Series(dtype='int64')
+
+    def update(self, values):
+        """
+        Учитывает очередную часть значений.
+
+        Аргументы:
+            values (pd.Series): Значения качественного атрибута.
+        """
+        self.counts = self.counts.add(values.value_counts(), fill_value=0)
+
+    def merge(self, other):
+        """
+        Добавляет частоты другого накопителя.
+
+        Аргументы:
+            other (FrequencyCounter): Другой накопитель.
+        """
+        self.counts = self.counts.add(other.counts, fill_value=0)
+
+
+class Moments:
+    """
+    Накопитель количества, среднего, дисперсии, минимума и максимума.
+
+    Части объединяются по формуле Чана для параллельного алгоритма
+    Уэлфорда, поэтому результат не зависит от разбиения данных на части и
+    не теряет точность на больших объёмах.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        """
+        Учитывает очередную часть значений. Пропуски не учитываются.
+
+        Аргументы:
+            values (np.ndarray): Значения количественного атрибута.
+        """
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        part = Moments()
+        part.count = len(values)
+        part.mean = values.mean()
+        part.m2 = ((values - part.mean) ** 2).sum()
+        part.min = values.min()
+        part.max = values.max()
+        self.merge(part)
+
+    def merge(self, other):
+        """
+        Добавляет значения другого накопителя.
+
+        Аргументы:
+            other (Moments): Другой накопитель.
+        """
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self):
+        """
+        Выборочное стандартное отклонение (как у pandas, ddof=1).
+        """
+        if self.count < 2:
+            return np.nan
+        return np.sqrt(self.m2 / (self.count - 1))
+
+
+class QuantileSketch:
+    """
+    Объединяемый приближённый эскиз квантилей.
+
+    Значения хранятся по уровням: каждое значение уровня i представляет
+    2**i исходных значений. Когда на уровне набирается больше k значений,
+    они сортируются, и каждое второе переходит на следующий уровень. Пока
+    данных не больше k, квантили вычисляются точно, как в pandas.
+    """
+
+    def __init__(self, k=4096, seed=0):
+        """
+        Аргументы:
+            k (int): Наибольшее количество значений на одном уровне.
+            Чем больше k, тем точнее квантили.
+            seed (int): Зерно генератора случайных чисел для уплотнения.
+        """
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        """
+        Учитывает очередную часть значений. Пропуски не учитываются.
+
+        Аргументы:
+            values (np.ndarray): Значения количественного атрибута.
+        """
+        values = np.asarray(values, dtype='float64')
+        self.levels[0] = np.concatenate([self.levels[0],
+                                         values[~np.isnan(values)]])
+        self._compress()
+
+    def merge(self, other):
+        """
+        Добавляет значения другого эскиза.
+
+        Аргументы:
+            other (QuantileSketch): Другой эскиз.
+        """
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], values])
+        self._compress()
+
+    def _compress(self):
+        """
+        Переносит половину значений переполненных уровней на уровень выше.
+        """
+        level = 0
+        while level < len(self.levels):
+            values = self.levels[level]
+            if len(values) > self.k:
+                values = np.sort(values)
+                # при нечётном количестве одно значение остаётся на уровне
+                carry = values[len(values) - len(values) % 2:]
+                values = values[:len(values) - len(values) % 2]
+                promoted = values[self.rng.integers(2)::2]
+                self.levels[level] = carry
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate(
+                    [self.levels[level + 1], promoted])
+            level += 1
+
+    def quantile(self, q):
+        """
+        Возвращает квантиль уровня q.
+
+        Аргументы:
+            q (float): Уровень квантиля от 0 до 1.
+
+        Возвращает:
+            float: Значение квантиля или NaN, если данных нет.
+        """
+        if len(self.levels) == 1:
+            if not len(self.levels[0]):
+                return np.nan
+            return float(np.quantile(self.levels[0], q))
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level)
+                                  for level, items in
+                                  enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        position = np.searchsorted(cumulative, q * (cumulative[-1] - 1),
+                                   side='right')
+        return float(values[order][min(position, len(values) - 1)])
+
+
+def qual_var_stream_report(chunks, qualitative_var):
+    """
+    Создает отчет для качественной переменной по частям базы данных.
+
+    Результат совпадает с library.qual_var_text_report, но в памяти
+    одновременно находится только одна часть базы.
+
+    Параметры:
+    chunks (iterable): Части базы данных (pandas.DataFrame).
+    qualitative_var (str): Имя качественного столбца.
+
+    Возвращает:
+    table (pandas.DataFrame): DataFrame со столбцами 'Значение', 'Частоты'
+    и 'Процент'. Если столбца нет, возвращается пустой DataFrame.
+    """
+    counter = FrequencyCounter()
+    for chunk in chunks:
+        if qualitative_var not in chunk.columns:
+            return pd.DataFrame()
+        counter.update(chunk[qualitative_var])
+    counts = counter.counts[counter.counts > 0].astype('int64')
+    counts = counts.sort_values(ascending=False, kind='stable')
+    return pd.DataFrame({
+        'Значение': counts.index,
+        'Частоты': counts.values,
+        'Процент': (counts / counts.sum() * 100).values
+    })
+
+
+def quantitive_stream_report(chunks, quantitative_vars, k=4096):
+    """
+    Создает отчет для количественных переменных по частям базы данных.
+
+    Количество, среднее, отклонение, минимум и максимум считаются точно,
+    процентили - приближённо с помощью QuantileSketch (точно, пока
+    значений не больше k).
+
+    Параметры:
+    chunks (iterable): Части базы данных (pandas.DataFrame).
+    quantitative_vars (list или str): Имена количественных столбцов.
+    k (int): Точность эскиза квантилей.
+
+    Возвращает:
+    table (pandas.DataFrame): Статистики в формате describe(). Если
+    передано имя одного столбца, возвращается pandas.Series.
+    """
+    names = [quantitative_vars] if isinstance(quantitative_vars, str) \
+        else list(quantitative_vars)
+    moments = {name: Moments() for name in names}
+    sketches = {name: QuantileSketch(k) for name in names}
+    for chunk in chunks:
+        for name in names:
+            values = chunk[name].to_numpy(dtype='float64')
+            moments[name].update(values)
+            sketches[name].update(values)
+
+    table = pd.DataFrame({
+        name: [moments[name].count, moments[name].mean, moments[name].std,
+               moments[name].min, sketches[name].quantile(0.25),
+               sketches[name].quantile(0.5), sketches[name].quantile(0.75),
+               moments[name].max] if moments[name].count
+        else [0] + [np.nan] * 7
+        for name in names
+    }, index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'],
+        dtype='float64')
+    if isinstance(quantitative_vars, str):
+        return table[quantitative_vars]
+    return table
@@ -0,0 +1,209 @@
+"""
+Журнал упреждающей записи (write-ahead log) для приложения "Политические
+координаты"
+
+Новые записи сначала попадают в журнал - текстовый файл, в котором каждая
+запись хранится отдельной строкой в формате JSON. Записи, поступившие почти
+одновременно, дописываются в журнал одной группой с одним вызовом fsync
+(group commit). Позже записи из журнала переносятся в основную базу данных,
+а журнал очищается.
+
+WriteAheadLog - Класс журнала упреждающей записи.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def _to_json(value):
+    """
+    Преобразует значения numpy в обычные значения Python для json.dump.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Значение типа {type(value).__name__} нельзя "
+                    "записать в журнал")
+
+
+class WriteAheadLog:
+    """
+    Класс журнала упреждающей записи.
+
+    Записи, переданные в submit, копятся в памяти и записываются фоновым
+    потоком группами: группа записывается, когда в ней набралось
+    flush_size записей или с момента поступления первой записи прошло
+    flush_interval секунд.
+
+    Группа записывается в файл под блокировкой lock. Перенос записей в
+    базу (flush, read, запись в базу, truncate) должен выполняться под той
+    же блокировкой: тогда группа, которую фоновый поток уже взял из
+    очереди, попадает в журнал либо до чтения, либо после очистки, и не
+    теряется.
+    """
+
+    def __init__(self, path, flush_interval=0.2, flush_size=64,
+                 on_commit=None):
+        """
+        Открывает журнал.
+
+        Аргументы:
+            path (str): Путь к файлу журнала.
+            flush_interval (float): Максимальное время ожидания группы
+            в секундах.
+            flush_size (int): Максимальный размер группы.
+            on_commit (function): Функция, которая вызывается после записи
+            каждой группы с текущим числом записей в журнале.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.on_commit = on_commit
+        self._pending = []
+        self._condition = threading.Condition()
+        # повторно входимая, чтобы flush работал под удерживаемой lock
+        self.lock = threading.RLock()
+        self._writer = None
+        self._closed = False
+        self._repair_tail()
+        self._size = len(self.read())
+
+    def _repair_tail(self):
+        """
+        Завершает переводом строки недописанную при сбое последнюю запись,
+        чтобы следующая группа не склеилась с ней.
+        """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, 'rb+') as log_file:
+            log_file.seek(-1, os.SEEK_END)
+            if log_file.read(1) != b'\n':
+                log_file.write(b'\n')
+
+    def submit(self, record):
+        """
+        Ставит запись в очередь на запись в журнал.
+
+        Аргументы:
+            record (dict): Значения записи по именам столбцов.
+
+        Возвращает:
+            Future: Future, который завершается, когда запись сохранена на
+            диске.
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Журнал закрыт")
+            self._pending.append((record, future))
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run,
+                                                name='wal-writer',
+                                                daemon=True)
+                self._writer.start()
+            self._condition.notify()
+        return future
+
+    def _run(self):
+        """
+        Цикл фонового потока: собирает записи в группы и записывает их.
+        """
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.flush_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._closed:
+                        break
+                    self._condition.wait(remaining)
+                batch, self._pending = self._pending, []
+            self._commit(batch, notify=True)
+
+    def _commit(self, batch, notify):
+        """
+        Дописывает группу записей в журнал с одним вызовом fsync.
+
+        Аргументы:
+            batch (list): Пары (запись, Future).
+            notify (bool): Нужно ли вызвать on_commit после записи.
+        """
+        if not batch:
+            return
+        lines = ''.join(json.dumps(record, ensure_ascii=False,
+                                   default=_to_json) + '\n'
+                        for record, _ in batch)
+        try:
+            with self.lock:
+                with open(self.path, 'a', encoding='utf-8') as log_file:
+                    log_file.write(lines)
+                    log_file.flush()
+                    os.fsync(log_file.fileno())
+                self._size += len(batch)
+                size = self._size
+        except Exception as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for _, future in batch:
+            future.set_result(None)
+        if notify and self.on_commit is not None:
+            self.on_commit(size)
+
+    def flush(self):
+        """
+        Немедленно записывает в журнал все записи из очереди.
+
+        Группа, которую фоновый поток уже взял из очереди, может быть
+        записана позже; чтобы дождаться её, нужно удерживать lock.
+        """
+        with self._condition:
+            batch, self._pending = self._pending, []
+        self._commit(batch, notify=False)
+
+    def read(self):
+        """
+        Читает все записи журнала.
+
+        Недописанные при сбое записи пропускаются.
+
+        Возвращает:
+            list: Записи журнала (dict) в порядке записи.
+        """
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with self.lock:
+            with open(self.path, 'r', encoding='utf-8') as log_file:
+                for line in log_file:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        return records
+
+    def truncate(self):
+        """
+        Очищает журнал после переноса записей в основную базу данных.
+        """
+        with self.lock:
+            with open(self.path, 'w', encoding='utf-8') as log_file:
+                log_file.flush()
+                os.fsync(log_file.fileno())
+            self._size = 0
+
+    def close(self):
+        """
+        Записывает оставшиеся в очереди записи и останавливает фоновый
+        поток.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self.flush()
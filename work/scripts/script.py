@@ -11,6 +11,10 @@
 классы
 GUI - Класс для создания графического интерфейса приложения "Политические
 координаты"
+VirtualTable - Класс виртуальной таблицы: виджет Treeview, в котором
+создаются только видимые строки большого DataFrame.
+PlotCanvas - Класс холста графика вкладки: одна Figure, которая
+переиспользуется при каждом построении графика.
 
 методы
 create_widgets - Метод для создания виджетов на главном окне приложения
@@ -29,6 +33,21 @@ delete_update - Удаляет строку с заданным индексом
 save_settings - Сохраняет настройки, введенные пользователем.
 next_question - Переходит к следующему вопросу в тесте и обновляет результаты
 ответов.
+run_in_background - Выполняет вычисление в фоновом потоке и показывает
+результат в главном потоке.
+start_queued - Запускает задание, ждавшее окончания заменённого им
+начатого задания.
+cancel_background - Отменяет фоновые задания.
+show_plot - Строит график на холсте вкладки в фоновом потоке и
+показывает его во фрейме.
+create_qual_report, create_quant_report - Создают отчеты для качественного
+и количественного атрибутов в фоновом потоке.
+create_pivot - Создает сводную таблицу (обычную, приближённую или с
+доверительными интервалами) и отображает её в виджете Treeview.
+create_clusters - Кластеризует респондентов по координатам и показывает
+центры кластеров и их распределение по качественным атрибутам.
+wait_for_data - Дожидается фоновой загрузки базы данных и заполняет
+таблицу на вкладке "Работа с БД".
 create_report_from_dataframe - Создает отчет из данных DataFrame и отображает
 его в виджете Treeview.
 bar - Функция создает кластеризованную столбчатую диаграмму (bar plot) с
@@ -40,12 +59,18 @@ reate_boxplot - Функция создает ящиковую диаграмм
 matplotlib.pyplot.
 """
 
+import base64
 import os
 import random
 import sys
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
-from tkinter import ttk
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import matplotlib
+from matplotlib import cbook
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+from tkinter import messagebox, ttk
 import tkinter as tk
 import numpy as np
 import pandas as pd
@@ -54,12 +79,227 @@ sys.path.append(os.path.join(os.getcwd(), '..'))
 
 os.chdir(".")
 from work.library.library import *
-
-config_path = os.path.join(os.path.dirname(
-    __file__), '..', 'scripts', 'config.json')
+from work.library.binning import blend_density, category_codes, \
+    density_grid, split_by_code
+from work.library.scoring import NO_ANSWER, ScoringEngine
 
 config = read_config()
 
+# база данных загружается в фоне, см. GUI.wait_for_data
+data = None
+
+# таблицы, в которых больше строк, отображаются виртуально (VirtualTable)
+VIRTUAL_TABLE_ROWS = 500
+
+
+class VirtualTable:
+    """
+    Класс виртуальной таблицы.
+
+    В виджете Treeview создаётся столько строк, сколько в нём видно
+    (параметр height). При прокрутке строки не создаются заново, а
+    получают значения следующего окна DataFrame, которые берутся срезами
+    из массивов NumPy его столбцов. Поэтому время отображения и память Tk
+    не зависят от количества строк в DataFrame.
+    """
+
+    def __init__(self, tree, df, offset=0):
+        """
+        Аргументы:
+        - tree: ttk.Treeview - виджет, столбцы которого уже настроены.
+        - df: pandas.DataFrame - отображаемые данные.
+        - offset: int - номер первой видимой строки.
+        """
+        self.tree = tree
+        # качественные столбцы хранятся кодами категорий; код -1
+        # (пропуск) указывает на последний элемент, NaN
+        self.columns = []
+        for name in df.columns:
+            values = df[name]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories = np.append(
+                    values.cat.categories.to_numpy(dtype=object), np.nan)
+                self.columns.append((values.cat.codes.to_numpy(),
+                                     categories))
+            else:
+                self.columns.append((values.to_numpy(), None))
+        self.size = len(df)
+        self.rows = min(int(tree["height"]), self.size)
+        self.offset = 0
+
+        tree.delete(*tree.get_children())
+        for number in range(self.rows):
+            tree.insert("", "end", iid=str(number))
+
+        # полоса прокрутки ставится справа от таблицы
+        self.scrollbar = None
+        place = tree.grid_info()
+        if place:
+            self.scrollbar = ttk.Scrollbar(tree.master, orient="vertical",
+                                           command=self.yview)
+            self.scrollbar.grid(row=place["row"],
+                                column=int(place["column"]) +
+                                int(place["columnspan"]),
+                                rowspan=place["rowspan"], sticky="ns")
+
+        tree.bind("<MouseWheel>", self.on_wheel)
+        tree.bind("<Button-4>", self.on_wheel)
+        tree.bind("<Button-5>", self.on_wheel)
+        for key, step in [("<Up>", -1), ("<Down>", 1),
+                          ("<Prior>", -self.rows), ("<Next>", self.rows)]:
+            tree.bind(key, lambda event, step=step: self.scroll(step))
+        self.scroll_to(offset)
+
+    def scroll_to(self, offset):
+        """
+        Показывает окно строк, начиная со строки offset.
+        """
+        self.offset = max(0, min(int(offset), self.size - self.rows))
+        window = []
+        for values, categories in self.columns:
+            part = values[self.offset:self.offset + self.rows]
+            window.append(categories[part] if categories is not None
+                          else part)
+        for number, row in enumerate(zip(*window)):
+            self.tree.item(str(number), values=row)
+        if self.scrollbar is not None and self.size:
+            self.scrollbar.set(self.offset / self.size,
+                               (self.offset + self.rows) / self.size)
+
+    def scroll(self, step):
+        """
+        Прокручивает таблицу на step строк.
+        """
+        self.scroll_to(self.offset + step)
+        return "break"
+
+    def yview(self, *args):
+        """
+        Обрабатывает команды полосы прокрутки: ("moveto", доля) и
+        ("scroll", количество, "units" или "pages").
+        """
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * self.size)
+        elif args[0] == "scroll":
+            step = int(args[1])
+            self.scroll(step * self.rows if args[2] == "pages" else step)
+
+    def on_wheel(self, event):
+        """
+        Прокручивает таблицу колесом мыши.
+        """
+        if event.num == 4 or event.delta > 0:
+            return self.scroll(-3)
+        return self.scroll(3)
+
+    def destroy(self):
+        """
+        Отключает прокрутку и убирает полосу прокрутки, чтобы в том же
+        виджете можно было отобразить другой отчет.
+        """
+        for sequence in ["<MouseWheel>", "<Button-4>", "<Button-5>", "<Up>",
+                         "<Down>", "<Prior>", "<Next>"]:
+            self.tree.unbind(sequence)
+        if self.scrollbar is not None:
+            self.scrollbar.destroy()
+
+
+class PlotCanvas:
+    """
+    Класс холста графика вкладки.
+
+    На вкладке создаются одна Figure с одними Axes и одна метка, в которой
+    показывается изображение графика. При повторном построении графика
+    того же вида (см. signature в render) существующие объекты графика
+    получают новые данные (высоты столбцов, координаты точек и линий), а
+    не создаются заново. При смене вида графика прежние объекты удаляются
+    с Axes. Поэтому время перерисовки и занимаемая память не растут от
+    построения к построению.
+    """
+
+    def __init__(self, frame):
+        """
+        Создает холст графика во фрейме вкладки.
+
+        Аргументы:
+        - frame: tkinter.Frame - фрейм вкладки.
+        """
+        self.figure = Figure()
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.subplots()
+        # render выполняется в фоновых потоках, а Figure не потокобезопасна
+        self.lock = threading.Lock()
+        self.signature = None
+        self.artists = None
+        self.label = ttk.Label(frame, style='main.TLabel')
+        self.image = None
+
+    def render(self, prepare):
+        """
+        Рисует график и растеризует его. Выполняется в фоновом потоке.
+
+        Аргументы:
+        - prepare: function - вычисляет данные графика и возвращает пару
+        (signature, plot). signature описывает вид графика: если он
+        совпадает с предыдущим, plot(ax, artists) обновляет объекты
+        artists, созданные предыдущим построением, иначе plot(ax, None)
+        создает их на очищенных Axes. plot возвращает объекты графика.
+
+        Возвращает:
+        bytes - изображение в формате PPM, закодированное в base64.
+        """
+        signature, plot = prepare()
+        with self.lock:
+            if signature != self.signature:
+                self.release()
+                self.artists = plot(self.ax, None)
+                self.signature = signature
+            else:
+                plot(self.ax, self.artists)
+                self.ax.relim()
+                self.ax.autoscale_view()
+            self.canvas.draw()
+            pixels = np.asarray(self.canvas.buffer_rgba())
+            height, width = pixels.shape[:2]
+            # PPM не требует сжатия, в отличие от PNG
+            return base64.b64encode(b'P6 %d %d 255\n' % (width, height) +
+                                    pixels[..., :3].tobytes())
+
+    def show(self, image_data, row, column, columnspan):
+        """
+        Показывает изображение графика в метке фрейма. Выполняется в
+        главном потоке.
+
+        Аргументы:
+        - image_data: bytes - результат render.
+        - row, column, columnspan: int - место графика в сетке фрейма.
+        """
+        if self.image is None:
+            self.image = tk.PhotoImage(master=self.label, data=image_data)
+            self.label.config(image=self.image)
+        else:
+            self.image.configure(data=image_data)
+        self.label.grid(row=row, column=column, columnspan=columnspan)
+
+    def release(self):
+        """
+        Удаляет объекты графика с Axes.
+        """
+        self.ax.clear()
+        self.artists = None
+        self.signature = None
+
+    def close(self):
+        """
+        Освобождает Figure, изображение и метку холста.
+        """
+        with self.lock:
+            self.release()
+            self.figure.clear()
+        if self.image is not None:
+            self.image = None
+        self.label.destroy()
+
 
 class GUI(tk.Tk):
     """
@@ -100,6 +340,23 @@ class GUI(tk.Tk):
         self.geometry(f"{width}x{height}+{x}+{y}")
         self.resizable(width=False, height=False)
 
+        # отчеты и графики строятся в фоновых потоках (см.
+        # run_in_background); по ключу вкладки или виджета хранится
+        # последнее задание, более ранние задания считаются устаревшими
+        background = config.get("background", {})
+        self.executor = ThreadPoolExecutor(
+            max_workers=background.get("workers", 2))
+        self.poll_interval = background.get("poll_interval", 50)
+        self.background_jobs = {}
+        # начатые, но заменённые задания (их нельзя прервать) и задания,
+        # ждущие их окончания, по ключам
+        self.superseded_jobs = {}
+        self.queued_jobs = {}
+        # холсты графиков (PlotCanvas) по фреймам вкладок
+        self.plot_canvases = {}
+        # виртуальные таблицы (VirtualTable) по виджетам Treeview
+        self.virtual_tables = {}
+
         self.create_widgets()
 
     def create_widgets(self):
@@ -112,6 +369,21 @@ class GUI(tk.Tk):
         # Установка стилей
         self.set_styles()
 
+        # Строка состояния фоновых вычислений
+        status_frame = ttk.Frame(self, style='main.TFrame')
+        status_frame.pack(fill='x', side='bottom')
+        self.progress_bar = ttk.Progressbar(status_frame,
+                                            mode='indeterminate', length=200)
+        self.progress_label = ttk.Label(status_frame, text="",
+                                        style='main.TLabel')
+        self.cancel_button = ttk.Button(status_frame, text="Отменить",
+                                        command=self.cancel_background,
+                                        style='main.TButton')
+        self.cancel_button.state(['disabled'])
+        self.progress_bar.pack(side='left', padx=5, pady=2)
+        self.progress_label.pack(side='left', padx=5, pady=2)
+        self.cancel_button.pack(side='right', padx=5, pady=2)
+
         # Создание вкладок и фреймов
         notebook = ttk.Notebook(self, style='lefttab.TNotebook')
         notebook.pack(fill='y', side='left')
@@ -143,6 +415,9 @@ class GUI(tk.Tk):
         f9 = ttk.Frame(notebook, style='main.TFrame',
                        width=config[self.theme]["FRAME_WIDTH"],
                        height=config[self.theme]["FRAME_HEIGHT"])
+        f10 = ttk.Frame(notebook, style='main.TFrame',
+                        width=config[self.theme]["FRAME_WIDTH"],
+                        height=config[self.theme]["FRAME_HEIGHT"])
 
         notebook.add(f1, text='Работа с БД')
         notebook.add(f2, text='Статистический отчёт')
@@ -151,6 +426,7 @@ class GUI(tk.Tk):
         notebook.add(f5, text='Категоризированная гистограмма')
         notebook.add(f6, text='Категоризированная диаграмма Бокса-Вискера')
         notebook.add(f7, text='Категоризированная диаграмма рассеивания')
+        notebook.add(f10, text='Кластеризация респондентов')
         notebook.add(f8, text='Пройти тест!')
         notebook.add(f9, text='Настройки программы')
 
@@ -173,14 +449,8 @@ class GUI(tk.Tk):
         f1_output_text = ttk.Treeview(f1)
         f1_output_text["show"] = "headings"
 
-        self.create_report_from_dataframe(data, f1_output_text)
-
-        for column in f1_output_text["columns"]:
-            f1_output_text.column(column, width=int(
-                config[self.theme]["FRAME_WIDTH"] / 10))
-
         f1_del_label = ttk.Label(f1,
-                                 text="Выберите запись для удаления: ",
+                                 text="Введите id записи для удаления: ",
                                  style='main.TLabel')
 
         f1_record_to_del_var = tk.StringVar()
@@ -228,36 +498,42 @@ class GUI(tk.Tk):
         # чтобы скрыть пустую колонку
         f2_output_text["show"] = "headings"
 
+        # в потоковом режиме отчет строится по базе, читаемой частями
+        f2_stream_var = tk.BooleanVar(value=False)
+        f2_stream_cb = ttk.Checkbutton(f2, text="Читать базу по частям " +
+                                                "(для архивов, не " +
+                                                "помещающихся в память)",
+                                       variable=f2_stream_var,
+                                       style='main.TCheckbutton')
+
+        # в приближённом режиме отчет сразу строится по небольшой выборке
+        # и уточняется, пока не будет достигнута нужная точность
+        f2_progressive_var = tk.BooleanVar(value=False)
+        f2_progressive_cb = ttk.Checkbutton(f2, text="Приближённо, с " +
+                                                     "уточнением (для " +
+                                                     "больших баз)",
+                                            variable=f2_progressive_var,
+                                            style='main.TCheckbutton')
+        f2_status_label = ttk.Label(f2, text="", style='main.TLabel')
+
         f2_create_button1 = ttk.Button(f2, text="Создать отчет для " +
                                                 "качественного атрибута",
                                        command=lambda:
-                                       self.create_report_from_dataframe(
-                                           qual_var_text_report(
-                                               data,
-                                               f2_first_attribute.get()),
-                                           f2_output_text),
+                                       self.create_qual_report(
+                                           f2_first_attribute.get(),
+                                           f2_stream_var.get(),
+                                           f2_progressive_var.get(),
+                                           f2_output_text, f2_status_label),
                                        style='main.TButton')
 
         f2_create_button2 = ttk.Button(f2, text="Создать отчет для " +
                                                 "количественного атрибута",
                                        command=lambda:
-                                       self.create_report_from_dataframe(
-                                           pd.DataFrame({
-                                               'Статистика':
-                                                   ['Всего',
-                                                    'Среднее',
-                                                    'Отклонение',
-                                                    'Минимальное',
-                                                    '25%',
-                                                    '50%', '75%',
-                                                    'Максимальное'],
-                                               'Значение':
-                                                   quantitive_text_report(
-                                                       data,
-                                                       f2_second_attribute.get()
-                                                   )
-                                           }),
-                                           f2_output_text),
+                                       self.create_quant_report(
+                                           f2_second_attribute.get(),
+                                           f2_stream_var.get(),
+                                           f2_progressive_var.get(),
+                                           f2_output_text, f2_status_label),
                                        style='main.TButton')
 
         f2_info_label.grid(row=0, column=0, columnspan=2, padx=10, pady=10)
@@ -270,8 +546,11 @@ class GUI(tk.Tk):
 
         f2_create_button1.grid(row=3, column=0, padx=10, pady=5)
         f2_create_button2.grid(row=3, column=1, padx=10, pady=5)
+        f2_stream_cb.grid(row=4, column=0, columnspan=2, padx=10, pady=5)
+        f2_progressive_cb.grid(row=5, column=0, columnspan=2, padx=10, pady=5)
 
-        f2_output_text.grid(row=4, column=0, columnspan=2, padx=10, pady=10)
+        f2_output_text.grid(row=6, column=0, columnspan=2, padx=10, pady=10)
+        f2_status_label.grid(row=7, column=0, columnspan=2, padx=10, pady=5)
 
         # Создание виджетов для вкладки "Сводная таблица"
         f3_info_label = ttk.Label(f3, text="Это - текстовый отчет для пары" +
@@ -283,7 +562,10 @@ class GUI(tk.Tk):
 
         f3_axis_cb = ttk.Combobox(
             f3, textvariable=f3_axis_var, style='main.TCombobox')
-        f3_axis_cb['values'] = ["x", "y", "z"]
+        # несколько осей или функций агрегации дают таблицу с
+        # иерархическими столбцами, которая строится за один проход
+        f3_axes = {"x": "x", "y": "y", "z": "z", "Все оси": ["x", "y", "z"]}
+        f3_axis_cb['values'] = list(f3_axes.keys())
 
         f3_first_attribute = tk.StringVar()
         f3_first_attribute_label = ttk.Label(
@@ -313,19 +595,41 @@ class GUI(tk.Tk):
                           "Среднее значение": "mean",
                           "Минимум": "min",
                           "Максимум": "max",
-                          "Медиана": "median"}
+                          "Медиана": "median",
+                          "Количество": "count",
+                          "Стандартное отклонение": "std",
+                          "Среднее и отклонение": ["mean", "std"]}
         f3_agg_method_cb['values'] = list(f3_agg_methods.keys())
 
+        # приближённая таблица строится только для одной оси и одного
+        # метода агрегации
+        f3_progressive_var = tk.BooleanVar(value=False)
+        f3_progressive_cb = ttk.Checkbutton(f3, text="Приближённо, с " +
+                                                     "уточнением (для " +
+                                                     "больших баз)",
+                                            variable=f3_progressive_var,
+                                            style='main.TCheckbutton')
+        # доверительные интервалы ячеек вычисляются бутстрепом, тоже
+        # только для одной оси и одного метода агрегации
+        f3_bootstrap_var = tk.BooleanVar(value=False)
+        f3_bootstrap_cb = ttk.Checkbutton(f3, text="С доверительными " +
+                                                   "интервалами (бутстреп)",
+                                          variable=f3_bootstrap_var,
+                                          style='main.TCheckbutton')
+        f3_status_label = ttk.Label(f3, text="", style='main.TLabel')
+
         f3_pivot_create_button = ttk.Button(f3, text="Создать сводную таблицу",
                                             command=lambda:
-                                            self.create_report_from_dataframe(
-                                                pivot(data, f3_axis_var.get(),
-                                                      f3_first_attribute.get(),
-                                                      f3_second_attribute.get(),
-                                                      f3_agg_methods[
-                                                          f3_agg_method.get()]
-                                                      ).reset_index().round(1),
-                                                f3_pivot_output_text),
+                                            self.create_pivot(
+                                                f3_axes[f3_axis_var.get()],
+                                                f3_first_attribute.get(),
+                                                f3_second_attribute.get(),
+                                                f3_agg_methods[
+                                                    f3_agg_method.get()],
+                                                f3_progressive_var.get(),
+                                                f3_bootstrap_var.get(),
+                                                f3_pivot_output_text,
+                                                f3_status_label),
                                             style='main.TButton')
 
         f3_pivot_output_text = ttk.Treeview(f3)
@@ -345,10 +649,14 @@ class GUI(tk.Tk):
             row=3, column=1, sticky="w", padx=5, pady=5)
         f3_agg_method_label.grid(row=4, column=0, sticky="w", padx=5, pady=5)
         f3_agg_method_cb.grid(row=4, column=1, sticky="w", padx=5, pady=5)
+        f3_progressive_cb.grid(row=5, column=0, sticky="w", padx=5, pady=5)
+        f3_bootstrap_cb.grid(row=5, column=1, sticky="w", padx=5, pady=5)
         f3_pivot_create_button.grid(
-            row=5, column=0, columnspan=2, padx=5, pady=5)
+            row=6, column=0, columnspan=2, padx=5, pady=5)
+        f3_status_label.grid(row=8, column=0, columnspan=2, sticky="w",
+                             padx=5, pady=5)
         f3_pivot_output_text.grid(
-            row=6, column=0, columnspan=4, padx=5, pady=5, sticky="nsew")
+            row=7, column=0, columnspan=4, padx=5, pady=5, sticky="nsew")
 
         # Создание виджетов для вкладки "Кластеризованная столбчатая диаграмма"
         f4_label1 = ttk.Label(f4, text="Первый атрибут:", style='main.TLabel')
@@ -377,6 +685,22 @@ class GUI(tk.Tk):
                                                         columnspan=2),
                                style='main.TButton')
 
+        # связь всех пар качественных атрибутов сразу: матрица V Крамера
+        f4_association_button = ttk.Button(
+            f4, text="Связь всех пар атрибутов (V Крамера)",
+            command=lambda: self.run_in_background(
+                str(f4_association_output),
+                lambda: association_report(data).round(3),
+                lambda table: self.create_report_from_dataframe(
+                    table, f4_association_output),
+                "Связь атрибутов"),
+            style='main.TButton')
+        f4_association_output = ttk.Treeview(f4, height=4)
+
+        f4_association_button.grid(row=0, column=0, columnspan=2, padx=5,
+                                   pady=5)
+        f4_association_output.grid(row=1, column=0, columnspan=2, padx=5,
+                                   pady=5, sticky="nsew")
         f4_label1.grid(row=2, column=0, sticky="w", padx=5, pady=5)
         f4_combobox1.grid(row=2, column=1, sticky="w", padx=5, pady=5)
         f4_label2.grid(row=3, column=0, sticky="w", padx=5, pady=5)
@@ -413,8 +737,11 @@ class GUI(tk.Tk):
                                                      data,
                                                      f5_first_attribute.get(), f5_second_attribute.get(),
                                                      row=4, column=0,
-                                                     columnspan=2),
+                                                     columnspan=2,
+                                                     counts_output=f5_counts_output),
                                       style='main.TButton')
+        # частоты гистограммы по интервалам
+        f5_counts_output = ttk.Treeview(f5, height=4)
 
         f5_info_label.grid(row=0, column=0, columnspan=2)
         f5_first_attribute_label.grid(row=1, column=0)
@@ -422,6 +749,8 @@ class GUI(tk.Tk):
         f5_second_attribute_label.grid(row=2, column=0)
         f5_second_attribute_cb.grid(row=2, column=1)
         f5_create_button.grid(row=3, column=0, columnspan=2)
+        f5_counts_output.grid(row=5, column=0, columnspan=2, padx=5, pady=5,
+                              sticky="nsew")
 
         # Диаграмма Бокса-Вискера
         f6_info_label = ttk.Label(f6,
@@ -519,6 +848,46 @@ class GUI(tk.Tk):
 
         f7_create_button.grid(row=4, column=0, columnspan=2, padx=10, pady=10)
 
+        # Кластеризация респондентов
+        f10_info_label = ttk.Label(f10,
+                                   text="Инструмент разбивает респондентов" +
+                                        " на группы с близкими политическими" +
+                                        " координатами и показывает,\nкак" +
+                                        " группы распределены по полу," +
+                                        " направлениям, университетам и" +
+                                        " курсам.",
+                                   style='main.TLabel')
+        f10_clusters_label = ttk.Label(f10, text="Количество кластеров:",
+                                       style='main.TLabel')
+        f10_clusters_var = tk.StringVar()
+        f10_clusters_var.set(str(config.get("clustering", {}).get("k", 5)))
+        f10_clusters_cb = ttk.Combobox(
+            f10, textvariable=f10_clusters_var,
+            values=[str(number) for number in range(2, 11)],
+            style='main.TCombobox')
+
+        f10_create_button = ttk.Button(f10, text="Кластеризовать",
+                                       command=lambda:
+                                       self.create_clusters(
+                                           int(f10_clusters_var.get()),
+                                           f10_centroids_output,
+                                           f10_crosstab_output),
+                                       style='main.TButton')
+
+        f10_centroids_output = ttk.Treeview(f10, height=6)
+        f10_crosstab_output = ttk.Treeview(f10)
+
+        f10_info_label.grid(row=0, column=0, columnspan=2, sticky="w",
+                            padx=5, pady=5)
+        f10_clusters_label.grid(row=1, column=0, sticky="w", padx=5, pady=5)
+        f10_clusters_cb.grid(row=1, column=1, sticky="w", padx=5, pady=5)
+        f10_create_button.grid(row=2, column=0, columnspan=2, padx=5,
+                               pady=5)
+        f10_centroids_output.grid(row=3, column=0, columnspan=4, padx=5,
+                                  pady=5, sticky="nsew")
+        f10_crosstab_output.grid(row=4, column=0, columnspan=4, padx=5,
+                                 pady=5, sticky="nsew")
+
         # Пройти тест
         f8_sex_var = tk.StringVar()
         f8_sex_var.set("Выберите пол")
@@ -544,9 +913,16 @@ class GUI(tk.Tk):
                                     values=config["courses"],
                                     style='main.TCombobox')
 
-        self.questions = config["questions"]
-        random.shuffle(self.questions)
+        # вопросы показываются в случайном порядке, но config["questions"]
+        # не перемешивается: ответы хранятся в порядке банка вопросов
+        self.question_order = random.sample(range(len(config["questions"])),
+                                            len(config["questions"]))
+        self.questions = [config["questions"][number]
+                          for number in self.question_order]
         self.current_question = 0
+        self.scoring = ScoringEngine(config["questions"], config["options"])
+        self.answer_codes = np.full(len(self.questions), NO_ANSWER,
+                                    dtype='int8')
 
         f8_question_label = ttk.Label(
             f8, text=self.questions[0]["question"], style='main.TLabel')
@@ -564,9 +940,16 @@ class GUI(tk.Tk):
                                                  f8_sex_var.get(),
                                                  f8_direction_var.get(),
                                                  f8_university_var.get(),
-                                                 f8_course_var.get()),
+                                                 f8_course_var.get(),
+                                                 f8_neighbours_label,
+                                                 f8_neighbours_output),
                                              style='main.TButton')
 
+        # после прохождения теста показывается, в каких университетах и на
+        # каких направлениях учатся респонденты с похожими координатами
+        f8_neighbours_label = ttk.Label(f8, text="", style='main.TLabel')
+        f8_neighbours_output = ttk.Treeview(f8)
+
         self.new_answer = {
             'id': [],
             'gender': [],
@@ -589,6 +972,8 @@ class GUI(tk.Tk):
             option.grid(row=5 + idx, column=0, sticky="w")
         #
         f8_next_question_button.grid(row=9, column=0, sticky="w")
+        f8_neighbours_label.grid(row=10, column=0, sticky="w")
+        f8_neighbours_output.grid(row=11, column=0, sticky="w")
 
         # Настройки
         self.theme_choose = tk.StringVar()
@@ -617,6 +1002,67 @@ class GUI(tk.Tk):
 
         save_settings_button.grid(row=1, column=1, padx=5, pady=5)
 
+        # Кнопки, которым нужны данные, доступны только после загрузки базы
+        self.data_buttons = [f1_del_button, f2_create_button1,
+                             f2_create_button2, f3_pivot_create_button,
+                             f4_button, f4_association_button,
+                             f5_create_button, f6_create_button,
+                             f7_create_button, f8_next_question_button,
+                             f10_create_button]
+        for button in self.data_buttons:
+            button.state(['disabled'])
+
+        # смена выбора на вкладке отменяет её устаревшие вычисления
+        for key, comboboxes in [
+                (str(f2_output_text), [f2_first_attribute_cb,
+                                       f2_second_attribute_cb]),
+                (str(f3_pivot_output_text), [f3_axis_cb,
+                                             f3_first_attribute_cb,
+                                             f3_second_attribute_cb,
+                                             f3_agg_method_cb]),
+                (str(f4), [f4_combobox1, f4_combobox2]),
+                (str(f5), [f5_first_attribute_cb, f5_second_attribute_cb]),
+                (str(f6), [f6_first_attribute_cb, f6_second_attribute_cb]),
+                (str(f7), [f7_first_attribute_cb, f7_second_attribute_cb,
+                           f7_third_attribute_cb])]:
+            for combobox in comboboxes:
+                combobox.bind("<<ComboboxSelected>>",
+                              lambda event, key=key:
+                              self.cancel_background(key))
+        self.wait_for_data(load_data_async(), f1_output_text)
+
+    def wait_for_data(self, future, table):
+        """
+        Дожидается фоновой загрузки базы данных и заполняет таблицу на
+        вкладке "Работа с БД".
+
+        Пока данные загружаются, метод периодически перепроверяет future
+        через after, не блокируя главный цикл окна. Если загрузка
+        завершилась ошибкой, она показывается в строке состояния и в окне
+        сообщения, а кнопки работы с данными остаются недоступными.
+
+        Аргументы:
+        - future: Future - future фоновой загрузки базы данных.
+        - table: ttk.Treeview - таблица для отображения базы данных.
+        """
+        if not future.done():
+            self.after(100, self.wait_for_data, future, table)
+            return
+        global data
+        try:
+            data = future.result()
+        except Exception as error:
+            message = f"Ошибка: Загрузка базы данных: {error}"
+            self.progress_label.config(text=message)
+            messagebox.showerror("Ошибка", message, parent=self)
+            return
+        self.create_report_from_dataframe(data, table)
+        for column in table["columns"]:
+            table.column(column, width=int(
+                config[self.theme]["FRAME_WIDTH"] / 10))
+        for button in self.data_buttons:
+            button.state(['!disabled'])
+
     def set_styles(self):
         """
         Настраивает стили виджетов для приложения.
@@ -688,26 +1134,28 @@ class GUI(tk.Tk):
             background=config[self.theme]["BACKGROUND_COLOR"],
             foreground=config[self.theme]["ACCENT_COLOR"]
         )
+        style.configure(
+            'main.TCheckbutton',
+            background=config[self.theme]["BACKGROUND_COLOR"],
+            foreground=config[self.theme]["FONT_COLOR"]
+        )
 
     def delete_update(self, index, table, frame):
         """
         Удаляет строку с заданным индексом из таблицы и обновляет таблицу.
 
         Аргументы:
-        - index: str - индекс строки, которую нужно удалить.
+        - index: str - id записи, которую нужно удалить.
         - table: ttk.Treeview - таблица, из которой нужно удалить строку.
         - frame: tk.Frame - рамка, в которой расположена таблица.
         """
         global data
-        data = delete_row(data, int(index) - 1)
-        table.destroy()
-        table = ttk.Treeview(frame)
-        self.create_report_from_dataframe(data, table)
+        data = delete_row(data, int(index))
+        # таблица обновляется на месте, с той же прокруткой
+        self.create_report_from_dataframe(data, table, keep_position=True)
         for column in table["columns"]:
             table.column(column, width=int(
                 config[self.theme]["FRAME_WIDTH"] / 10))
-        table.update()
-        table.grid(row=1, column=0, columnspan=3)
 
     def save_settings(self):
         """
@@ -716,13 +1164,11 @@ class GUI(tk.Tk):
         config["db"]["path"] = self.path_db.get()
         self.theme = self.theme_choose.get()
         config["theme_now"] = self.theme
-        config_path = os.path.join(os.path.dirname(__file__), '..', 'scripts',
-                                   'config.json')
-        with open(config_path, 'w', encoding="utf-8") as config_file:
-            json.dump(config, config_file, ensure_ascii=False, indent=4)
+        save_config(config)
 
     def next_question(self, last_answer, question_label, sex, direction,
-                      university, course):
+                      university, course, neighbours_label,
+                      neighbours_output):
         """
         Переходит к следующему вопросу в тесте и обновляет результаты ответов.
 
@@ -733,32 +1179,27 @@ class GUI(tk.Tk):
         - direction: str - выбранное направление.
         - university: str - выбранный университет.
         - course: str - выбранный курс.
+        - neighbours_label: ttk.Label - метка над таблицей похожих
+        респондентов.
+        - neighbours_output: ttk.Treeview - таблица распределения похожих
+        респондентов по университетам и направлениям.
         """
+        global data
         if self.current_question < len(config["questions"]):
-            if config["questions"][self.current_question]["axis"] == "x+":
-                self.new_answer['x'] = self.new_answer['x'] + \
-                                       config["options"][last_answer]
-            elif config["questions"][self.current_question]["axis"] == "x-":
-                self.new_answer['x'] = self.new_answer['x'] - \
-                                       config["options"][last_answer]
-            elif config["questions"][self.current_question]["axis"] == "y+":
-                self.new_answer['y'] = self.new_answer['y'] + \
-                                       config["options"][last_answer]
-            elif config["questions"][self.current_question]["axis"] == "y-":
-                self.new_answer['y'] = self.new_answer['y'] - \
-                                       config["options"][last_answer]
-            elif config["questions"][self.current_question]["axis"] == "z+":
-                self.new_answer['z'] = self.new_answer['z'] + \
-                                       config["options"][last_answer]
-            elif config["questions"][self.current_question]["axis"] == "z-":
-                self.new_answer['z'] = self.new_answer['z'] - \
-                                       config["options"][last_answer]
+            # ответ запоминается кодом варианта, а координаты считаются
+            # после последнего вопроса (см. модуль scoring)
+            self.answer_codes[self.question_order[self.current_question]] = \
+                self.scoring.encode([last_answer])[0]
             self.current_question += 1
             if self.current_question < len(config["questions"]):
                 question_label.config(
-                    text=config["questions"][self.current_question]["question"]
+                    text=self.questions[self.current_question]["question"]
                 )
         elif self.current_question == len(config["questions"]):
+            x, y, z = self.scoring.score(self.answer_codes)
+            self.new_answer['x'] = float(x)
+            self.new_answer['y'] = float(y)
+            self.new_answer['z'] = float(z)
             question_label.config(
                 text="Тест пройден! " +
                      f"Ваш результат: x={self.new_answer['x']}," +
@@ -769,19 +1210,30 @@ class GUI(tk.Tk):
                 f"Ваш результат: x={self.new_answer['x']}," +
                 f" y={self.new_answer['y']}, z={self.new_answer['z']} " +
                 "Нажмите на кнопку, чтобы пройти снова!!!!!!!!!")
-            self.new_answer['x'] = [self.new_answer['x']]
-            self.new_answer['y'] = [self.new_answer['y']]
-            self.new_answer['z'] = [self.new_answer['z']]
-            self.new_answer["id"] = data.iloc[-1]['id'] + 1
+            self.new_answer["id"] = next_id(data)
             self.new_answer["gender"] = sex
             self.new_answer["field"] = direction
             self.new_answer["university"] = university
             self.new_answer["course"] = course
-            data.append(pd.DataFrame(self.new_answer), ignore_index=True)
-            save_to_file(data)
+            # запись попадает в журнал упреждающей записи, а в базу
+            # переносится позже вместе с другими
+            data = submit_row(data, self.new_answer)
+            # ответы на вопросы сохраняются, чтобы координаты можно было
+            # пересчитать при изменении осей вопросов или баллов
+            save_answers(self.new_answer["id"], self.answer_codes)
+            neighbours, table = similar_respondents(
+                (self.new_answer['x'], self.new_answer['y'],
+                 self.new_answer['z']),
+                exclude=[self.new_answer["id"]])
+            neighbours_label.config(
+                text=f"Ближайшие по координатам респонденты: "
+                     f"{len(neighbours)}")
+            self.create_report_from_dataframe(table, neighbours_output)
             self.current_question += 1
         else:
             question_label.config(text=self.questions[0]["question"])
+            neighbours_label.config(text="")
+            neighbours_output.delete(*neighbours_output.get_children())
             self.new_answer = {
                 'id': [],
                 'gender': [],
@@ -792,18 +1244,368 @@ class GUI(tk.Tk):
                 'y': 0,
                 'z': 0
             }
+            self.answer_codes = np.full(len(self.questions), NO_ANSWER,
+                                        dtype='int8')
             self.current_question = 0
 
-    def create_report_from_dataframe(self, df, f3_output):
+    def create_clusters(self, k, centroids_output, crosstab_output):
+        """
+        Кластеризует респондентов по координатам и показывает центры
+        кластеров и таблицу сопряжённости кластеров с качественными
+        атрибутами.
+
+        Аргументы:
+        - k: int - количество кластеров.
+        - centroids_output: ttk.Treeview - таблица центров кластеров.
+        - crosstab_output: ttk.Treeview - таблица сопряжённости.
+        """
+        def show(result):
+            clusters, crosstab = result
+            self.create_report_from_dataframe(clusters.round(2),
+                                              centroids_output)
+            self.create_report_from_dataframe(crosstab, crosstab_output)
+
+        self.run_in_background(str(centroids_output),
+                               lambda: cluster_respondents(data, k), show,
+                               "Кластеризация")
+
+    def run_in_background(self, key, compute, show, description):
+        """
+        Выполняет вычисление в фоновом потоке и показывает результат.
+
+        compute выполняется в пуле потоков, а show вызывается в главном
+        потоке через after, когда результат готов, поэтому окно продолжает
+        отвечать во время вычисления. Новое задание с тем же ключом
+        заменяет предыдущее: ещё не начатое задание отменяется, а начатое
+        прервать нельзя - оно выполняется до конца, но его результат не
+        показывается. Чтобы такие задания не копились в пуле, новое
+        задание ждёт окончания заменённого начатого задания с тем же
+        ключом; из ждущих заданий с одним ключом остаётся только последнее.
+
+        Аргументы:
+        - key: str - ключ задания, обычно имя виджета, в котором
+        показывается результат.
+        - compute: function - вычисление без аргументов. Не должно
+        обращаться к виджетам и переменным tkinter.
+        - show: function - показывает результат compute.
+        - description: str - описание задания для строки состояния.
+        """
+        self.cancel_background(key)
+        running = self.superseded_jobs.get(key)
+        if running is not None and not running.done():
+            self.queued_jobs[key] = (compute, show, description)
+            self.update_progress()
+            self.after(self.poll_interval, self.start_queued, key)
+            return
+        self.superseded_jobs.pop(key, None)
+        future = self.executor.submit(compute)
+        self.background_jobs[key] = (future, description)
+        self.update_progress()
+        self.after(self.poll_interval, self.wait_for_result, key, future,
+                   show)
+
+    def start_queued(self, key):
+        """
+        Запускает ждущее задание с ключом key, когда закончилось
+        заменённое им начатое задание, периодически перепроверяя это через
+        after.
+
+        Аргументы:
+        - key: str - ключ задания.
+        """
+        if key not in self.queued_jobs:
+            # задание отменено или уже запущено
+            return
+        running = self.superseded_jobs.get(key)
+        if running is not None and not running.done():
+            self.after(self.poll_interval, self.start_queued, key)
+            return
+        compute, show, description = self.queued_jobs.pop(key)
+        self.run_in_background(key, compute, show, description)
+
+    def wait_for_result(self, key, future, show):
+        """
+        Дожидается результата фонового задания, периодически перепроверяя
+        его через after, и передаёт результат в show.
+
+        Аргументы:
+        - key: str - ключ задания.
+        - future: Future - future задания.
+        - show: function - показывает результат.
+        """
+        job = self.background_jobs.get(key)
+        if job is None or job[0] is not future:
+            # задание отменено или заменено более новым
+            return
+        if not future.done():
+            self.after(self.poll_interval, self.wait_for_result, key, future,
+                       show)
+            return
+        del self.background_jobs[key]
+        self.update_progress()
+        try:
+            result = future.result()
+        except Exception as error:
+            self.progress_label.config(text=f"Ошибка: {job[1]}: {error}")
+            return
+        show(result)
+
+    def cancel_background(self, key=None):
+        """
+        Отменяет фоновое задание с ключом key или, если key равен None,
+        все фоновые задания. Уже начатые задания прервать нельзя: они
+        выполняются до конца, но их результаты не показываются.
+        """
+        keys = set(self.background_jobs) | set(self.queued_jobs) \
+            if key is None else [key]
+        for job_key in keys:
+            self.queued_jobs.pop(job_key, None)
+            job = self.background_jobs.pop(job_key, None)
+            if job is not None and not job[0].cancel():
+                self.superseded_jobs[job_key] = job[0]
+        self.update_progress()
+
+    def update_progress(self):
+        """
+        Обновляет строку состояния фоновых вычислений.
+        """
+        descriptions = [description for _, description
+                        in self.background_jobs.values()] + \
+            [job[2] for job in self.queued_jobs.values()]
+        if descriptions:
+            self.progress_bar.start(10)
+            self.progress_label.config(
+                text="Выполняется: " + ", ".join(descriptions))
+            self.cancel_button.state(['!disabled'])
+        else:
+            self.progress_bar.stop()
+            self.progress_label.config(text="")
+            self.cancel_button.state(['disabled'])
+
+    def destroy(self):
+        """
+        Отменяет фоновые задания и освобождает холсты графиков перед
+        закрытием окна.
+        """
+        self.cancel_background()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for canvas in self.plot_canvases.values():
+            canvas.close()
+        self.plot_canvases.clear()
+        super().destroy()
+
+    def create_qual_report(self, qualitative_var, stream, progressive,
+                           output, status_label):
+        """
+        Создает отчет для качественного атрибута и отображает его в
+        виджете Treeview.
+
+        Аргументы:
+        - qualitative_var: str - качественный атрибут.
+        - stream: bool - читать базу по частям.
+        - progressive: bool - строить приближённый отчет с уточнением.
+        - output: ttk.Treeview - виджет для отображения отчета.
+        - status_label: ttk.Label - метка с описанием точности отчета.
+        """
+        if progressive:
+            self.show_progressive(
+                progressive_qual_var_text_report(data, qualitative_var),
+                output, status_label,
+                lambda table, errors: table.assign(
+                    Погрешность=errors.round(2)))
+            return
+        status_label.config(text="")
+        df = None if stream else data
+        self.run_in_background(
+            str(output), lambda: qual_var_text_report(df, qualitative_var),
+            lambda table: self.create_report_from_dataframe(table, output),
+            "Отчет для качественного атрибута")
+
+    def create_quant_report(self, quantitative_var, stream, progressive,
+                            output, status_label):
+        """
+        Создает отчет для количественного атрибута и отображает его в
+        виджете Treeview.
+
+        Аргументы:
+        - quantitative_var: str - количественный атрибут.
+        - stream: bool - читать базу по частям.
+        - progressive: bool - строить приближённый отчет с уточнением.
+        - output: ttk.Treeview - виджет для отображения отчета.
+        - status_label: ttk.Label - метка с описанием точности отчета.
+        """
+        statistics = ['Всего', 'Среднее', 'Отклонение', 'Минимальное',
+                      '25%', '50%', '75%', 'Максимальное']
+        if progressive:
+            self.show_progressive(
+                progressive_quantitive_text_report(data, quantitative_var),
+                output, status_label,
+                lambda table, errors: pd.DataFrame({
+                    'Статистика': statistics,
+                    'Значение': table.values,
+                    'Погрешность': errors.map(
+                        lambda error: '' if pd.isna(error)
+                        else f"± {error:.3f}").values
+                }))
+            return
+        status_label.config(text="")
+        df = None if stream else data
+        self.run_in_background(
+            str(output),
+            lambda: pd.DataFrame({
+                'Статистика': statistics,
+                'Значение': quantitive_text_report(df, quantitative_var)
+            }),
+            lambda table: self.create_report_from_dataframe(table, output),
+            "Отчет для количественного атрибута")
+
+    def show_progressive(self, results, output, status_label, make_table):
+        """
+        Показывает уточняющиеся приближённые результаты в виджете Treeview.
+
+        Каждое следующее приближение вычисляется в отдельном фоновом
+        задании (см. run_in_background), поэтому окно продолжает отвечать,
+        пока отчет уточняется. Новый отчет в том же виджете останавливает
+        уточнение предыдущего.
+
+        Аргументы:
+        - results: generator - приближения (результат, погрешности, размер
+        выборки, размер базы), см. модуль progressive.
+        - output: ttk.Treeview - виджет Treeview для отображения отчета.
+        - status_label: ttk.Label - метка для размера выборки.
+        - make_table: function - собирает из результата и погрешностей
+        DataFrame для отображения.
+        """
+        def show(result):
+            if result is None:
+                # приближения закончились раньше всей базы - точность
+                # достигнута
+                status_label.config(text=status_label.cget("text").replace(
+                    ", уточнение...", ", точность достигнута"))
+                return
+            table, errors, sample, total = result
+            self.create_report_from_dataframe(make_table(table, errors),
+                                              output)
+            state = ", уточнение..." if sample < total \
+                else ", точный результат"
+            status_label.config(
+                text=f"Выборка: {sample} из {total} записей{state}")
+            self.show_progressive(results, output, status_label, make_table)
+
+        self.run_in_background(str(output), lambda: next(results, None),
+                               show, "Приближённый отчет")
+
+    def create_pivot(self, values, column, index, aggfunc, progressive,
+                     bootstrap, output, status_label):
+        """
+        Создает сводную таблицу и отображает её в виджете Treeview.
+
+        Приближённая таблица и таблица с доверительными интервалами
+        строятся только для одной оси и одного метода агрегации, иначе
+        строится обычная таблица.
+
+        Аргументы:
+        - values: str или list - ось или список осей.
+        - column: str - атрибут, значения которого становятся столбцами.
+        - index: str - атрибут, значения которого становятся строками.
+        - aggfunc: str или list - метод или список методов агрегации.
+        - progressive: bool - строить приближённую таблицу с уточнением.
+        - bootstrap: bool - показать доверительные интервалы ячеек.
+        - output: ttk.Treeview - виджет для отображения таблицы.
+        - status_label: ttk.Label - метка с описанием точности таблицы.
+        """
+        single = isinstance(values, str) and isinstance(aggfunc, str)
+        if progressive and single:
+            self.show_progressive(
+                progressive_pivot(data, values, column, index, aggfunc),
+                output, status_label, self.format_progressive_pivot)
+            return
+        if bootstrap and single:
+            bootstrap_config = config.get("bootstrap", {})
+            status_label.config(
+                text=f"Доверительные интервалы "
+                     f"{bootstrap_config.get('confidence', 0.95):.0%}, "
+                     f"повторений бутстрепа: "
+                     f"{bootstrap_config.get('resamples', 2000)}")
+            self.run_in_background(
+                str(output),
+                lambda: self.format_bootstrap_pivot(*bootstrap_pivot(
+                    data, values, column, index, aggfunc)),
+                lambda table: self.create_report_from_dataframe(table,
+                                                                output),
+                "Сводная таблица с доверительными интервалами")
+            return
+        status_label.config(text="")
+        self.run_in_background(
+            str(output),
+            lambda: pivot(data, values, column, index,
+                          aggfunc).reset_index().round(1),
+            lambda table: self.create_report_from_dataframe(table, output),
+            "Сводная таблица")
+
+    def format_bootstrap_pivot(self, table, low, high):
+        """
+        Собирает сводную таблицу с доверительными интервалами для
+        отображения: в каждой ячейке "значение [нижняя; верхняя граница]".
+
+        Аргументы:
+        - table: pandas.DataFrame - сводная таблица.
+        - low: pandas.DataFrame - нижние границы интервалов.
+        - high: pandas.DataFrame - верхние границы интервалов.
+
+        Возвращает:
+        pandas.DataFrame - таблица со строковыми ячейками.
+        """
+        cells = table.round(1).astype(str)
+        cells = cells.where(low.isna(),
+                            cells + " [" + low.round(1).astype(str) + "; " +
+                            high.round(1).astype(str) + "]")
+        return cells.where(table.notna(), "").reset_index()
+
+    def format_progressive_pivot(self, table, errors):
+        """
+        Собирает приближённую сводную таблицу для отображения: в каждой
+        ячейке значение и погрешность, "значение ± погрешность".
+
+        Аргументы:
+        - table: pandas.DataFrame - приближённая сводная таблица.
+        - errors: pandas.DataFrame - погрешности ячеек.
+
+        Возвращает:
+        pandas.DataFrame - таблица со строковыми ячейками.
+        """
+        cells = table.round(1).astype(str)
+        cells = cells.where(errors.isna(),
+                            cells + " ± " + errors.round(1).astype(str))
+        return cells.where(table.notna(), "").reset_index()
+
+    def create_report_from_dataframe(self, df, f3_output,
+                                     keep_position=False):
         """
         Создает отчет из данных DataFrame и отображает его в виджете Treeview.
 
+        Если в DataFrame больше VIRTUAL_TABLE_ROWS строк, таблица
+        отображается виртуально (см. VirtualTable).
+
         Аргументы:
         - df: pandas.DataFrame - исходные данные.
         - f3_output: ttk.Treeview - виджет Treeview для отображения отчета.
+        - keep_position: bool - сохранить прокрутку виртуальной таблицы,
+        например при обновлении той же таблицы после удаления записи.
         """
+        offset = 0
+        virtual_table = self.virtual_tables.pop(str(f3_output), None)
+        if virtual_table is not None:
+            offset = virtual_table.offset if keep_position else 0
+            virtual_table.destroy()
         f3_output.delete(*f3_output.get_children())
 
+        if isinstance(df.columns, pd.MultiIndex):
+            # иерархические заголовки склеиваются в один: "x / mean / 1 курс"
+            df = df.set_axis([' / '.join(str(part) for part in column
+                                         if part != '')
+                              for column in df.columns], axis=1)
+
         f3_output["columns"] = list(df.columns)
         f3_output.column("#0", width=0, minwidth=0, stretch=False)
 
@@ -811,10 +1613,47 @@ class GUI(tk.Tk):
             f3_output.column(column, width=160, minwidth=50, stretch=True)
             f3_output.heading(column, text=column, anchor='w')
 
-        for index, row in df.iterrows():
-            values = tuple(row[column] for column in df.columns)
+        if len(df) > VIRTUAL_TABLE_ROWS:
+            self.virtual_tables[str(f3_output)] = VirtualTable(f3_output, df,
+                                                               offset)
+            return
+        for values in df.itertuples(index=False, name=None):
             f3_output.insert("", "end", values=values)
 
+    def show_plot(self, frame, prepare, row, column, columnspan,
+                  description, on_show=None):
+        """
+        Строит график на холсте вкладки в фоновом потоке и показывает его
+        во фрейме.
+
+        Данные графика вычисляются, а сам график рисуется и растеризуется
+        в фоновом задании (см. run_in_background) на холсте PlotCanvas
+        фрейма, который создается при первом построении и затем
+        переиспользуется. В главном потоке готовое изображение только
+        выводится в метку холста.
+
+        Аргументы:
+        - frame: tkinter.Frame - фрейм вкладки.
+        - prepare: function - вычисляет данные графика (см.
+        PlotCanvas.render).
+        - row, column, columnspan: int - место графика в сетке фрейма.
+        - description: str - описание задания для строки состояния.
+        - on_show: function - вызывается в главном потоке после того, как
+        график показан (например, чтобы показать данные графика).
+        """
+        canvas = self.plot_canvases.get(str(frame))
+        if canvas is None:
+            canvas = PlotCanvas(frame)
+            self.plot_canvases[str(frame)] = canvas
+
+        def show(image_data):
+            canvas.show(image_data, row, column, columnspan)
+            if on_show is not None:
+                on_show()
+
+        self.run_in_background(str(frame), lambda: canvas.render(prepare),
+                               show, description)
+
     def bar(self, frame, data, x_column, y_column, row, column, columnspan):
         """
         Функция создает кластеризованную столбчатую диаграмму (bar plot) с 
@@ -843,28 +1682,38 @@ class GUI(tk.Tk):
         None. Функция отображает кластеризованную столбчатую диаграмму в 
         указанном фрейме.
         """
-        grouped_data = data.groupby(
-            [x_column, y_column]).size().reset_index(name='counts')
-
-        fig, ax = plt.subplots()
-
-        for label, df in grouped_data.groupby(y_column):
-            ax.bar(df[x_column], df['counts'], label=label)
-
-        ax.set_title('Кластеризованная столбчатая диаграмма')
-        ax.set_xlabel(x_column)
-        # Измените 'counts' на то, что вы хотите отобразить
-        ax.set_ylabel('counts')
-        ax.legend(title=y_column)
-
-        canvas = FigureCanvasTkAgg(fig, master=frame)
-        canvas.draw()
-
-        canvas.get_tk_widget().grid(row=row, column=column,
-                                    columnspan=columnspan)
+        def prepare():
+            # количества для всех пар категорий, отсутствующие пары - 0
+            counts = data.groupby([x_column, y_column], observed=True) \
+                .size().unstack(fill_value=0)
+            categories = [str(value) for value in counts.index]
+
+            def plot(ax, bars):
+                if bars is None:
+                    bars = [ax.bar(categories, counts[label].to_numpy(),
+                                   label=label)
+                            for label in counts.columns]
+                    ax.legend(title=y_column)
+                else:
+                    for container, label in zip(bars, counts.columns):
+                        for rect, height in zip(container,
+                                                counts[label].to_numpy()):
+                            rect.set_height(height)
+
+                ax.set_title('Кластеризованная столбчатая диаграмма')
+                ax.set_xlabel(x_column)
+                # Измените 'counts' на то, что вы хотите отобразить
+                ax.set_ylabel('counts')
+                return bars
+
+            return ('bar', x_column, y_column, tuple(categories),
+                    tuple(counts.columns)), plot
+
+        self.show_plot(frame, prepare, row, column, columnspan,
+                       "Столбчатая диаграмма")
 
     def plot_hist(self, frame, df, qual_attr, quant_attr, row,
-                  column, columnspan):
+                  column, columnspan, counts_output=None):
         """
         Функция создает гистограмму для пары "количественный атрибут - 
         качественный атрибут" с использованием библиотеки matplotlib.
@@ -889,42 +1738,72 @@ class GUI(tk.Tk):
         гистограмма.
         columnspan (int): Ширина гистограммы в окне tkinter (в количестве 
                                                              столбцов).
+        counts_output (ttk.Treeview): Виджет, в котором показываются
+        частоты гистограммы. Если None, частоты не показываются.
+
+        Частоты всех уровней качественного атрибута подсчитываются в общих
+        интервалах за один проход (см. histogram_table) и рисуются готовыми
+        столбцами; число интервалов - config["plots"]["histogram_bins"].
 
         Возвращает:
         None. Функция отображает гистограмму, но ничего не возвращает.
         """
-        # Получаем уникальные значения качественного атрибута
-        qual_attr_values = df[qual_attr].unique()
-
-        # Создаем список цветов для каждого уровня качественного атрибута
-        colors = plt.cm.rainbow(np.linspace(0, 1, len(qual_attr_values)))
-
-        # Создаем объект Figure и AxesSubplot
-        fig, ax = plt.subplots()
-
-        # Для каждого уровня качественного атрибута строим гистограмму
-        for i, qual_value in enumerate(qual_attr_values):
-            # Выбираем только те строки, где качественный атрибут равен текущему значению
-            data = df.loc[df[qual_attr] == qual_value, quant_attr]
-
-            # Строим гистограмму
-            ax.hist(data, bins=10, alpha=0.5,
-                    label=qual_value, color=colors[i])
-
-        # Добавляем легенду
-        ax.legend(loc='upper right')
-
-        # Устанавливаем заголовок
-        ax.set_title(f'Distribution of {quant_attr} by {qual_attr}')
-
-        # Устанавливаем метки осей
-        ax.set_xlabel(quant_attr)
-        ax.set_ylabel('Frequency')
-
-        # Отображаем гистограмму в tkinter
-        canvas = FigureCanvasTkAgg(fig, master=frame)
-        canvas.get_tk_widget().grid(row=row, column=column,
-                                    columnspan=columnspan)
+        bins = config.get("plots", {}).get("histogram_bins", 10)
+        result = {}
+
+        def prepare():
+            # Частоты всех уровней качественного атрибута в общих интервалах
+            table = histogram_table(df, qual_attr, quant_attr, bins)
+            result['table'] = table
+            qual_attr_values = list(table.columns[2:])
+            left = table['Начало'].to_numpy()
+            width = (table['Конец'] - table['Начало']).to_numpy()
+
+            def plot(ax, patches):
+                if patches is None:
+                    # Создаем список цветов для каждого уровня качественного
+                    # атрибута
+                    colors = matplotlib.colormaps['rainbow'](
+                        np.linspace(0, 1, len(qual_attr_values)))
+
+                    # Для каждого уровня качественного атрибута рисуем
+                    # столбцы гистограммы
+                    patches = [ax.bar(left, table[qual_value].to_numpy(),
+                                      width=width, align='edge', alpha=0.5,
+                                      label=qual_value, color=colors[i])
+                               for i, qual_value in enumerate(
+                                   qual_attr_values)]
+
+                    # Добавляем легенду
+                    ax.legend(loc='upper right')
+                else:
+                    # Переносим столбцы гистограмм на новые интервалы
+                    for container, qual_value in zip(patches,
+                                                     qual_attr_values):
+                        for rect, count, x, w in zip(
+                                container, table[qual_value].to_numpy(),
+                                left, width):
+                            rect.set_x(x)
+                            rect.set_width(w)
+                            rect.set_height(count)
+
+                # Устанавливаем заголовок
+                ax.set_title(f'Distribution of {quant_attr} by {qual_attr}')
+
+                # Устанавливаем метки осей
+                ax.set_xlabel(quant_attr)
+                ax.set_ylabel('Frequency')
+                return patches
+
+            return ('hist', qual_attr, tuple(qual_attr_values)), plot
+
+        def show_counts():
+            self.create_report_from_dataframe(result['table'].round(2),
+                                              counts_output)
+
+        self.show_plot(frame, prepare, row, column, columnspan,
+                       "Гистограмма",
+                       show_counts if counts_output is not None else None)
 
     def create_boxplot(self, frame, df, qual_attr, quant_attr, row,
                        column, columnspan):
@@ -939,27 +1818,46 @@ class GUI(tk.Tk):
         показывает, где находятся основные 50% значений, а отдельные точки 
         могут представлять выбросы.
         """
-        # Создаем список уникальных значений качественного атрибута
-        qual_attr_values = df[qual_attr].unique()
-
-        data = [df[df[qual_attr] == value][quant_attr]
-                for value in qual_attr_values]
-
-        # Создаем ящиковую диаграмму
-        fig, ax = plt.subplots()
-        ax.boxplot(data)
-
-        # Настраиваем оси и заголовок диаграммы
-        ax.set_xticklabels(qual_attr_values)
-        ax.set_xlabel(qual_attr)
-        ax.set_ylabel(quant_attr)
-        ax.set_title(f'Ящиковая диаграмма для {quant_attr} и {qual_attr}')
-
-        # Размещаем диаграмму в указанном фрейме tkinter
-        canvas = FigureCanvasTkAgg(fig, master=frame)
-        canvas.draw()
-        canvas.get_tk_widget().grid(row=row, column=column,
-                                    columnspan=columnspan)
+        def prepare():
+            # Создаем список уникальных значений качественного атрибута
+            qual_attr_values = df[qual_attr].unique()
+
+            data = [df.loc[df[qual_attr] == value, quant_attr].dropna()
+                    .to_numpy(dtype='float64')
+                    for value in qual_attr_values]
+
+            def plot(ax, lines):
+                if lines is None:
+                    # Создаем ящиковую диаграмму
+                    lines = ax.boxplot(data)
+                    ax.set_xticklabels(qual_attr_values)
+                else:
+                    # Переносим линии ящиков на новые статистики, абсциссы
+                    # линий не меняются (ящики стоят в точках 1, 2, ...)
+                    for i, stats in enumerate(cbook.boxplot_stats(data)):
+                        q1, q3 = stats['q1'], stats['q3']
+                        low, high = stats['whislo'], stats['whishi']
+                        lines['boxes'][i].set_ydata([q1, q1, q3, q3, q1])
+                        lines['medians'][i].set_ydata([stats['med']] * 2)
+                        lines['whiskers'][2 * i].set_ydata([q1, low])
+                        lines['whiskers'][2 * i + 1].set_ydata([q3, high])
+                        lines['caps'][2 * i].set_ydata([low, low])
+                        lines['caps'][2 * i + 1].set_ydata([high, high])
+                        lines['fliers'][i].set_data(
+                            np.full(len(stats['fliers']), i + 1.0),
+                            stats['fliers'])
+
+                # Настраиваем оси и заголовок диаграммы
+                ax.set_xlabel(qual_attr)
+                ax.set_ylabel(quant_attr)
+                ax.set_title(
+                    f'Ящиковая диаграмма для {quant_attr} и {qual_attr}')
+                return lines
+
+            return ('boxplot', qual_attr, tuple(qual_attr_values)), plot
+
+        self.show_plot(frame, prepare, row, column, columnspan,
+                       "Диаграмма Бокса-Вискера")
 
     def plot_scatter(self, frame, df, qual_attr, quant_attr1, quant_attr2,
                      row, column, columnspan):
@@ -991,31 +1889,70 @@ class GUI(tk.Tk):
         - columnspan (int): Ширина точечной диаграммы в frame (в количестве 
                                                                столбцов).
 
+        Если точек больше config["plots"]["density_threshold"], вместо
+        точек рисуется карта плотности: точки каждого уровня качественного
+        атрибута подсчитываются в ячейках общей сетки (см. модуль
+        binning), и цвет ячейки смешивается из цветов уровней. Время
+        рисования тогда не зависит от количества точек.
+
         Возвращает:
         None. Функция отображает точечную диаграмму, но ничего не возвращает.
         """
-        # Создаем список уникальных значений качественного атрибута
-        qual_attr_values = df[qual_attr].unique()
-
-        # Создаем цветовую карту для уровней качественного атрибута
-        colors = plt.cm.get_cmap('Set1', len(qual_attr_values))
-
-        # Создаем точечную диаграмму
-        fig, ax = plt.subplots()
-        for i, value in enumerate(qual_attr_values):
-            x = df[df[qual_attr] == value][quant_attr1]
-            y = df[df[qual_attr] == value][quant_attr2]
-            ax.scatter(x, y, color=colors(i), label=value)
-
-        # Настраиваем оси и заголовок диаграммы
-        ax.set_xlabel(quant_attr1)
-        ax.set_ylabel(quant_attr2)
-        ax.set_title(
-            f'Точечня диаграмма для {quant_attr1}, {quant_attr2}, {qual_attr}')
-        ax.legend()
-
-        # Размещаем диаграмму в указанном фрейме tkinter
-        canvas = FigureCanvasTkAgg(fig, master=frame)
-        canvas.draw()
-        canvas.get_tk_widget().grid(row=row, column=column,
-                                    columnspan=columnspan)
+        plots_config = config.get("plots", {})
+        threshold = plots_config.get("density_threshold", 20000)
+        bins = plots_config.get("density_bins", 200)
+
+        def prepare():
+            # Заменяем уровни качественного атрибута кодами
+            codes, qual_attr_values = category_codes(df[qual_attr])
+            points = df[[quant_attr1, quant_attr2]].to_numpy(dtype='float64')
+            density = len(points) > threshold
+
+            # Создаем цветовую карту для уровней качественного атрибута
+            colors = matplotlib.colormaps['Set1'].resampled(
+                max(len(qual_attr_values), 1))(
+                np.arange(len(qual_attr_values)))
+
+            if density:
+                grid, extent = density_grid(points, codes,
+                                            len(qual_attr_values), bins)
+                image = blend_density(grid, colors)
+            else:
+                # Координаты точек для каждого уровня качественного атрибута
+                groups = split_by_code(points, codes, len(qual_attr_values))
+
+            def plot(ax, artists):
+                if artists is None and density:
+                    artists = ax.imshow(image, extent=extent, origin='lower',
+                                        aspect='auto',
+                                        interpolation='nearest')
+                    ax.legend(handles=[
+                        Patch(color=colors[i], label=value)
+                        for i, value in enumerate(qual_attr_values)])
+                elif artists is None:
+                    # Создаем точечную диаграмму
+                    artists = [ax.scatter(xy[:, 0], xy[:, 1],
+                                          color=colors[i], label=value)
+                               for i, (value, xy) in enumerate(
+                                   zip(qual_attr_values, groups))]
+                    ax.legend()
+                elif density:
+                    artists.set_data(image)
+                    artists.set_extent(extent)
+                else:
+                    for collection, xy in zip(artists, groups):
+                        collection.set_offsets(xy)
+
+                # Настраиваем оси и заголовок диаграммы
+                ax.set_xlabel(quant_attr1)
+                ax.set_ylabel(quant_attr2)
+                ax.set_title(
+                    f'Точечня диаграмма для {quant_attr1}, {quant_attr2}, '
+                    f'{qual_attr}')
+                return artists
+
+            return ('scatter', density, qual_attr,
+                    tuple(qual_attr_values)), plot
+
+        self.show_plot(frame, prepare, row, column, columnspan,
+                       "Диаграмма рассеивания")